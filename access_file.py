@@ -1,3 +1,19 @@
+from catalog import FoodCatalog, load_catalog
+from console import ask, say
+from food_writer import append_foods
+from name_index import SECTIONS, section
+from nutrients import BY_KEY, RANGE_KEYS, ideal_nutrients, ranges_of
+from report import Report, nutrient_text, structured_advice
+from targets import ACTIVITY_MULTIPLIER, calculating_bmr, ideal_cal, normalize_profile
+
+
+# catalogs with more dishes than this are searched by name instead of being printed in full
+MENU_LIMIT = 200
+
+# number of dishes shown for a search
+SEARCH_RESULTS = 10
+
+
 def input_pos(text: str, func:str):
     """
     Asks for an input until it is in an acceptable form (positive number) and returns the converted input
@@ -8,7 +24,7 @@ def input_pos(text: str, func:str):
     """
 
     while True:
-        var = input(text)
+        var = ask(text)
 
         # converts the input into another object type
         try:
@@ -16,12 +32,12 @@ def input_pos(text: str, func:str):
 
         # checks if the input is correct format
         except ValueError:
-            print('Please enter a number.')
+            say('Please enter a number.')
             continue
 
         # checks if the input is greater than 0
         if var <= 0:
-            print('Please enter a positive number.')
+            say('Please enter a positive number.')
             continue
         else:
             return var
@@ -33,14 +49,14 @@ def user_information_and_cal() -> float:
     :return: ideal calorie to be consumed daily
     """
 
-    print('Please enter the following information about yourself.')
+    say('Please enter the following information about yourself.')
 
     # asks for the age of the user
     age = input_pos('Enter age: ', int)
 
     # confirms the input with the user when the value of age is extremely big or small
     if age > 100 or age < 10:
-        answer = input(f'You have entered {age} as your age. Is that correct? (y/n): ')
+        answer = ask(f'You have entered {age} as your age. Is that correct? (y/n): ')
 
         # asks the user for age once again if they typed something by mistake
         if answer == 'n':
@@ -48,41 +64,38 @@ def user_information_and_cal() -> float:
 
     # asks for the biological sex of the user
     while True:
-        sex = input('Enter your biological sex (Male/Female): ')
+        sex = ask('Enter your biological sex (Male/Female): ')
         sex = sex.lower()
 
         # checks if the input is in correct format
         if sex != 'male' and sex != 'female':
-            print('Enter either male or female.')
+            say('Enter either male or female.')
             continue
         else:
             break
 
     # prints the different activity levels for the user
-    print('Read below and enter a corresponding activity level:')
-    print('''1. Sedentary: little to no exercise, desk job
+    say('Read below and enter a corresponding activity level:')
+    say('''1. Sedentary: little to no exercise, desk job
 2. Lightly Active: light exercise/sports 1-3 days/week
 3. Moderately Active: moderate exercise/sports 6-7 days/week
 4. Very Active: hard exercise every day
 5. Extra Active: hard exercise 2 or more times every day''')
 
-    # dictionary containing multiplier value for each activity level
-    activity_multiplier = {'1': 1.2, '2': 1.375, '3': 1.55, '4': 1.725, '5': 1.9}
-
     # asks for the activity level of the user
     while True:
-        activity_level = input('Enter an activity level (1,2,3,4,5): ')
-        if activity_level not in list(activity_multiplier.keys()):
-            print('Activity level has to be one of the 5 values above.')
+        activity_level = ask('Enter an activity level (1,2,3,4,5): ')
+        if activity_level not in ACTIVITY_MULTIPLIER:
+            say('Activity level has to be one of the 5 values above.')
             continue
         else:
             break
 
     # asks whether the user will use the imperial or the metric system
     while True:
-        system = input('Enter 1 for imperial system (inches and pounds) and 2 for metric system (kgs and cms): ')
+        system = ask('Enter 1 for imperial system (inches and pounds) and 2 for metric system (kgs and cms): ')
         if system != '1' and system != '2':
-            print('Please enter 1 or 2 as your response.')
+            say('Please enter 1 or 2 as your response.')
             continue
         else:
             break
@@ -92,143 +105,153 @@ def user_information_and_cal() -> float:
         height = input_pos('Enter height (in cms): ', float)
         weight = input_pos('Enter weight (in kgs): ', float)
 
-        # calculates the bmr using all the inputs provides by the user
-        if sex == 'male':
-            bmr = (10 * weight) + (6.25 * height) - (5 * age) + 5
-        else:
-            bmr = (10 * weight) + (6.25 * height) - (5 * age) - 161
-
     # asks the user for weight and height in imperial system
     else:
         height = input_pos('Enter height (in inches): ', float)
         weight = input_pos('Enter weight (in pounds): ', float)
 
-        # calculates the bmr using all the inputs provides by the user
-        if sex == 'male':
-            bmr = (4.536 * weight) + (15.88 * height) - (5 * age) + 5
-        else:
-            bmr = (4.536 * weight) + (15.88 * height) - (5 * age) - 161
+    return calculating_ideal_cal(age, sex, activity_level, system, height, weight)
+
+
+def calculating_ideal_cal(age: int, sex: str, activity_level: str, system: str, height: float, weight: float) -> float:
+    """
+    Calculates the amount of calorie a user should ideally consume in a day without asking for any input
+
+    :param age: age of the user
+    :param sex: biological sex of the user (male or female)
+    :param activity_level: activity level of the user ('1' to '5')
+    :param system: '1' for imperial system (inches and pounds) and '2' for metric system (cms and kgs)
+    :param height: height of the user
+    :param weight: weight of the user
+    :return: ideal calorie to be consumed daily
+    """
+
+    # converts the answers into a profile in the metric system and calculates the bmr
+    profile = normalize_profile({'age': age, 'sex': sex, 'activity_level': activity_level, 'system': system,
+                                 'height': height, 'weight': weight})
+    bmr = calculating_bmr(profile)
 
     # raises an Assertion error if the value of bmr is less than 0
     assert bmr > 0, f'''BMR (Basal Metabolic Rate), the minimum amount of calories that you need to survive, was 
 calculated to be less than 0, which is impossible. Your input for your weight, height or age was wrong. For your 
 information, the age you entered was {age}, the weight was {weight}, and the height was {height}'''
 
-    # calculates the ideal calorie that should be consumed daily by user
-    ideal_cal = bmr * activity_multiplier[activity_level]
-    return ideal_cal
+    # calculates the ideal calorie that should be consumed daily by user, remembered for profiles seen before
+    return ideal_cal(profile)
 
 
-def calculating_ideal_nutrients(ideal_cal: float) -> dict:
+def calculating_ideal_nutrients(ideal_cal: float, catalog: FoodCatalog = None) -> dict:
     """
     Receives the ideal calorie that should be consumed in a day and returns the ideal amount of other nutrients that
     should be consumed
 
     :param ideal_cal: the ideal calorie that should be consumed by the user
+    :param catalog: catalog of the dishes, whose nutrients are the ones given a range, the shared catalog of
+                    food_nutrition.csv is used when not given
     :return: a dictionary containing ideal nutrition to be consumed daily
     """
 
-    # creates a new dictionary for ideal nutrients
-    ideal_nutrients = dict()
+    # loads the catalog that contains list of food and their nutritional values
+    if catalog is None:
+        try:
+            catalog = load_catalog()
 
-    # adds the range of each nutrient that should be ideally consumed using max and min value
-    ideal_nutrients['cal'] = ideal_cal
-    ideal_nutrients['min_carb'] = (ideal_cal * 0.45) / 4
-    ideal_nutrients['max_carb'] = (ideal_cal * 0.65) / 4
-    ideal_nutrients['min_pro'] = (ideal_cal * 0.10) / 4
-    ideal_nutrients['max_pro'] = (ideal_cal * 0.35) / 4
-    ideal_nutrients['min_fat'] = (ideal_cal * 0.20) / 9
-    ideal_nutrients['max_fat'] = (ideal_cal * 0.35) / 9
+        # returns an error output of -999 if the file does not exist
+        except FileNotFoundError:
+            say('The file food_nutrition.csv does not exist')
+            return
 
-    return ideal_nutrients
+    # the ideal calorie, and the range of each other nutrient that should be ideally consumed using max and min value
+    return ideal_nutrients(ideal_cal, catalog.nutrients)
 
 
-def display_and_receive_food():
+def display_and_receive_food(catalog: FoodCatalog = None):
     """
     Displays all the food options that are available and accepts inputs of amount of serving the user consumes for
     specific dishes in a day
 
+    :param catalog: catalog of the dishes, the shared catalog of food_nutrition.csv is used when not given
     :return: a dictionary of the dishes and its corresponding servings consumed by the user in a day
 
     """
 
-    # opens the csv file that contains list of food and their nutritional values
-    try:
-        fh = open('food_nutrition.csv', 'r')
+    # loads the catalog that contains list of food and their nutritional values
+    if catalog is None:
+        try:
+            catalog = load_catalog()
 
-    # returns an error output of -999 if the file does not exist
-    except FileNotFoundError:
-        print('The file food_nutrition.csv does not exist')
-        return -999
+        # returns an error output of -999 if the file does not exist
+        except FileNotFoundError:
+            say('The file food_nutrition.csv does not exist')
+            return -999
 
-    # a list containing all the available serial numbers of the food
-    food_labels = []
+    # a large catalog is only searched, as printing every dish would take longer than finding one
+    if len(catalog) > MENU_LIMIT:
+        say(f'''There are {len(catalog)} dishes in the Dining Center of Haverford College, too many to show them all. 
+Search for the dishes you ate by their name below.''')
 
-    print('''The following will show a list of common breakfast, lunch, and dinner dishes in the Dining Center of 
+    else:
+        say('''The following will show a list of common breakfast, lunch, and dinner dishes in the Dining Center of 
 Haverford College.''')
 
-    # skips the header of the csv file
-    header = fh.readline()
-
-    for line in fh:
-        # removes the newline from the end of the line
-        food = line[:-1].split(', ')
+        heading = None
+        for label, name in zip(catalog.labels, catalog.names):
+            # prints headers that separates the food into breakfast, lunch, dinner, and user inputted food, whenever the
+            # section of the dishes (or their venue, like dc:B1) changes
+            heading, previous = (label.rpartition(':')[0], section(label)), heading
+            if heading != previous and heading[1] is not None:
+                say('\n' + ' '.join(word.upper() for word in heading if word))
 
-        # prints headers that separates the food into breakfast, lunch, dinner, and user inputted food
-        if food[0] == 'B1':
-            print('\nBREAKFAST')
-        if food[0] == 'L1':
-            print('\nLUNCH')
-        if food[0] == 'D1':
-            print('\nDINNER')
-        if food[0] == 'U1':
-            print('\nADDITIONAL DISHES')
-
-        # the label of each food is appended to a list
-        food_labels.append(food[0])
-
-        # prints the label and the name of each food
-        print(f'{food[0]}: {food[1]}')
-
-    fh.close()
+            # prints the label and the name of each food
+            say(f'{label}: {name}')
 
     while True:
         # asks the user if they want to add any dish
-        answer = input('Is there any other dish that you would like to add? (y/n): ')
+        answer = ask('Is there any other dish that you would like to add? (y/n): ')
 
         # checks the answer of the user
         if answer.lower() != 'y':
             break
 
-        # adds a dish to the csv file and adds the label of the new dish to the list containing all lables
-        new_food = add_food()
-        food_labels.append(new_food['label'])
+        # adds a dish to the csv file and to the catalog
+        add_food(catalog)
 
     # a dictionary that contains the input food label and serving amount of the dishes consumed by the user
     consumption = {}
 
-    print('''\nEnter the label and the amount of serving that you would normally consume in a day for breakfast, lunch, 
+    say('''\nEnter the label and the amount of serving that you would normally consume in a day for breakfast, lunch, 
 and dinner (Example: B1-3, B1 being the label and 3 being the serving). After each entry, press enter to input another 
-dish. The amount of serving can be in decimals as well. When finished, simply press enter one more time.\n''')
+dish. The amount of serving can be in decimals as well. To find the label of a dish, enter ? followed by its name 
+(Example: ?pancakes). When finished, simply press enter one more time.\n''')
 
     while True:
-        consume = input('Enter label and serving: ')
+        consume = ask('Enter label and serving: ')
 
         # ends the loop is user enters nothing
         if consume == '':
             break
 
+        # shows the dishes whose name matches the search
+        if consume.startswith('?'):
+            display_search_results(consume[1:], catalog)
+            continue
+
         # splits the user input into the food label and the serving amount
         consume_list = consume.split('-')
         food_label = consume_list[0]
 
         if len(consume_list) != 2:
-            print('Only the food label and serving amount should be entered')
+            say('Only the food label and serving amount should be entered')
             continue
 
-        # checks if the entered food label is actually present in the file
-        if food_label not in food_labels:
-            print(f'The label {food_label} does not exist. Please enter an acceptable label.')
+        # checks if the entered food label is actually present in the catalog
+        if food_label not in catalog:
+            say(f'The label {food_label} does not exist. Please enter an acceptable label.')
+
+            # suggests dishes in case the user entered the name of the dish instead of its label
+            if catalog.search(food_label, 1):
+                say('Did you mean one of these dishes?')
+                display_search_results(food_label, catalog, 3)
             continue
 
         # converts the inputted food serving from string into integer
@@ -237,12 +260,12 @@ dish. The amount of serving can be in decimals as well. When finished, simply pr
 
             # checks if the serving is greater than 0
             if not serving > 0:
-                print('The value for amount of serving should be a positive integer.')
+                say('The value for amount of serving should be a positive integer.')
                 continue
 
         # checks if the value of serving is a float
         except ValueError:
-            print('The value for amount of serving should be an integer')
+            say('The value for amount of serving should be an integer')
             continue
 
         # adds the food label and serving amount into the dictionary
@@ -251,124 +274,103 @@ dish. The amount of serving can be in decimals as well. When finished, simply pr
     return consumption
 
 
-def add_food() -> dict:
-    """
-    Asks the user if they want to add any additional dish to the csv file and accepts relevant information such as
-    calories, carbohydrates, proteins, and fat content. Then appends the information into the csv file.
+def display_search_results(query: str, catalog: FoodCatalog, k: int = SEARCH_RESULTS):
     """
+    Displays the dishes whose name best matches a search, with the label of the dish in each section it is served in
 
-    # opens the csv file that contains list of food and their nutritional values
-    try:
-        fh = open('food_nutrition.csv', 'r')
-
-    # returns an error output of -999 if the file does not exist
-    except FileNotFoundError:
-        print('The file food_nutrition.csv does not exist')
-        return
+    :param query: the name, or the start of the words of the name, of a dish
+    :param catalog: catalog of the dishes
+    :param k: the largest number of dishes shown
+    """
 
-    # finds the the serial number of the last dish in the csv file
-    last_line = fh.readlines()[-1]
-    last_line_list = last_line.split(', ')
-    last_label = last_line_list[0]
+    results = catalog.search(query, k)
+    if not results:
+        say(f'No dish matches {query.strip()!r}.')
 
-    fh.close()
+    for result in results:
+        labels = ', '.join(f'{label} ({section(label)})' if section(label) else label for label in result['labels'])
+        say(f"{result['name']}: {labels}")
 
-    # creates a serial number for the new dish that the user will add
-    if last_label.startswith('D'):
-        new_label = 'U1'
-    else:
-        number = last_label[-1]
-        new_number = int(number) + 1
-        new_label = 'U' + str(new_number)
 
-    # a dictionary that will contain all the information of the new dish
-    new_food = dict()
+def add_food(catalog: FoodCatalog = None) -> dict:
+    """
+    Asks the user if they want to add any additional dish to the csv file and accepts relevant information such as
+    calories, carbohydrates, proteins, fat and every other nutrient of the catalog. Then appends the information into
+    the csv file and the catalog.
 
-    # adds the new serial number to the dict
-    new_food['label'] = new_label
+    :param catalog: catalog of the dishes, the shared catalog of food_nutrition.csv is used when not given
+    """
 
-    # adds the name of the dish
-    new_food['name'] = input('Enter the name of the dish: ')
+    # loads the catalog that contains list of food and their nutritional values
+    if catalog is None:
+        try:
+            catalog = load_catalog()
 
-    # adds the calorie content of the dish
-    new_food['cal'] = input_pos('Enter the amount of calories the dish contains per serving: ', float)
-    new_food['cal'] = str(new_food['cal'])
+        # returns an error output of -999 if the file does not exist
+        except FileNotFoundError:
+            say('The file food_nutrition.csv does not exist')
+            return
 
-    # adds the carbohydrate content of the dish
-    new_food['carb'] = input_pos('Enter the amount of carbohydrates the dish contains per serving: ', float)
-    new_food['carb'] = str(new_food['carb'])
+    # a dictionary that will contain all the information of the new dish
+    new_food = dict()
 
-    # adds the protein content of the dish
-    new_food['pro'] = input_pos('Enter the amount of proteins the dish contains per serving: ', float)
-    new_food['pro'] = str(new_food['pro'])
+    # adds the name of the dish, which cannot contain commas as it is stored in a csv file
+    while True:
+        name = ask('Enter the name of the dish: ')
+        if ',' in name or name.strip() == '':
+            say('The name of the dish should not be empty or contain commas.')
+            continue
+        else:
+            break
 
-    # adds the fat content of the dish
-    new_food['fat'] = input_pos('Enter the amount of fat the dish contains per serving: ', float)
-    new_food['fat'] = str(new_food['fat'])
+    # adds the content of each nutrient of the catalog
+    values = [input_pos(f'Enter the amount of {BY_KEY[nutrient].plural} the dish contains per serving: ', float)
+              for nutrient in catalog.nutrients]
 
-    # combines all the values of the dictionary new_food into a string
-    fh = open('food_nutrition.csv', 'a')
-    new_line = ', '.join(list(new_food.values()))
+    # appends the dish to the csv file, which also gives it the next free label
+    new_food['label'] = append_foods([(name, *values)], catalog.path)[0]
+    new_food['name'] = name.strip()
+    for nutrient, value in zip(catalog.nutrients, values):
+        new_food[nutrient] = str(value)
 
-    # the string is appended to the csv file
-    fh.write('\n' + new_line)
-    fh.close()
+    # the dish is also added to the catalog so that it does not have to be read again
+    catalog.append(new_food['label'], new_food['name'], values)
 
     return new_food
 
 
-def calculating_nutrients(consumption: dict):
+def calculating_nutrients(consumption: dict, catalog: FoodCatalog = None):
     """
     Receives a dictionary containing the food labels and serving amount of the food consumed by user and return a
     dictionary of the total nutritional values that was present in the consumed food
 
     :param consumption: dictionary containing food labels and serving amount
+    :param catalog: catalog of the dishes, the shared catalog of food_nutrition.csv is used when not given
     :return: a dictionary containing the amount of each consumed nutrition
     """
 
-    # opens the csv file that contains list of food and their nutritional values
-    try:
-        fh = open('food_nutrition.csv', 'r')
-
-    # returns an error output of -999 if the file does not exist
-    except FileNotFoundError:
-        print('The file food_nutrition.csv does not exist')
-        return
-
-    # creates a variable for each of the nutrients
-    cal = 0
-    carb = 0
-    pro = 0
-    fat = 0
-
-    # removes the header of the csv file
-    header = fh.readline()
-
-    for line in fh:
-        # removes the newline from each line
-        food = line[:-1].split(',')
-        food_label = food[0]
+    # loads the catalog that contains list of food and their nutritional values
+    if catalog is None:
+        try:
+            catalog = load_catalog()
 
-        # checks if the specific food was consumed by the user
-        if food_label in list(consumption.keys()):
+        # returns an error output of -999 if the file does not exist
+        except FileNotFoundError:
+            say('The file food_nutrition.csv does not exist')
+            return
 
-            # the nutritional values are multiplied by amount of serving and added to the total nutrient consumption
-            serving = consumption[food_label]
-            cal += float(food[2]) * serving
-            carb += float(food[3]) * serving
-            pro += float(food[4]) * serving
-            fat += float(food[5]) * serving
+    # the modules that need numpy are imported when they are first used, so that the first prompt is shown without
+    # waiting for numpy
+    from nutrient_engine import consumption_totals
 
-    fh.close()
+    # the nutritional values are multiplied by amount of serving and added up for every nutrient at once, skipping the
+    # food that is not present in the catalog
+    totals = consumption_totals(consumption, catalog)
+    if totals is None:
+        return dict.fromkeys(catalog.nutrients, 0)
 
     # creates a dictionary with all the consumed nutrients
-    current_nutrients = dict()
-    current_nutrients['cal'] = cal
-    current_nutrients['carb'] = carb
-    current_nutrients['pro'] = pro
-    current_nutrients['fat'] = fat
-
-    return current_nutrients
+    return dict(zip(catalog.nutrients, totals.tolist()))
 
 
 def comparing_range(max: float, min: float, value: float) -> float:
@@ -409,11 +411,13 @@ def comparing_nutrients(ideal_n: dict, current_n: dict) -> dict:
     # dictionary containing the value of excess/deficit nutrients
     current_status = dict()
 
-    # the difference between ideal and consumption is calculated for all the 4 nutrients
-    current_status['cal'] = current_n['cal'] - ideal_n['cal']
-    current_status['carb'] = comparing_range(ideal_n['max_carb'], ideal_n['min_carb'], current_n['carb'])
-    current_status['pro'] = comparing_range(ideal_n['max_pro'], ideal_n['min_pro'], current_n['pro'])
-    current_status['fat'] = comparing_range(ideal_n['max_fat'], ideal_n['min_fat'], current_n['fat'])
+    # the difference between ideal and consumption is calculated for every nutrient, from its range when it has one
+    for nutrient, value in current_n.items():
+        if nutrient in ideal_n:
+            current_status[nutrient] = value - ideal_n[nutrient]
+        else:
+            min_key, max_key = RANGE_KEYS[nutrient]
+            current_status[nutrient] = comparing_range(ideal_n[max_key], ideal_n[min_key], value)
 
     return current_status
 
@@ -423,179 +427,229 @@ def output_nutrients(name: str, name_value: float, value: float, value_unit: str
     Receives a series of names and values and prints out certain sentences incorporating the inputs
 
     :param name: name of the food
-    :param name_value: value of a nutrient in food
+    :param name_value: value of a nutrient in food, in total for the day when the nutrient is in excess and per serving
+    when it is in deficit
     :param value: value of current excess/deficit consumption of a nutrient
     :param value_unit: unit of the nutrient
     :param category: the type of nutrient
-    :return:
     """
 
-    # prints that too much of a nutrient is being consumed and give advice
-    if value > 0:
-        print(f"You are consuming {value} {value_unit} of {category}s more than you should.")
-        print(f"""Out of all the food that you consume daily, {name} has/have the highest {category} content with 
-{name_value} {value_unit} of {category}s per serving. You should consider reducing the consumption of {name}\n""")
+    say(nutrient_text(name, name_value, value, value_unit, category), end='')
 
-    # prints that too less of a nutrient is being consumed and give advice
-    elif value < 0:
-        print(f"You are consuming {abs(value)} {value_unit} of {category}s less than you should.")
-        print(f"""Out of all the food that you consume daily, {name} has/have the highest {category} content with 
-{name_value} {value_unit} of {category}s per serving. You should consider increasing the consumption of {name}\n""")
 
-    # prints that sufficient nutrient is being consumed
-    else:
-        print(f'Congratulations! You are consuming the right amount of {category}s!\n')
-
-
-def advice(current_s: dict, consumption: dict):
+def advice(current_s: dict, consumption: dict, catalog: FoodCatalog = None, k: int = 1, swaps: int = 0) -> Report:
     """
     Receives dictionary of excess/deficit nutrients in user's current diet and the dishes that the user consumes. Prints
-    out advices using the function output_nutrients()
+    out advices in the words of output_nutrients(), all at once
 
     :param current_s: dictionary containing excess/deficit nutrients of current diet
     :param consumption: dictionary containing the food consumed by user
+    :param catalog: catalog of the dishes, the shared catalog of food_nutrition.csv is used when not given
+    :param k: number of dishes to name for each nutrient
+    :param swaps: number of dishes suggested in place of every dish named for a nutrient in excess, none by default
+    :return: the report of the advice
     """
 
-    # opens the csv file that contains list of food and their nutritional values
-    try:
-        fh = open('food_nutrition.csv', 'r')
-
-    # returns an error output of -999 if the file does not exist
-    except FileNotFoundError:
-        print('The file food_nutrition.csv does not exist')
-        return
+    # loads the catalog that contains list of food and their nutritional values
+    if catalog is None:
+        try:
+            catalog = load_catalog()
 
-    # a dictionary that will contain food with highest nutrients out of the food consumed by user
-    max_n = {'cal_name': '', 'cal': 0, 'carb_name': '', 'carb': 0, 'pro_name': '', 'pro': 0, 'fat_name': '', 'fat': 0}
+        # returns an error output of -999 if the file does not exist
+        except FileNotFoundError:
+            say('The file food_nutrition.csv does not exist')
+            return
 
-    # skips the header of the csv file
-    header = fh.readline()
+    from contributors import advice_contributors
 
-    for line in fh:
-        # removes the newline from the end of the line
-        food = line[:-1].split(',')
+    # finds the food that adds the most of each nutrient in excess, or has the most of each nutrient in deficit
+    contributors = advice_contributors(current_s, consumption, catalog, k)
+    report = Report(status=current_s, advice=structured_advice(current_s, contributors))
 
-        # checks if a certain food was consumed by the user
-        if food[0] in list(consumption.keys()):
+    # suggests dishes to eat in place of the ones named for a nutrient in excess
+    reduced = [food for item in report.advice if item['action'] == 'reduce' for food in item['foods']]
+    if reduced and swaps > 0:
+        from substitutes import load_substitution_index
 
-            cal = float(food[2])
-            carb = float(food[3])
-            pro = float(food[4])
-            fat = float(food[5])
+        labels = list(dict.fromkeys(food['label'] for food in reduced))
+        suggestions = load_substitution_index(catalog).substitutes(labels, consumption, current_s, swaps)
+        for food in reduced:
+            food['substitutes'] = suggestions.get(food['label'], [])
 
-            # finds the food with highest calorie
-            if cal > max_n['cal']:
-                max_n['cal'] = cal
-                max_n['cal_name'] = food[1]
+    # prints out advices according to the deficit/excess state of nutrients that are consumed
+    say(report.text(), end='')
 
-            # finds the food with highest carbohydrates
-            if carb > max_n['carb']:
-                max_n['carb'] = carb
-                max_n['carb_name'] = food[1]
+    if current_s['cal'] > 0:
+        exercises(current_s['cal'])
 
-            # finds the food with highest proteins
-            if pro > max_n['pro']:
-                max_n['pro'] = pro
-                max_n['pro_name'] = food[1]
+    return report
 
-            # finds the food with highest fat
-            if fat > max_n['fat']:
-                max_n['fat'] = fat
-                max_n['fat_name'] = food[1]
 
-    fh.close()
+def join_words(parts: list) -> str:
+    """
+    :param parts: the parts of a sentence, at least one
+    :return: the parts separated by commas, with 'and' before the last one
+    """
 
-    # prints out advices according to the deficit/excess state of nutrients that are consumed
-    output_nutrients(max_n['cal_name'], max_n['cal'], current_s['cal'], 'calories', 'calorie')
-    output_nutrients(max_n['carb_name'], max_n['carb'], current_s['carb'], 'grams', 'carbohydrate')
-    output_nutrients(max_n['pro_name'], max_n['pro'], current_s['pro'], 'grams', 'protein')
-    output_nutrients(max_n['fat_name'], max_n['fat'], current_s['fat'], 'grams', 'fat')
+    return ', '.join(parts[:-1]) + ' and ' + parts[-1] if len(parts) > 1 else parts[0]
 
-    if current_s['cal'] > 0:
-        exercises(current_s['cal'])
 
-
-def exercises(cal: float):
+def log_consumption(consumption: dict, ideal_n: dict, log: 'ConsumptionLog' = None, path: str = 'consumption_log'):
     """
-    Receives the amount of excess calories and asks the user if they want advice on the exercises they can do. If yes,
-    gives the user a list of exercises and will print how long they have to do their favorite exercise for.
+    Asks the user if they want to save the food they consumed today to their consumption log. If yes, saves it and
+    prints how their daily average over the last week and month compares with the ideal nutrients
 
-    :param cal: the amount of excess calories consumed by user
+    :param consumption: dictionary containing the food consumed by user
+    :param ideal_n: dictionary containing ideal nutrition to be consumed daily
+    :param log: consumption log, the shared log of the directory is used when not given
+    :param path: directory of the shared log, which is opened once per process
     """
 
-    # ask the user if they want to learn about exercises
-    answer = input('Do you wish to learn about exercises to burn the excess calories? (y/n): ')
-    if answer.lower() == 'y':
+    # ask the user if they want to save their consumption
+    answer = ask('Do you wish to save this consumption to your log for today? (y/n): ')
+    if answer.lower() != 'y':
+        return
+
+    if log is None:
+        from consumption_log import load_log
 
-        # opens the csv file that contains list of exercises and the calories they burn
         try:
-            fh = open('exercises.csv', 'r')
+            log = load_log(path)
 
-        # returns an error output of -999 if the file does not exist
-        except FileNotFoundError:
-            print('The file exercises.csv does not exist')
+        # the log cannot be saved without the catalog or a readable log directory
+        except FileNotFoundError as error:
+            say(f'The file {error.filename or path} does not exist, the consumption was not saved')
             return
 
-        print('LIST OF EXERCISES')
+    # asks the name until it can be saved
+    while True:
+        user = ask('Enter your name to find your log later: ').strip()
+        try:
+            log.append(user, consumption)
+            break
+        except ValueError as error:
+            say(error)
 
-        # removes the header of the csv file
-        header = fh.readline()
+    # prints the daily average of each window next to the ideal nutrients
+    for window, period in (('week', 'last 7 days'), ('month', 'last 30 days')):
+        average = log.daily_average(user, window)
+        days = log.window(user, window)[1]
+        status = comparing_nutrients(ideal_n, average)
 
-        for line in fh:
-            # removes the newline from the end of the line
-            exercise = line[:-1].split(', ')
+        # the calories, then every other nutrient with the difference from its range
+        parts = [f'{average["cal"]:.0f} calories per day ({status["cal"]:+.0f} from the ideal)']
+        parts += [f'{average[nutrient]:.1f} {BY_KEY[nutrient].unit} of {BY_KEY[nutrient].plural} '
+                  f'({status[nutrient]:+.1f}{" from the ideal range" if i == 0 else ""})'
+                  for i, nutrient in enumerate(list(average)[1:])]
+        say(f'Over the {period} ({days} day(s) in your log), you consumed {join_words(parts)}.\n')
 
-            # prints the serial number and the name of the exercises
-            print(f'{exercise[0]}: {exercise[1]}')
 
-        fh.close()
+def meal_plan(ideal_n: dict, catalog: FoodCatalog = None):
+    """
+    Asks the user if they want a meal plan that fits their ideal nutrients. If yes, asks which sections the dishes can
+    be chosen from and whether half servings are allowed, and prints the servings of each dish of the plan
 
-        # asks the user their favorite exercise label and their weight
-        num_exercise = input_pos('Enter the number of your favorite exercise: ', int)
-        weight = input_pos('Enter your weight in weight in lbs: ', float)
+    :param ideal_n: dictionary containing ideal nutrition to be consumed daily
+    :param catalog: catalog of the dishes, the shared catalog of food_nutrition.csv is used when not given
+    """
 
-        # assigns the user into one of the three weight categories of 125, 155, 185
-        if abs(weight - 125) < abs(weight - 155):
-            pos = 2
-        elif abs(weight - 155) < abs(weight - 185):
-            pos = 3
-        else:
-            pos = 4
+    # ask the user if they want a meal plan
+    answer = ask('Do you wish to get a meal plan that fits your ideal nutrients? (y/n): ')
+    if answer.lower() != 'y':
+        return
 
-        # opens the csv file that contains list of exercises and the calories they burn
+    # loads the catalog that contains list of food and their nutritional values
+    if catalog is None:
         try:
-            fh = open('exercises.csv', 'r')
+            catalog = load_catalog()
 
         # returns an error output of -999 if the file does not exist
         except FileNotFoundError:
-            print('The file exercises.csv does not exist')
+            say('The file food_nutrition.csv does not exist')
             return
 
-        # removes the header of the csv file
-        header = fh.readline()
+    # asks the sections until every letter is the first letter of a section
+    while True:
+        sections = ask('Enter the sections to choose the dishes from (B for breakfast, L for lunch, D for dinner, U '
+                       'for additional dishes, Example: BLD) or press enter for every section: ').strip().upper()
+        if all(letter in SECTIONS for letter in sections):
+            break
+        say('Please enter only the letters B, L, D and U.')
+
+    half = ask('Do you wish to allow half servings? (y/n): ')
+    from meal_plan import MealPlanner
+
+    # the catalog may not have every section
+    try:
+        planner = MealPlanner(catalog, sections, 0.5 if half.lower() == 'y' else 1.0)
+    except ValueError as error:
+        say(f'No meal plan can be made: {error}.\n')
+        return
+
+    lower, upper = ranges_of(ideal_n)
+    servings, totals = planner.plan(lower, upper)
+
+    if not servings[0]:
+        say('No dish of these sections brings your day closer to the ideal amount of each nutrient.\n')
+        return
+
+    # prints the dishes of the plan with their section and servings
+    say('MEAL PLAN')
+    for label, amount in servings[0].items():
+        say(f'{label} ({section(label)}): {catalog.names[catalog.index[label]]} - {amount:g} serving(s)')
+
+    # prints the calories of the plan, then every other nutrient
+    values = totals[0].tolist()
+    parts = [f'{values[0]:.0f} calories'] + [f'{value:.1f} {BY_KEY[nutrient].unit} of {BY_KEY[nutrient].plural}'
+                                             for nutrient, value in zip(catalog.nutrients[1:], values[1:])]
+    say(f'This plan has {join_words(parts)}.\n')
 
-        # the amount of calorie their favorite exercise will burn in one hour
-        cal_burn = 0
 
-        for line in fh:
-            # removes the newline from the end of the line
-            exercise = line[:-1].split(', ')
+def exercises(cal: float, table: 'ExerciseTable' = None):
+    """
+    Receives the amount of excess calories and asks the user if they want advice on the exercises they can do. If yes,
+    gives the user a list of exercises and will print how long they have to do their favorite exercise for.
+
+    :param cal: the amount of excess calories consumed by user
+    :param table: table of the exercises, the shared table of exercises.csv is used when not given
+    """
+
+    # ask the user if they want to learn about exercises
+    answer = ask('Do you wish to learn about exercises to burn the excess calories? (y/n): ')
+    if answer.lower() == 'y':
+
+        # loads the table that contains list of exercises and the calories they burn
+        from exercise_table import load_exercise_table
+
+        if table is None:
+            try:
+                table = load_exercise_table()
+
+            # returns an error output of -999 if the file does not exist
+            except FileNotFoundError:
+                say('The file exercises.csv does not exist')
+                return
 
-            # finds the user's favorite exercise name and the calorie it burns from the list
-            if exercise[0] == str(num_exercise):
-                cal_burn = int(exercise[pos])
-                fav_exercise = exercise[1]
+        say('LIST OF EXERCISES')
 
-        fh.close()
+        # prints the serial number and the name of the exercises
+        for exercise_id, name in zip(table.ids, table.names):
+            say(f'{exercise_id}: {name}')
+
+        # asks the user their favorite exercise label and their weight
+        num_exercise = input_pos('Enter the number of your favorite exercise: ', int)
+        weight = input_pos('Enter your weight in weight in lbs: ', float)
 
         # checks if there is an exercise with the label that was given by the user
-        if cal_burn == 0:
-            print('The exercise number that you entered does not exist.')
+        if num_exercise not in table:
+            say('The exercise number that you entered does not exist.')
 
-        # calculates and prints the number of minutes the user has to perform the exercise
+        # calculates and prints the number of minutes the user has to perform the exercise, with the calories it burns
+        # interpolated between the weights of the table
         else:
-            time = 60 * (cal/cal_burn)
-            print(f'To burn your excess calories, you must do {fav_exercise} for {int(time)} minutes')
+            time = table.exercise_minutes(num_exercise, cal, weight)
+            fav_exercise = table.names[table.index[str(num_exercise)]]
+            say(f'To burn your excess calories, you must do {fav_exercise} for {int(time)} minutes')
 
 
 # display_bar_graph({'cal': 300, 'carb': -20, 'pro': 20, 'fat': 0})
@@ -0,0 +1,467 @@
+import argparse
+import csv
+import json
+import math
+import sys
+from itertools import islice
+
+import numpy as np
+
+from catalog import FoodCatalog, load_catalog
+from contributors import advice_contributors
+from exercise_table import ExerciseTable, load_exercise_table
+from meal_plan import MealPlanner
+from nutrient_engine import NutrientEngine, comparing_nutrients, ideal_ranges, to_dicts
+from nutrients import ideal_dict
+from population_stats import PopulationStats, collecting
+from report import FORMATS, Report, structured_advice, write_reports
+from report_cache import MAX_BYTES, ReportCache, report_key, table_version
+from substitutes import load_substitution_index
+from targets import KG_PER_POUND, ideal_cal_array, normalize_profile
+from venues import VenueCatalog
+
+
+# the fields of a profile record, in the order of the columns of a csv input file
+PROFILE_FIELDS = ('age', 'sex', 'activity_level', 'system', 'height', 'weight')
+
+# number of records that are scored together by the nutrient engine
+CHUNK_SIZE = 1024
+
+# number of dishes named in the advice of each nutrient
+TOP = 3
+
+
+def parse_consumption(text: str) -> dict:
+    """
+    Converts consumption written in the same form as the interactive program (Example: B1-3;L2-1.5) into a dictionary
+
+    :param text: food labels and servings separated by semicolons
+    :return: a dictionary of the food labels and serving amount
+    """
+
+    consumption = dict()
+
+    for entry in text.split(';'):
+        entry = entry.strip()
+        if entry == '':
+            continue
+
+        # splits the entry into the food label and the serving amount
+        food_label, separator, serving = entry.partition('-')
+        if not separator or food_label.strip() == '':
+            raise ValueError(f'the consumption entry {entry!r} should be a food label and a serving, like B1-3')
+        try:
+            consumption[food_label.strip()] = float(serving)
+        except ValueError:
+            raise ValueError(f'the serving of {food_label.strip()} should be a number, not {serving.strip()!r}')
+
+    return consumption
+
+
+def check_consumption(consumption, catalog: FoodCatalog = None) -> dict:
+    """
+    Checks the consumption of a record the same way display_and_receive_food() checks the entries of the user
+
+    :param consumption: dictionary of the food labels and serving amount, None for no consumption
+    :param catalog: catalog the food labels have to be in, the labels are not checked when not given
+    :return: a dictionary of the food labels and serving amount as numbers
+    """
+
+    if consumption is None:
+        return dict()
+    if not isinstance(consumption, dict):
+        raise TypeError(f'consumption should be a dictionary of food labels and servings, not {consumption!r}')
+
+    checked = dict()
+    for food_label, serving in consumption.items():
+        if catalog is not None and food_label not in catalog:
+            raise ValueError(f'the label {food_label} does not exist')
+
+        # numbers are kept as they were written, so that the advice shows the same servings
+        try:
+            amount = serving if isinstance(serving, (int, float)) and not isinstance(serving, bool) else float(serving)
+        except (TypeError, ValueError):
+            raise ValueError(f'the serving of {food_label} should be a number, not {serving!r}')
+
+        if not (math.isfinite(amount) and amount > 0):
+            raise ValueError(f'the serving of {food_label} should be a finite number greater than 0, not {serving!r}')
+        checked[food_label] = amount
+
+    return checked
+
+
+def read_records(fh, fmt: str = 'jsonl'):
+    """
+    Reads profile records one at a time from a JSON lines or csv file. Each record contains the fields of
+    PROFILE_FIELDS, an optional id and the consumption of the user
+
+    :param fh: file to read the records from
+    :param fmt: format of the file (jsonl or csv)
+    :return: a generator of dictionaries, one for each record. A line that cannot be read gives a record with only
+             an error, so that the rest of the file is still scored
+    """
+
+    if fmt == 'csv':
+        reader = csv.DictReader(fh, skipinitialspace=True)
+        for record in reader:
+            try:
+                record['consumption'] = parse_consumption(record.get('consumption') or '')
+            except ValueError as error:
+                record = {'id': record.get('id'), 'error': f'line {reader.line_num}: {error}'}
+            yield record
+    else:
+        for number, line in enumerate(fh, 1):
+            # skips empty lines
+            if line.strip() == '':
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as error:
+                record = {'id': None, 'error': f'line {number}: the record is not valid JSON ({error})'}
+            if not isinstance(record, dict):
+                record = {'id': None, 'error': f'line {number}: the record should be a JSON object'}
+            yield record
+
+
+def score_chunk(records: list, engine: NutrientEngine, top: int = TOP, table: ExerciseTable = None,
+                swaps: int = 0, planner: MealPlanner = None) -> list:
+    """
+    Calculates ideal nutrients, current nutrients, status and advice for a chunk of records, the minutes of every
+    exercise needed to burn the excess calories when an exercise table is given, and a meal plan when a planner is given
+
+    :param records: list of record dictionaries
+    :param engine: nutrient engine of the catalog
+    :param top: number of dishes named in the advice of each nutrient
+    :param table: table of the exercises
+    :param swaps: number of dishes suggested in place of every dish named for a nutrient in excess
+    :param planner: meal planner of the catalog
+    :return: list of result dictionaries in the order of the records
+    """
+
+    results = [None] * len(records)
+    valid = []
+    profiles = []
+    consumptions = []
+
+    for i, record in enumerate(records):
+        # the lines that could not be read keep their error
+        if 'error' in record:
+            results[i] = {'id': record.get('id'), 'error': record['error']}
+            continue
+
+        try:
+            profile = normalize_profile(record)
+            consumptions.append(check_consumption(record.get('consumption'), engine.catalog))
+            profiles.append(profile)
+            valid.append(i)
+
+        # invalid records produce an error instead of stopping the whole batch
+        except (KeyError, TypeError, ValueError) as error:
+            results[i] = {'id': record.get('id'), 'error': str(error) or repr(error)}
+
+    # the ideal calories of the whole chunk at once, NaN for profiles whose BMR is not positive
+    ideal_cals = ideal_cal_array(profiles)
+    for j in np.flatnonzero(np.isnan(ideal_cals)).tolist():
+        results[valid[j]] = {'id': records[valid[j]].get('id'), 'error': 'BMR was calculated to be less than 0'}
+
+    keep = ~np.isnan(ideal_cals)
+    valid = [i for i, k in zip(valid, keep.tolist()) if k]
+    ideal_cals = ideal_cals[keep]
+    pounds = [profile.weight / KG_PER_POUND for profile, k in zip(profiles, keep.tolist()) if k]
+    consumptions = [consumption for consumption, k in zip(consumptions, keep.tolist()) if k]
+
+    if len(valid) == 0:
+        return results
+
+    nutrients = engine.catalog.nutrients
+    lower, upper = ideal_ranges(ideal_cals, nutrients)
+    current = engine.calculating_nutrients(consumptions)
+    status = comparing_nutrients(lower, upper, current)
+
+    # the minutes of every exercise for every user of the chunk in one call, used only for excess calories
+    plans = table.minutes(status[:, 0], pounds).tolist() if table is not None else [None] * len(valid)
+
+    # the dishes named for a nutrient in excess, with the row of their user in the chunk
+    reduced = []
+
+    for j, (i, consumption, low, high, current_n, current_s, plan) in enumerate(zip(
+            valid, consumptions, lower.tolist(), upper.tolist(), to_dicts(current, nutrients),
+            to_dicts(status, nutrients), plans)):
+        ideal_n = ideal_dict(low, high, nutrients)
+        contributors = advice_contributors(current_s, consumption, engine.catalog, top)
+
+        results[i] = {'id': records[i].get('id'), 'ideal': ideal_n, 'current': current_n, 'status': current_s,
+                      'advice': structured_advice(current_s, contributors)}
+
+        if plan is not None and current_s['cal'] > 0:
+            results[i]['exercises'] = dict(zip(table.names, plan))
+
+        if swaps > 0:
+            reduced += [(j, food) for item in results[i]['advice'] if item['action'] == 'reduce'
+                        for food in item['foods']]
+
+    # the dishes to eat in place of the ones in excess, found for the whole chunk at once
+    if reduced:
+        add_substitutes(reduced, consumptions, status, engine, swaps)
+
+    # the meal plans of the whole chunk at once
+    if planner is not None:
+        servings, totals = planner.plan(lower, upper)
+        for i, plan, plan_n, plan_s in zip(valid, servings, to_dicts(totals, nutrients),
+                                           to_dicts(comparing_nutrients(lower, upper, totals), nutrients)):
+            results[i]['meal_plan'] = {'servings': plan, 'nutrients': plan_n, 'status': plan_s}
+
+    return results
+
+
+def add_substitutes(reduced: list, consumptions: list, status: np.ndarray, engine: NutrientEngine, swaps: int):
+    """
+    Adds the dishes closest to the nutrients that would remove the excess/deficit of the day to every dish named for a
+    nutrient in excess, under substitutes. Dishes that the user already consumes are never suggested
+
+    :param reduced: list of (user, food) tuples, with the row of the user in consumptions and status and the dictionary
+                    of the dish returned by advice_contributors()
+    :param consumptions: consumption of each user
+    :param status: excess/deficit nutrients of each user, one row per user
+    :param engine: nutrient engine of the catalog
+    :param swaps: number of dishes suggested in place of each dish
+    """
+
+    index = load_substitution_index(engine.catalog, engine.matrix)
+    rows = engine.catalog.index
+
+    # the consumed dishes of each user, excluded from its suggestions
+    consumed = dict()
+    for j, food in reduced:
+        if j not in consumed:
+            consumed[j] = {rows[label] for label in consumptions[j] if label in rows}
+
+    users = [j for j, food in reduced]
+    targets = index.swap_targets([rows[food['label']] for j, food in reduced],
+                                 [food['servings'] for j, food in reduced], status[users])
+
+    for (j, food), found in zip(reduced, index.nearest(targets, swaps, [consumed[j] for j in users])):
+        food['substitutes'] = [index.describe(row, distance) for row, distance in found]
+
+
+def score_cached(records: list, engine: NutrientEngine, cache: ReportCache, top: int = TOP, table: ExerciseTable = None,
+                 swaps: int = 0, planner: MealPlanner = None) -> list:
+    """
+    Same as score_chunk(), but the reports of the records whose profile, consumption and options were already scored
+    with the same catalog are read from a cache instead of being calculated again, and the new reports are stored in it
+
+    :param records: list of record dictionaries
+    :param engine: nutrient engine of the catalog
+    :param cache: cache of the reports
+    :param top: number of dishes named in the advice of each nutrient
+    :param table: table of the exercises
+    :param swaps: number of dishes suggested in place of every dish named for a nutrient in excess
+    :param planner: meal planner of the catalog
+    :return: list of result dictionaries in the order of the records
+    """
+
+    cache.use(engine.catalog)
+    options = {'top': top, 'exercises': table_version(table), 'substitutes': swaps,
+               'plan': [planner.sections, planner.step, planner.max_servings] if planner is not None else None}
+
+    keys = [report_key(record, options) for record in records]
+    reports = [cache.get(key) if key is not None else None for key in keys]
+
+    # only the records that are not in the cache are scored, invalid records are never stored
+    missing = [i for i, report in enumerate(reports) if report is None]
+    for i, result in zip(missing, score_chunk([records[i] for i in missing], engine, top, table, swaps, planner)):
+        reports[i] = {name: value for name, value in result.items() if name != 'id'}
+        if keys[i] is not None and 'error' not in result:
+            cache.put(keys[i], reports[i])
+
+    # the id of the record is not part of the report
+    return [{'id': record.get('id'), **report} for record, report in zip(records, reports)]
+
+
+def score_records(records, catalog: FoodCatalog, chunk_size: int = CHUNK_SIZE, top: int = TOP,
+                  table: ExerciseTable = None, swaps: int = 0, planner: MealPlanner = None,
+                  cache: ReportCache = None):
+    """
+    Scores a stream of records in chunks, so that only one chunk is held in memory at a time
+
+    :param records: iterable of record dictionaries
+    :param catalog: catalog of the dishes
+    :param chunk_size: number of records scored together
+    :param top: number of dishes named in the advice of each nutrient
+    :param table: table of the exercises, no exercise plan is added when not given
+    :param swaps: number of dishes suggested in place of every dish named for a nutrient in excess
+    :param planner: meal planner of the catalog, no meal plan is added when not given
+    :param cache: cache of the reports, every record is scored when not given
+    :return: a generator of result dictionaries in the order of the records
+    """
+
+    engine = NutrientEngine(catalog)
+    records = iter(records)
+
+    while True:
+        chunk = list(islice(records, chunk_size))
+        if len(chunk) == 0:
+            break
+        if cache is not None:
+            yield from score_cached(chunk, engine, cache, top, table, swaps, planner)
+        else:
+            yield from score_chunk(chunk, engine, top, table, swaps, planner)
+
+
+def score_venues(records, venues: VenueCatalog, chunk_size: int = CHUNK_SIZE, top: int = TOP,
+                 table: ExerciseTable = None, swaps: int = 0):
+    """
+    Scores a stream of records whose food labels are namespaced by venue (Example: dc:B1) in chunks. The records of a
+    chunk are grouped by the shards their consumption refers to, and each group is scored with the view of only those
+    shards, so the shards that no record refers to are never read. The dishes suggested in place of others also come
+    from those shards
+
+    :param records: iterable of record dictionaries
+    :param venues: catalog of the venues
+    :param chunk_size: number of records scored together
+    :param top: number of dishes named in the advice of each nutrient
+    :param table: table of the exercises, no exercise plan is added when not given
+    :param swaps: number of dishes suggested in place of every dish named for a nutrient in excess
+    :return: a generator of result dictionaries in the order of the records
+    """
+
+    records = iter(records)
+
+    while True:
+        chunk = list(islice(records, chunk_size))
+        if len(chunk) == 0:
+            break
+
+        # the rows of the chunk whose consumption refers to the same shards
+        groups = dict()
+        for i, record in enumerate(chunk):
+            consumption = record.get('consumption')
+            groups.setdefault(venues.shards_of(consumption if isinstance(consumption, dict) else ()), []).append(i)
+
+        results = [None] * len(chunk)
+        for keys, rows in groups.items():
+            for i, result in zip(rows, score_chunk([chunk[i] for i in rows], venues.engine(keys), top, table, swaps)):
+                results[i] = result
+
+        yield from results
+
+
+def main(argv: list = None) -> int:
+    """
+    Command line entry point of the batch mode. Reads records from a file or stdin and writes the results as JSON lines,
+    csv rows or text, one chunk of results at a time
+
+    :param argv: command line arguments, sys.argv is used when not given
+    :return: exit status
+    """
+
+    parser = argparse.ArgumentParser(prog='haverfit batch', description='Scores profiles and food logs without '
+                                                                        'asking for any input.')
+    parser.add_argument('input', nargs='?', default='-', help='JSON lines or csv file of records (default: stdin)')
+    parser.add_argument('-o', '--output', default='-', help='file to write the results to (default: stdout)')
+    parser.add_argument('--output-format', choices=FORMATS, default='jsonl', help='format of the results: JSON lines, '
+                                                                                 'csv rows for each nutrient or the '
+                                                                                 'text of the interactive program '
+                                                                                 '(default: jsonl)')
+    parser.add_argument('-f', '--format', choices=('jsonl', 'csv'), help='format of the input (default: from the '
+                                                                         'file extension, jsonl for stdin)')
+    parser.add_argument('--catalog', default='food_nutrition.csv', help='csv file of the dishes')
+    parser.add_argument('--manifest', help='manifest of the venues, whose shards are read instead of the catalog and '
+                                           'only when a food label of the records (Example: dc:B1) refers to them')
+    parser.add_argument('--exercises', default='exercises.csv', help='csv file of the exercises, used for the '
+                                                                     'exercise plan of excess calories')
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help='number of records scored together')
+    parser.add_argument('-k', '--top', type=int, default=TOP, help='number of dishes named in the advice of each '
+                                                                   'nutrient')
+    parser.add_argument('-s', '--substitutes', type=int, default=0, help='number of dishes suggested in place of '
+                                                                           'every dish named for a nutrient in excess '
+                                                                           '(default: 0)')
+    parser.add_argument('-p', '--plan', action='store_true', help='add a meal plan that fits the ideal nutrients')
+    parser.add_argument('--plan-sections', help='first letters of the sections the dishes of the meal plan are chosen '
+                                                'from (Example: BLD, default: every section)')
+    parser.add_argument('--half-servings', action='store_true', help='allow half servings in the meal plan')
+    parser.add_argument('--stats', help='file to write the population statistics of the results to, as partial '
+                                        'statistics that population_stats.py --merge summarizes')
+    parser.add_argument('--cache', help='directory of the cache of the reports, so that the same profile and '
+                                        'consumption are only scored once per catalog')
+    parser.add_argument('--cache-size', type=int, default=MAX_BYTES >> 20, help='largest size of the cache in MB '
+                                                                                 f'(default: {MAX_BYTES >> 20})')
+    parser.add_argument('-w', '--workers', type=int, default=1, help='number of worker processes (default: 1, 0 for '
+                                                                     'one per cpu)')
+    args = parser.parse_args(argv)
+
+    fmt = args.format or ('csv' if args.input.endswith('.csv') else 'jsonl')
+
+    # the views of the venues change with the shards of each record, unlike the single catalog that the meal planner,
+    # the cache and the worker processes are built on
+    if args.manifest and (args.plan or args.cache or args.workers != 1):
+        parser.error('--manifest cannot be used with --plan, --cache or --workers')
+
+    try:
+        venues = VenueCatalog(args.manifest) if args.manifest else None
+        catalog = load_catalog(args.catalog) if venues is None else None
+    except FileNotFoundError as error:
+        print(f'The file {error.filename} does not exist', file=sys.stderr)
+        return 1
+    except ValueError as error:
+        print(error, file=sys.stderr)
+        return 1
+
+    # the results have no exercise plan when the exercises file does not exist
+    try:
+        table = load_exercise_table(args.exercises)
+    except FileNotFoundError:
+        print(f'The file {args.exercises} does not exist, no exercise plan will be given', file=sys.stderr)
+        table = None
+
+    try:
+        planner = MealPlanner(catalog, args.plan_sections, 0.5 if args.half_servings else 1.0) if args.plan else None
+    except ValueError as error:
+        print(error, file=sys.stderr)
+        return 1
+
+    fh_in = sys.stdin if args.input == '-' else open(args.input, 'r', newline='')
+    fh_out = sys.stdout if args.output == '-' else open(args.output, 'w')
+
+    # scores the records in this process or across a pool of worker processes
+    cache = ReportCache(args.cache, args.cache_size << 20) if args.cache else None
+    if venues is not None:
+        results = score_venues(read_records(fh_in, fmt), venues, args.chunk_size, args.top, table, args.substitutes)
+    elif args.workers == 1:
+        results = score_records(read_records(fh_in, fmt), catalog, args.chunk_size, args.top, table,
+                                args.substitutes, planner, cache)
+    else:
+        from parallel import score_parallel
+        results = score_parallel(read_records(fh_in, fmt), catalog, args.workers or None, args.chunk_size,
+                                 args.top, table, args.substitutes, planner, cache)
+
+    # the population statistics are collected while the results are written
+    stats = PopulationStats() if args.stats else None
+    if stats is not None:
+        results = collecting(results, stats, args.chunk_size)
+
+    # each chunk of results is written at once
+    try:
+        results = iter(results)
+        header = True
+        while True:
+            chunk = [Report.from_dict(result) for result in islice(results, args.chunk_size)]
+            if not chunk:
+                break
+            write_reports(fh_out, chunk, args.output_format, header)
+            header = False
+    finally:
+        if fh_in is not sys.stdin:
+            fh_in.close()
+        if fh_out is not sys.stdout:
+            fh_out.close()
+
+    if stats is not None:
+        with open(args.stats, 'w') as fh:
+            json.dump(stats.as_dict(), fh)
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,369 @@
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import access_file as a
+import catalog
+import catalog_file
+import exercise_table
+from batch import score_records
+from catalog import FoodCatalog, load_catalog
+from console import ScriptedConsole, using
+from exercise_table import load_exercise_table
+from nutrient_engine import NutrientEngine, comparing_nutrients, ideal_ranges
+from targets import ideal_targets
+
+
+# file that keeps the results of every run, one JSON line per benchmark
+HISTORY = 'benchmark_history.jsonl'
+
+# default catalog sizes, 1000000 can be added on the command line
+SIZES = (100, 10000)
+
+# number of users of the synthetic cohort and dishes each of them logs in a day
+USERS = 1000
+ITEMS = 30
+
+# sections of the synthetic catalog, like breakfast, lunch and dinner in food_nutrition.csv
+SECTIONS = ('B', 'L', 'D')
+
+# the subcommands whose startup is timed, with arguments that make them stop right after starting and whether they need
+# numpy. Kiosks and cron jobs start them thousands of times a day, so they should only import what they use
+STARTUP = (('help', ['--help'], False), ('interactive', ['interactive', '--help'], False),
+           ('compile', ['compile-catalog', 'food.csv'], False), ('batch', ['batch', '--help'], True))
+
+
+def generate_food_csv(path: str, rows: int, seed: int = 0):
+    """
+    Writes a synthetic catalog in the format of food_nutrition.csv
+
+    :param path: path of the csv file to write
+    :param rows: number of dishes
+    :param seed: seed of the random values
+    """
+
+    rng = random.Random(seed)
+
+    # the number of dishes written so far in each section
+    numbers = dict.fromkeys(SECTIONS, 0)
+
+    with open(path, 'w') as fh:
+        fh.write('Serial Number, Food, calories, carbohydrates, protein, fat')
+        for i in range(rows):
+            section = SECTIONS[i * len(SECTIONS) // rows]
+            numbers[section] += 1
+            fh.write(f'\n{section}{numbers[section]}, Dish {i}, {rng.randint(20, 900)}, {rng.randint(0, 100)}, '
+                     f'{rng.randint(0, 60)}, {rng.randint(0, 50)}')
+
+
+def generate_exercises_csv(path: str, rows: int, seed: int = 0):
+    """
+    Writes a synthetic table in the format of exercises.csv
+
+    :param path: path of the csv file to write
+    :param rows: number of exercises
+    :param seed: seed of the random values
+    """
+
+    rng = random.Random(seed)
+
+    with open(path, 'w') as fh:
+        fh.write('Serial Number, Activity, 125, 155, 185')
+        for i in range(1, rows + 1):
+            burn = rng.randint(150, 750)
+            fh.write(f'\n{i}, Exercise {i}, {burn}, {round(burn * 1.2)}, {round(burn * 1.4)}')
+
+
+def generate_cohort(labels: list, users: int = USERS, items: int = ITEMS, seed: int = 0):
+    """
+    Generates synthetic batch records, one profile and one day of consumption for each user
+
+    :param labels: food labels of the catalog
+    :param users: number of users
+    :param items: number of dishes logged by each user
+    :param seed: seed of the random values
+    :return: a generator of record dictionaries
+    """
+
+    rng = random.Random(seed)
+
+    for i in range(users):
+        yield {'id': i, 'age': rng.randint(17, 30), 'sex': rng.choice(('male', 'female')),
+               'activity_level': rng.randint(1, 5), 'system': 2, 'height': rng.uniform(150, 195),
+               'weight': rng.uniform(45, 110),
+               'consumption': {label: rng.choice((0.5, 1, 1.5, 2)) for label in rng.sample(labels, min(items,
+                                                                                                       len(labels)))}}
+
+
+def _clear_caches():
+    """
+    Forgets the catalogs and exercise tables that were already loaded, so that loading is timed from the start
+    """
+
+    catalog._catalogs.clear()
+    exercise_table._tables.clear()
+
+
+def timed(func, repeat: int) -> list:
+    """
+    Runs a function several times and measures each run
+
+    :param func: function without arguments
+    :param repeat: number of runs
+    :return: the duration of each run in seconds
+    """
+
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        durations.append(time.perf_counter() - start)
+
+    return durations
+
+
+def run_benchmarks(size: int, workdir: str, repeat: int = 3, users: int = USERS) -> list:
+    """
+    Times every stage of the pipeline on a synthetic catalog of the given size
+
+    :param size: number of dishes (and exercises) of the synthetic catalog
+    :param workdir: directory for the synthetic files
+    :param repeat: number of runs of each benchmark
+    :param users: number of users of the synthetic cohort
+    :return: a list of (benchmark name, items per run, durations) tuples
+    """
+
+    food_path = os.path.join(workdir, f'food_{size}.csv')
+    exercises_path = os.path.join(workdir, f'exercises_{size}.csv')
+    generate_food_csv(food_path, size)
+    generate_exercises_csv(exercises_path, size)
+
+    results = []
+
+    # loading: reading the csv file, compiling it, and mapping the compiled catalog
+    results.append(('load_csv', size, timed(lambda: FoodCatalog(food_path), repeat)))
+    results.append(('compile_catalog', size, timed(lambda: catalog_file.compile_catalog(food_path), repeat)))
+
+    def load_compiled():
+        _clear_caches()
+        load_catalog(food_path)
+
+    results.append(('load_compiled', size, timed(load_compiled, repeat)))
+
+    foods = load_catalog(food_path)
+    records = list(generate_cohort(foods.labels, users))
+    consumptions = [record['consumption'] for record in records]
+    ideals = [ideal_targets(record, foods.nutrients) for record in records]
+
+    # nutrient totals, one user at a time and for the whole cohort at once
+    results.append(('calculating_nutrients', users, timed(
+        lambda: [a.calculating_nutrients(consumption, foods) for consumption in consumptions], repeat)))
+
+    engine = NutrientEngine(foods)
+    results.append(('engine_nutrients', users, timed(lambda: engine.calculating_nutrients(consumptions), repeat)))
+
+    # excess/deficit nutrients, one user at a time and for the whole cohort at once
+    currents = [a.calculating_nutrients(consumption, foods) for consumption in consumptions]
+    results.append(('comparing_nutrients', users, timed(
+        lambda: [a.comparing_nutrients(ideal, current) for ideal, current in zip(ideals, currents)], repeat)))
+
+    lower, upper = ideal_ranges([ideal['cal'] for ideal in ideals], foods.nutrients)
+    totals = engine.calculating_nutrients(consumptions)
+    results.append(('engine_comparing', users, timed(lambda: comparing_nutrients(lower, upper, totals), repeat)))
+
+    # advice without excess calories, so that no exercise prompt is shown
+    statuses = [a.comparing_nutrients(ideal, current) for ideal, current in zip(ideals, currents)]
+    for status in statuses:
+        status['cal'] = min(status['cal'], 0)
+
+    def advice():
+        with using(ScriptedConsole([], keep_output=False)):
+            for status, consumption in zip(statuses, consumptions):
+                a.advice(status, consumption, foods)
+
+    foods.rank('cal')
+    results.append(('advice', users, timed(advice, repeat)))
+
+    # adding one dish to a copy of the catalog
+    copy_path = os.path.join(workdir, f'food_{size}_copy.csv')
+    shutil.copyfile(food_path, copy_path)
+    copy = FoodCatalog(copy_path)
+
+    def add_food():
+        with using(ScriptedConsole(['Benchmark dish', '100', '10', '5', '2'], keep_output=False)):
+            a.add_food(copy)
+
+    results.append(('add_food', 1, timed(add_food, repeat)))
+
+    # choosing an exercise and calculating its minutes
+    table = load_exercise_table(exercises_path)
+
+    def exercises():
+        with using(ScriptedConsole(['y', '1', '150'], keep_output=False)):
+            a.exercises(300, table)
+
+    results.append(('exercises', 1, timed(exercises, repeat)))
+    results.append(('exercise_minutes', users, timed(lambda: table.minutes([300] * users, [150] * users), repeat)))
+
+    # the whole batch pipeline, without the exercise plan whose size grows with the exercise table
+    results.append(('batch', users, timed(lambda: list(score_records(records, foods)), repeat)))
+
+    _clear_caches()
+    return results
+
+
+def startup_benchmarks(workdir: str, repeat: int = 3) -> tuple:
+    """
+    Times the startup of the subcommands of python -m haverfit in new processes, and checks that the subcommands that
+    do not need numpy do not import it
+
+    :param workdir: directory for the synthetic files
+    :param repeat: number of runs of each benchmark
+    :return: a tuple of a list of (benchmark name, items per run, durations) tuples and the list of the subcommands
+             that imported numpy although they should not
+    """
+
+    food_path = os.path.join(workdir, 'food_startup.csv')
+    generate_food_csv(food_path, SIZES[0])
+
+    # runs a subcommand and reports on stderr whether numpy was imported, even when the subcommand exits
+    code = ('import sys\nfrom haverfit import main\ntry:\n    main(sys.argv[1:])\nexcept SystemExit:\n    pass\n'
+            'sys.stderr.write(str("numpy" in sys.modules))')
+    root = os.path.dirname(os.path.abspath(__file__))
+
+    results = []
+    imported = []
+    for name, args, numpy in STARTUP:
+        args = [food_path if arg == 'food.csv' else arg for arg in args]
+        durations = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            process = subprocess.run([sys.executable, '-c', code, *args], cwd=root, capture_output=True, text=True)
+            durations.append(time.perf_counter() - start)
+
+        results.append((f'startup_{name}', 1, durations))
+        if not numpy and process.stderr.endswith('True'):
+            imported.append(name)
+
+    return results, imported
+
+
+def current_commit() -> str:
+    """
+    Returns the git commit of the working tree, so that results can be compared between commits
+
+    :return: the commit hash, or None outside of a git repository
+    """
+
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def read_history(path: str = HISTORY) -> list:
+    """
+    Reads the results of earlier runs
+
+    :param path: path of the history file
+    :return: list of result dictionaries
+    """
+
+    try:
+        with open(path, 'r') as fh:
+            return [json.loads(line) for line in fh if line.strip()]
+    except FileNotFoundError:
+        return []
+
+
+def compare(current: list, history: list):
+    """
+    Prints how much faster or slower each benchmark is than the last run of another commit
+
+    :param current: results of this run
+    :param history: results of earlier runs
+    """
+
+    commit = current[0]['commit'] if current else None
+    previous = dict()
+
+    # the latest result of each benchmark and size from a different commit
+    for result in history:
+        if result['commit'] != commit:
+            previous[(result['benchmark'], result['size'])] = result
+
+    for result in current:
+        before = previous.get((result['benchmark'], result['size']))
+        if before is not None:
+            change = result['best'] / before['best'] - 1
+            print(f"{result['benchmark']:>22} {result['size']:>8}: {change:+.1%} against {before['commit']}")
+
+
+def main(argv: list = None) -> int:
+    """
+    Command line entry point of the benchmarks. Prints each result and appends it to the history file
+
+    :param argv: command line arguments, sys.argv is used when not given
+    :return: exit status
+    """
+
+    parser = argparse.ArgumentParser(prog='haverfit benchmark', description='Times each stage of the Haverfit pipeline '
+                                                                            'on synthetic data.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES, help='catalog sizes (default: 100 10000)')
+    parser.add_argument('--users', type=int, default=USERS, help='users of the synthetic cohort')
+    parser.add_argument('--repeat', type=int, default=3, help='runs of each benchmark, the best one is kept')
+    parser.add_argument('--history', default=HISTORY, help='JSON lines file the results are appended to')
+    parser.add_argument('--compare', action='store_true', help='compare with the last run of another commit')
+    parser.add_argument('--max-startup', type=float, metavar='SECONDS', help='fail when a subcommand takes longer to '
+                                                                             'start than this')
+    args = parser.parse_args(argv)
+
+    run = {'commit': current_commit(), 'time': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+           'python': platform.python_version()}
+    current = []
+
+    with tempfile.TemporaryDirectory() as workdir:
+        for size in args.sizes:
+            for name, items, durations in run_benchmarks(size, workdir, args.repeat, args.users):
+                best = min(durations)
+                result = dict(run, benchmark=name, size=size, items=items, repeat=args.repeat, best=best,
+                              mean=sum(durations) / len(durations), per_item=best / items)
+                current.append(result)
+                print(f'{name:>22} {size:>8}: {best * 1000:10.3f} ms  ({best / items * 1e6:.2f} us per item)')
+
+        # the startup of the subcommands does not depend on the size of the catalog, and is stored with size 0
+        startup, imported = startup_benchmarks(workdir, args.repeat)
+        for name, items, durations in startup:
+            best = min(durations)
+            current.append(dict(run, benchmark=name, size=0, items=items, repeat=args.repeat, best=best,
+                                mean=sum(durations) / len(durations), per_item=best))
+            print(f'{name:>22} {0:>8}: {best * 1000:10.3f} ms')
+
+    if args.compare:
+        compare(current, read_history(args.history))
+
+    with open(args.history, 'a') as fh:
+        for result in current:
+            fh.write(json.dumps(result) + '\n')
+
+    # a subcommand that starts slower than allowed, or that imports numpy without needing it, fails the benchmarks
+    slow = [name for name, items, durations in startup if args.max_startup and min(durations) > args.max_startup]
+    for name in imported:
+        print(f'{name} imported numpy at startup', file=sys.stderr)
+    for name in slow:
+        print(f'{name} took longer than {args.max_startup} s to start', file=sys.stderr)
+
+    return 1 if imported or slow else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
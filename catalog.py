@@ -0,0 +1,196 @@
+import threading
+from array import array
+
+from catalog_file import load_columns, read_csv
+from name_index import NameIndex
+from nutrients import nutrient_keys
+
+
+class FoodCatalog:
+    """
+    Holds every dish of food_nutrition.csv in memory. The nutrients are the ones named in the header of the file, and
+    their values are kept in one compact array per nutrient, and a dictionary maps each food label to its row so that a
+    dish can be found without scanning the file
+    """
+
+    __slots__ = ('path', 'labels', 'names', 'nutrients', 'columns', 'index', 'ranks', 'names_index', 'lock')
+
+    def __init__(self, path: str = 'food_nutrition.csv'):
+        """
+        Reads the csv file once and stores all of its dishes
+
+        :param path: path of the csv file that contains list of food and their nutritional values
+        """
+
+        self.path = path
+
+        # the label and the name of each dish in the order of the file, and one array of floats for each nutrient
+        header, self.labels, self.names, values = read_csv(path, 'food')
+        self.nutrients = nutrient_keys(header[2:], path)
+        self.columns = dict(zip(self.nutrients, values))
+
+        # a dictionary that contains the row of each food label
+        self.index = dict(zip(self.labels, range(len(self.labels))))
+
+        # the sort orders of the nutrients, computed by rank() when they are first needed
+        self.ranks = dict()
+
+        # the index of the names of the dishes, built by search() when it is first needed
+        self.names_index = None
+
+        # held while a dish is appended, so that sessions sharing the catalog do not append at the same time
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_columns(cls, path: str, labels: list, names: list, nutrients: tuple, values: list,
+                     index: dict = None) -> 'FoodCatalog':
+        """
+        Creates a catalog from columns that were already read, for example by another process, without reading the file
+
+        :param path: path of the csv file the columns were read from
+        :param labels: food label of each dish
+        :param names: name of each dish
+        :param nutrients: key of the nutrient of each column
+        :param values: one column of the values per serving of each dish for each nutrient
+        :param index: the row of each food label if it was already built, built from the labels when not given
+        :return: the catalog of the columns
+        """
+
+        catalog = cls.__new__(cls)
+        catalog.path = path
+        catalog.labels = labels
+        catalog.names = names
+        catalog.nutrients = tuple(nutrients)
+        catalog.columns = dict(zip(catalog.nutrients, values))
+        catalog.index = dict(zip(labels, range(len(labels)))) if index is None else index
+        catalog.ranks = dict()
+        catalog.names_index = None
+        catalog.lock = threading.Lock()
+
+        return catalog
+
+    def __len__(self) -> int:
+        return len(self.labels)
+
+    def __contains__(self, label: str) -> bool:
+        return label in self.index
+
+    def append(self, label: str, name: str, values: list):
+        """
+        Adds a dish to the catalog (the csv file itself is not modified). Columns that are views of a compiled catalog
+        are copied into arrays before the first dish is added. Dishes are appended one at a time, and the food label is
+        added to the index last, so that a label that can be found always has its row
+
+        :param label: food label of the dish
+        :param name: name of the dish
+        :param values: value per serving of each nutrient, in the order of nutrients
+        """
+
+        if len(values) != len(self.nutrients):
+            raise ValueError(f'expected {len(self.nutrients)} nutrients, found {len(values)}')
+
+        with self.lock:
+            for nutrient, column in self.columns.items():
+                if not isinstance(column, array):
+                    self.columns[nutrient] = array('d', memoryview(column).tobytes())
+
+            # the sort orders no longer include every dish
+            self.ranks.clear()
+
+            row = len(self.labels)
+            for column, value in zip(self.columns.values(), values):
+                column.append(value)
+            self.names.append(name)
+            self.labels.append(label)
+            self.index[label] = row
+
+            if self.names_index is not None:
+                self.names_index.add(label, name)
+
+    def position(self, label: str) -> int:
+        """
+        Returns the row of a food label in the catalog
+
+        :param label: food label of the dish
+        :return: the row of the dish
+        """
+
+        return self.index[label]
+
+    def rank(self, nutrient: str) -> array:
+        """
+        Returns the rank of every dish when the catalog is sorted from the highest to the lowest value of a nutrient per
+        serving. Dishes with the same value keep the order of the file. The ranks are computed once per nutrient, so
+        comparing two dishes afterwards only compares two integers
+
+        :param nutrient: key of the nutrient, one of nutrients
+        :return: an array with the rank of each row
+        """
+
+        ranks = self.ranks.get(nutrient)
+
+        # the ranks are computed under the lock, so that no dish is appended meanwhile
+        if ranks is None:
+            with self.lock:
+                ranks = self.ranks.get(nutrient)
+                if ranks is None:
+                    column = self.columns[nutrient]
+                    # sorted() is stable even in reverse, so equal values keep the order of the file
+                    order = sorted(range(len(column)), key=column.__getitem__, reverse=True)
+
+                    ranks = array('l', bytes(len(order) * array('l').itemsize))
+                    for r, i in enumerate(order):
+                        ranks[i] = r
+
+                    self.ranks[nutrient] = ranks
+
+        return ranks
+
+    def search(self, query: str, k: int = 10) -> list:
+        """
+        Finds the dishes whose name best matches a query, even when it is misspelled. The index of the names is built
+        once, the first time a dish is searched for
+
+        :param query: the name, or the start of the words of the name, of a dish
+        :param k: the largest number of results
+        :return: a list of dictionaries with the name, the labels and the similarity (from 0 to 1) of each result
+        """
+
+        # the index is built under the lock, so that a dish appended meanwhile is not left out of it
+        if self.names_index is None:
+            with self.lock:
+                if self.names_index is None:
+                    self.names_index = NameIndex(self.labels, self.names)
+
+        return self.names_index.search(query, k)
+
+    def record(self, label: str) -> tuple:
+        """
+        Returns all the information of a dish in the same order as the columns of the csv file
+
+        :param label: food label of the dish
+        :return: a tuple of label, name and the value of each nutrient
+        """
+
+        i = self.index[label]
+        return (self.labels[i], self.names[i], *(column[i] for column in self.columns.values()))
+
+
+# catalogs that have already been read, so that a session only reads each file once
+_catalogs = dict()
+
+
+def load_catalog(path: str = 'food_nutrition.csv') -> FoodCatalog:
+    """
+    Returns the shared catalog of the csv file, loading it only the first time it is asked for. The catalog is loaded
+    from its compiled form, which is rebuilt whenever the csv file changes
+
+    :param path: path of the csv file that contains list of food and their nutritional values
+    :return: the catalog of the file
+    """
+
+    if path not in _catalogs:
+        header, labels, names, values = load_columns(path, 'food')
+        _catalogs[path] = FoodCatalog.from_columns(path, labels, names, nutrient_keys(header[2:], path), values)
+
+    return _catalogs[path]
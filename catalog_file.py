@@ -0,0 +1,324 @@
+import argparse
+import hashlib
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+from instrumentation import record_io
+from nutrients import nutrient_keys
+
+
+# the layout of the header of a compiled catalog: magic, version, kind, rows, columns, modification time, size and
+# hash of the csv file, and the lengths of the three string tables (column names, labels and names)
+HEADER = struct.Struct('<4sHHIIqq32sQQQ')
+MAGIC = b'HVFC'
+VERSION = 1
+
+# position of the modification time inside the header, so that it can be updated in place
+MTIME_OFFSET = 16
+
+# the kinds of catalog, with whether the names of the numeric columns have to be numbers (the weights of
+# exercises.csv). Both kinds take any number of numeric columns: those of food catalogs are named after nutrients, which
+# are checked by nutrient_keys()
+SCHEMAS = {'food': False, 'exercise': True}
+KINDS = tuple(SCHEMAS)
+
+# file extension of a compiled catalog, added to the path of the csv file
+EXTENSION = '.catalog'
+
+
+def read_csv(path: str, kind: str = 'food') -> tuple:
+    """
+    Reads a catalog csv file and checks it against the schema of its kind. Every row has a label, a name and numeric
+    columns, and the fields may be separated by ',' or ', '
+
+    :param path: path of the csv file
+    :param kind: kind of catalog (food or exercise)
+    :return: a tuple of the column names, the labels, the names and one array of floats for each numeric column
+    """
+
+    numeric_header = SCHEMAS[kind]
+
+    with open(path, 'r') as fh:
+        header = [field.strip() for field in fh.readline().split(',')]
+        columns = len(header) - 2
+
+        # checks the header of the csv file
+        if columns < 1:
+            raise ValueError(f'{path}, line 1: expected at least 1 numeric column after the label and the name, found '
+                             f'{columns}')
+        if numeric_header:
+            try:
+                [float(field) for field in header[2:]]
+            except ValueError:
+                raise ValueError(f'{path}, line 1: the names of the numeric columns should be numbers')
+        if kind == 'food':
+            nutrient_keys(header[2:], path)
+
+        labels, names, values = parse_rows(path, header, fh)
+        record_io(os.fstat(fh.fileno()).st_size, len(labels))
+
+    return header, labels, names, values
+
+
+def parse_rows(path: str, header: list, lines, number: int = 2, known=()) -> tuple:
+    """
+    Checks the rows of a catalog csv file against its header and splits them into columns
+
+    :param path: path of the csv file, used in the error messages
+    :param header: the column names of the csv file
+    :param lines: the lines of the rows
+    :param number: line number of the first row
+    :param known: labels that are already used, for example by the rows read before these ones
+    :return: a tuple of the labels, the names and one array of floats for each numeric column
+    """
+
+    labels = []
+    names = []
+    values = [array('d') for _ in range(len(header) - 2)]
+    seen = set()
+
+    for number, line in enumerate(lines, number):
+        fields = [field.strip() for field in line.split(',')]
+
+        # skips empty lines such as a trailing newline
+        if fields == ['']:
+            continue
+
+        # checks every row of the csv file
+        if len(fields) != len(header):
+            raise ValueError(f'{path}, line {number}: expected {len(header)} fields, found {len(fields)}')
+        if fields[0] == '' or fields[0] in seen or fields[0] in known:
+            raise ValueError(f'{path}, line {number}: the label {fields[0]!r} is empty or repeated')
+        try:
+            numbers = [float(field) for field in fields[2:]]
+        except ValueError:
+            raise ValueError(f'{path}, line {number}: the values after the name should be numbers')
+        if any(n < 0 for n in numbers):
+            raise ValueError(f'{path}, line {number}: the values should not be negative')
+
+        seen.add(fields[0])
+        labels.append(fields[0])
+        names.append(fields[1])
+        for column, n in zip(values, numbers):
+            column.append(n)
+
+    return labels, names, values
+
+
+def hash_file(path: str) -> bytes:
+    """
+    Calculates the sha256 hash of a file without reading it into memory at once
+
+    :param path: path of the file
+    :return: the hash of the file
+    """
+
+    digest = hashlib.sha256()
+    with open(path, 'rb') as fh:
+        for block in iter(lambda: fh.read(1 << 20), b''):
+            digest.update(block)
+            record_io(len(block))
+
+    return digest.digest()
+
+
+def compile_catalog(path: str, kind: str = 'food', out_path: str = None) -> str:
+    """
+    Checks a catalog csv file and writes it in binary form: a fixed-width array of floats with one numeric column after
+    another, followed by the column names, the labels and the names as strings separated by null characters. The file
+    is written under a temporary name and then renamed, so that readers never see half of a file
+
+    :param path: path of the csv file
+    :param kind: kind of catalog (food or exercise)
+    :param out_path: path of the compiled catalog, the csv path followed by EXTENSION when not given
+    :return: the path of the compiled catalog
+    """
+
+    out_path = out_path or path + EXTENSION
+
+    # the modification time is taken before reading, so that a change during reading makes the catalog stale
+    stat = os.stat(path)
+    header, labels, names, values = read_csv(path, kind)
+    strings = ['\0'.join(header).encode(), '\0'.join(labels).encode(), '\0'.join(names).encode()]
+
+    tmp_path = f'{out_path}.{os.getpid()}.tmp'
+    try:
+        with open(tmp_path, 'wb') as fh:
+            fh.write(HEADER.pack(MAGIC, VERSION, KINDS.index(kind), len(labels), len(values), stat.st_mtime_ns,
+                                 stat.st_size, hash_file(path), *(len(s) for s in strings)))
+            for column in values:
+                fh.write(column.tobytes())
+            for s in strings:
+                fh.write(s)
+
+        os.replace(tmp_path, out_path)
+
+    # a file that could only be written in part, for example on a full disk, is not left behind
+    except OSError:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return out_path
+
+
+def _read_header(fh) -> tuple:
+    """
+    Reads and checks the header of a compiled catalog
+
+    :param fh: compiled catalog opened in binary mode
+    :return: the fields of the header, or None if the file is not a compiled catalog of this version
+    """
+
+    data = fh.read(HEADER.size)
+    if len(data) != HEADER.size:
+        return None
+
+    fields = HEADER.unpack(data)
+    if fields[0] != MAGIC or fields[1] != VERSION:
+        return None
+
+    return fields
+
+
+def is_current(path: str, kind: str = 'food', out_path: str = None) -> bool:
+    """
+    Checks whether a compiled catalog still matches its csv file. The modification time and the size are compared
+    first; when only the modification time changed, the hash decides, and a matching hash refreshes the stored time so
+    that the file is not hashed again
+
+    :param path: path of the csv file
+    :param kind: kind of catalog (food or exercise)
+    :param out_path: path of the compiled catalog, the csv path followed by EXTENSION when not given
+    :return: True if the compiled catalog can be used
+    """
+
+    out_path = out_path or path + EXTENSION
+    stat = os.stat(path)
+
+    try:
+        with open(out_path, 'rb') as fh:
+            fields = _read_header(fh)
+    except OSError:
+        return False
+
+    if fields is None or fields[2] != KINDS.index(kind) or fields[6] != stat.st_size:
+        return False
+    if fields[5] == stat.st_mtime_ns:
+        return True
+    if fields[7] != hash_file(path):
+        return False
+
+    # the file was only touched, so the new modification time is stored if the compiled catalog can be written
+    try:
+        with open(out_path, 'r+b') as fh:
+            fh.seek(MTIME_OFFSET)
+            fh.write(struct.pack('<q', stat.st_mtime_ns))
+    except OSError:
+        pass
+
+    return True
+
+
+def open_compiled(out_path: str) -> tuple:
+    """
+    Maps a compiled catalog into memory. The numeric columns are memory views of the mapped file, so no value is copied
+    until it is used
+
+    :param out_path: path of the compiled catalog
+    :return: a tuple of the column names, the labels, the names and one memory view of floats for each numeric column
+    """
+
+    with open(out_path, 'rb') as fh:
+        fields = _read_header(fh)
+        if fields is None:
+            raise ValueError(f'{out_path} is not a compiled catalog of version {VERSION}')
+        mapped = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+
+    rows, columns = fields[3], fields[4]
+    view = memoryview(mapped)
+
+    # the numeric columns one after another, right after the header
+    start = HEADER.size
+    values = []
+    for _ in range(columns):
+        values.append(view[start:start + 8 * rows].cast('d'))
+        start += 8 * rows
+
+    # the three string tables after the numeric columns
+    strings = []
+    for length in fields[8:]:
+        strings.append(str(view[start:start + length], 'utf-8').split('\0'))
+        start += length
+
+    header, labels, names = strings
+
+    # an empty string table splits into one empty string, not into zero rows
+    if rows == 0:
+        labels, names = [], []
+
+    record_io(len(mapped), rows)
+
+    return header, labels, names, values
+
+
+def load_columns(path: str, kind: str = 'food') -> tuple:
+    """
+    Returns the columns of a catalog csv file from its compiled form, compiling it first when the compiled catalog is
+    missing or older than the csv file. If the compiled catalog cannot be written, the csv file is read directly
+
+    :param path: path of the csv file
+    :param kind: kind of catalog (food or exercise)
+    :return: a tuple of the column names, the labels, the names and one sequence of floats for each numeric column
+    """
+
+    out_path = path + EXTENSION
+
+    if not is_current(path, kind, out_path):
+        try:
+            compile_catalog(path, kind, out_path)
+
+        # reads the csv file when the compiled catalog cannot be written, for example on a read-only or full disk
+        except OSError:
+            return read_csv(path, kind)
+
+    return open_compiled(out_path)
+
+
+def main(argv: list = None) -> int:
+    """
+    Command line entry point that compiles catalog csv files ahead of time
+
+    :param argv: command line arguments, sys.argv is used when not given
+    :return: exit status
+    """
+
+    parser = argparse.ArgumentParser(prog='haverfit compile-catalog', description='Checks catalog csv files and '
+                                                                                  'compiles them into binary form.')
+    parser.add_argument('paths', nargs='*', default=['food_nutrition.csv', 'exercises.csv'],
+                        help='csv files to compile (default: food_nutrition.csv exercises.csv)')
+    parser.add_argument('-k', '--kind', choices=KINDS, help='kind of catalog (default: exercise for files whose name '
+                                                            'starts with exercise, food otherwise)')
+    args = parser.parse_args(argv)
+
+    for path in args.paths:
+        kind = args.kind or ('exercise' if os.path.basename(path).startswith('exercise') else 'food')
+
+        try:
+            out_path = compile_catalog(path, kind)
+        except FileNotFoundError:
+            print(f'The file {path} does not exist', file=sys.stderr)
+            return 1
+        except ValueError as error:
+            print(error, file=sys.stderr)
+            return 1
+
+        print(f'{path} -> {out_path}')
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
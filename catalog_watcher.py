@@ -0,0 +1,239 @@
+import os
+from array import array
+from collections.abc import Mapping, Sequence
+from itertools import islice
+
+from catalog import FoodCatalog
+from catalog_file import load_columns, parse_rows
+from food_writer import _lock, _unlock
+from nutrients import nutrient_keys
+
+
+# number of bytes at the end of the part of the csv file that was read, kept to recognize that part again
+TAIL = 64
+
+
+def _signature(stat: os.stat_result) -> tuple:
+    """
+    :param stat: status of a file
+    :return: the fields of the status that change when the file is edited, appended to or replaced
+    """
+
+    return stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+
+class _Prefix(Sequence):
+    """
+    The first rows of a list that only grows, seen as a list of its own. The catalogs of the watcher share the lists of
+    labels and names that rows are appended to, each one seeing only the rows it had when it was made
+    """
+
+    __slots__ = ('items', 'size')
+
+    def __init__(self, items: list, size: int):
+        """
+        :param items: the list that rows are appended to
+        :param size: number of rows seen
+        """
+
+        self.items = items
+        self.size = size
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return self.items[:self.size][i]
+        if not -self.size <= i < self.size:
+            raise IndexError('row out of range')
+
+        return self.items[i % self.size]
+
+    def __iter__(self):
+        return islice(self.items, self.size)
+
+
+class _Rows(Mapping):
+    """
+    The rows of the food labels of the first rows of a catalog, seen in a dictionary that only grows and is shared by
+    the catalogs of the watcher. Labels of rows appended later are not found
+    """
+
+    __slots__ = ('rows', 'labels', 'size')
+
+    def __init__(self, rows: dict, labels: list, size: int):
+        """
+        :param rows: the row of each food label, which rows are added to
+        :param labels: the list that food labels are appended to
+        :param size: number of rows seen
+        """
+
+        self.rows = rows
+        self.labels = labels
+        self.size = size
+
+    def __getitem__(self, label: str) -> int:
+        row = self.rows[label]
+        if row >= self.size:
+            raise KeyError(label)
+
+        return row
+
+    def get(self, label: str, default=None):
+        row = self.rows.get(label)
+        return default if row is None or row >= self.size else row
+
+    def __contains__(self, label) -> bool:
+        row = self.rows.get(label)
+        return row is not None and row < self.size
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __iter__(self):
+        return islice(self.labels, self.size)
+
+
+class CatalogWatcher:
+    """
+    Keeps an up to date catalog of food_nutrition.csv for long-running processes. poll() compares the inode, size and
+    modification time of the file with the ones that were read: rows appended at the end (by add_food() for example)
+    are read on their own, and any other change reads the whole file again. Every change creates a new catalog that
+    replaces current in one assignment, so a call that took current before keeps using a consistent catalog until it
+    returns. The catalogs made for appended rows share the rows read before: the labels, the names, the index and the
+    columns grow in place (the columns by doubling their capacity), and each catalog only sees the rows it had when it
+    was made, so an append does not copy the whole catalog. The catalogs given by current are shared and should not be
+    appended to
+    """
+
+    __slots__ = ('path', 'current', 'header', 'loaded', 'checked', 'tail', 'error', 'grown')
+
+    def __init__(self, path: str = 'food_nutrition.csv'):
+        """
+        Loads the catalog for the first time
+
+        :param path: path of the csv file that contains list of food and their nutritional values
+        """
+
+        self.path = path
+
+        # the error of the last change that could not be read, the previous catalog is kept meanwhile
+        self.error = None
+
+        self._reload()
+
+    def _reload(self):
+        """
+        Reads the whole catalog again, from its compiled form when it is up to date
+        """
+
+        # the file is read again if it changed while it was being read
+        while True:
+            before = os.stat(self.path)
+            header, labels, names, columns = load_columns(self.path, 'food')
+            after = os.stat(self.path)
+            if _signature(before) == _signature(after):
+                break
+
+        with open(self.path, 'rb') as fh:
+            fh.seek(max(0, after.st_size - TAIL))
+            tail = fh.read(after.st_size - fh.tell())
+
+        self.header = header
+        self.loaded = self.checked = after
+        self.tail = tail
+        self.current = FoodCatalog.from_columns(self.path, labels, names, nutrient_keys(header[2:], self.path), columns)
+
+        # the lists, the index and the columns that appended rows are added to, made by the first append
+        self.grown = None
+
+    def _append(self) -> bool:
+        """
+        Reads only the rows appended after the part of the file that was read, under a shared lock so that a dish being
+        added by append_foods() is never read halfway
+
+        :return: whether the rows could be read on their own, False when the file has to be read again
+        """
+
+        with open(self.path, 'rb') as fh:
+            _lock(fh, shared=True)
+            try:
+                stat = os.fstat(fh.fileno())
+                start = self.loaded.st_size - len(self.tail)
+                fh.seek(start)
+                data = fh.read(stat.st_size - start)
+            finally:
+                _unlock(fh)
+
+        # the part that was read has to be unchanged, and the appended rows have to start on a new line
+        appended = data[len(self.tail):]
+        if not data.startswith(self.tail) or not (self.tail.endswith(b'\n') or appended.startswith(b'\n')):
+            return False
+
+        # the line numbers of appended rows are not known, so an error is reported by reading the whole file instead
+        old = self.current
+        try:
+            labels, names, values = parse_rows(self.path, self.header, appended.decode().split('\n'), len(old) + 2,
+                                               old.index)
+        except ValueError:
+            return False
+
+        # the rows read so far are copied once, into lists, an index and columns that can grow
+        if self.grown is None:
+            self.grown = (list(old.labels), list(old.names), dict(old.index),
+                          [array('d', memoryview(column).tobytes()) for column in old.columns.values()])
+        all_labels, all_names, rows, columns = self.grown
+
+        start = len(old)
+        size = start + len(labels)
+        for j, new in enumerate(values):
+            # the catalogs made before still see the columns, so a column that is full is replaced by one twice as large
+            # instead of being resized
+            if len(columns[j]) < size:
+                column = array('d', bytes(8 * max(size, 2 * len(columns[j]))))
+                column[:start] = columns[j][:start]
+                columns[j] = column
+            columns[j][start:size] = array('d', new)
+
+        all_labels += labels
+        all_names += names
+        rows.update(zip(labels, range(start, size)))
+
+        self.loaded = self.checked = stat
+        self.tail = data[-TAIL:]
+        self.current = FoodCatalog.from_columns(self.path, _Prefix(all_labels, size), _Prefix(all_names, size),
+                                                old.nutrients, [memoryview(column)[:size] for column in columns],
+                                                _Rows(rows, all_labels, size))
+        return True
+
+    def poll(self) -> bool:
+        """
+        Checks whether the csv file changed and, if it did, replaces current with a catalog of the new file. When the
+        new file cannot be read, the previous catalog is kept and the reason is stored in error
+
+        :return: whether current was replaced
+        """
+
+        try:
+            stat = os.stat(self.path)
+        except OSError as error:
+            self.error = error
+            return False
+
+        if _signature(stat) == _signature(self.checked):
+            return False
+        self.checked = stat
+
+        try:
+            appended = (stat.st_dev, stat.st_ino) == (self.loaded.st_dev, self.loaded.st_ino) \
+                and stat.st_size > self.loaded.st_size
+            if not (appended and self._append()):
+                self._reload()
+        except (OSError, ValueError) as error:
+            self.error = error
+            return False
+
+        self.error = None
+        return True
+
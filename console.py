@@ -0,0 +1,146 @@
+import json
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+
+class Console:
+    """
+    Where the interactive program reads its answers from and writes its text to. The interactive functions call ask()
+    and say() instead of input() and print(), so that another console can replay a session or record it
+    """
+
+    __slots__ = ()
+
+    def ask(self, prompt: str = '') -> str:
+        """
+        :param prompt: the text shown before the answer
+        :return: the answer of the user, without the newline
+        """
+
+        return input(prompt)
+
+    def say(self, text: str):
+        """
+        :param text: the text to show, with its newlines
+        """
+
+        print(text, end='')
+
+
+class ScriptedConsole(Console):
+    """
+    Console that answers the prompts with the answers of a recorded session, in order, and keeps the text written to it
+    instead of showing it. The latency of each prompt is the time from the previous answer (or the start) until the
+    prompt is asked, which is the time the user would wait for the prompt
+    """
+
+    __slots__ = ('answers', 'output', 'latencies', 'last')
+
+    def __init__(self, answers: list, keep_output: bool = True):
+        """
+        :param answers: answers given to the prompts, in order
+        :param keep_output: whether to keep the text written to the console, it is dropped when not
+        """
+
+        self.answers = iter(answers)
+        self.output = [] if keep_output else None
+
+        # a list of (prompt, seconds) tuples, one for each prompt that was asked
+        self.latencies = []
+        self.last = time.perf_counter()
+
+    def ask(self, prompt: str = '') -> str:
+        now = time.perf_counter()
+        self.latencies.append((prompt.strip(), now - self.last))
+        self.say(prompt)
+
+        # input() raises EOFError when there is nothing left to read, and so does a session without more answers
+        answer = next(self.answers, None)
+        if answer is None:
+            raise EOFError(f'the session has no answer for the prompt {prompt.strip()!r}')
+
+        self.last = time.perf_counter()
+        return str(answer)
+
+    def say(self, text: str):
+        if self.output is not None:
+            self.output.append(text)
+
+    def text(self) -> str:
+        """
+        :return: the text written to the console
+        """
+
+        return ''.join(self.output or ())
+
+
+class RecordingConsole(Console):
+    """
+    Console of the terminal that also keeps the answers of the user, so that the session can be replayed later
+    """
+
+    __slots__ = ('answers',)
+
+    def __init__(self):
+        self.answers = []
+
+    def ask(self, prompt: str = '') -> str:
+        answer = input(prompt)
+        self.answers.append(answer)
+        return answer
+
+    def save(self, path: str, options: dict = None):
+        """
+        Appends the answers of the session to a JSON lines file of session scripts, as one line
+
+        :param path: path of the JSON lines file
+        :param options: the options of user_interface() the session ran with, needed to replay it
+        """
+
+        script = {'answers': self.answers, 'options': options} if options else {'answers': self.answers}
+        with open(path, 'a') as fh:
+            fh.write(json.dumps(script) + '\n')
+
+
+# the console of the running session. Each thread has its own, so that sessions can run side by side
+_console = ContextVar('console', default=Console())
+
+
+def ask(prompt: str = '') -> str:
+    """
+    Reads an answer from the console of the session, like input()
+
+    :param prompt: the text shown before the answer
+    :return: the answer of the user
+    """
+
+    return _console.get().ask(prompt)
+
+
+def say(*values, sep: str = ' ', end: str = '\n'):
+    """
+    Writes text to the console of the session, like print()
+
+    :param values: the values to write
+    :param sep: text written between the values
+    :param end: text written after the last value
+    """
+
+    _console.get().say(sep.join(map(str, values)) + end)
+
+
+@contextmanager
+def using(console: Console):
+    """
+    Runs the code inside the with block with another console
+
+    :param console: the console to read the answers from and write the text to
+    :return: the console
+    """
+
+    token = _console.set(console)
+    try:
+        yield console
+    finally:
+        _console.reset(token)
@@ -0,0 +1,477 @@
+import datetime
+import os
+from array import array
+
+import numpy as np
+
+from catalog import FoodCatalog
+from food_writer import _lock, _unlock
+from nutrient_engine import NutrientEngine, consumption_totals
+
+
+# the rolling windows of the totals, with their number of days
+WINDOWS = {'day': 1, 'week': 7, 'month': 30}
+
+# number of days kept for each user, enough for the longest window
+HISTORY_DAYS = max(WINDOWS.values())
+
+# the file and the array type code of each column of the log
+COLUMNS = {'user': 'i', 'day': 'i', 'label': 'i', 'servings': 'd'}
+
+# the files of the names of the users and of the food labels, one per line in the order of their ids
+NAME_FILES = {'user': 'users.txt', 'label': 'labels.txt'}
+
+
+def to_day(date) -> int:
+    """
+    :param date: a datetime.date, a string in the form YYYY-MM-DD, or None for today
+    :return: the number of the day (1 for January 1st of year 1)
+    """
+
+    if date is None:
+        date = datetime.date.today()
+    elif isinstance(date, str):
+        date = datetime.date.fromisoformat(date)
+
+    return date.toordinal()
+
+
+class RollingTotals:
+    """
+    Running totals of the nutrients of one user over the last day, week and month. The totals of each of the last
+    HISTORY_DAYS days are kept in a ring, and each window keeps its sum, so adding an entry or moving to a new day only
+    updates a few sums instead of adding the whole history again
+    """
+
+    __slots__ = ('last', 'ring', 'logged', 'sums', 'counts')
+
+    def __init__(self, day: int, width: int):
+        """
+        :param day: the first day of the user
+        :param width: number of nutrients
+        """
+
+        # the latest day of the user, and the totals of each of the days before it that are still in a window
+        self.last = day
+        self.ring = np.zeros((HISTORY_DAYS, width))
+        self.logged = [False] * HISTORY_DAYS
+
+        # the totals of each window ending on the latest day, and the number of days with entries in it
+        self.sums = {window: np.zeros(width) for window in WINDOWS}
+        self.counts = dict.fromkeys(WINDOWS, 0)
+
+    @classmethod
+    def from_days(cls, days: np.ndarray, totals: np.ndarray) -> 'RollingTotals':
+        """
+        Creates the running totals of a user from the totals of its days, without adding them one at a time
+
+        :param days: the different days of the user in increasing order, all in the longest window before the last one
+        :param totals: the nutrient totals of each day, one row per day
+        :return: the running totals ending on the last day
+        """
+
+        rolling = cls(int(days[-1]), totals.shape[1])
+        slots = days % HISTORY_DAYS
+        rolling.ring[slots] = totals
+        for slot in slots.tolist():
+            rolling.logged[slot] = True
+
+        for window, length in WINDOWS.items():
+            inside = days > rolling.last - length
+            rolling.sums[window] = totals[inside].sum(axis=0)
+            rolling.counts[window] = int(inside.sum())
+
+        return rolling
+
+    def _advance(self, day: int):
+        """
+        Moves the windows forward to a later day, removing the days that leave each window
+
+        :param day: the new latest day
+        """
+
+        if day - self.last >= HISTORY_DAYS:
+            self.ring[:] = 0
+            self.logged = [False] * HISTORY_DAYS
+            for window in WINDOWS:
+                self.sums[window][:] = 0
+                self.counts[window] = 0
+        else:
+            for new in range(self.last + 1, day + 1):
+                for window, days in WINDOWS.items():
+                    leaving = (new - days) % HISTORY_DAYS
+                    self.sums[window] -= self.ring[leaving]
+                    self.counts[window] -= self.logged[leaving]
+
+                    # an empty window is reset so that rounding errors do not pile up
+                    if self.counts[window] == 0:
+                        self.sums[window][:] = 0
+
+                # the slot of the new day held the day that just left the longest window
+                self.ring[new % HISTORY_DAYS] = 0
+                self.logged[new % HISTORY_DAYS] = False
+
+        self.last = day
+
+    def add(self, day: int, nutrients: np.ndarray):
+        """
+        Adds the nutrients of an entry. Entries older than the longest window only stay in the log
+
+        :param day: the day of the entry
+        :param nutrients: the nutrients of the entry
+        """
+
+        if day > self.last:
+            self._advance(day)
+        if day <= self.last - HISTORY_DAYS:
+            return
+
+        slot = day % HISTORY_DAYS
+        self.ring[slot] += nutrients
+        for window, days in WINDOWS.items():
+            if day > self.last - days:
+                self.sums[window] += nutrients
+                self.counts[window] += not self.logged[slot]
+        self.logged[slot] = True
+
+    def window(self, window: str, day: int) -> tuple:
+        """
+        Returns the totals of a window ending on the latest day or on a later one
+
+        :param window: the name of the window (day, week or month)
+        :param day: the last day of the window, not before the latest day
+        :return: a tuple of the nutrient totals and the number of days with entries
+        """
+
+        totals = self.sums[window].copy()
+        count = self.counts[window]
+        days = WINDOWS[window]
+
+        # removes the days that left the window after the latest day
+        for leaving in range(self.last - days + 1, min(day - days, self.last) + 1):
+            totals -= self.ring[leaving % HISTORY_DAYS]
+            count -= self.logged[leaving % HISTORY_DAYS]
+
+        return totals, count
+
+
+class ConsumptionLog:
+    """
+    Keeps the consumption of every user, day after day, in an append-only log. The log is a directory with one binary
+    file per column (user, day, label and servings) and the names of the users and the food labels in text files, so
+    appending an entry only writes a few bytes at the end of each file. The running totals of the last day, week and
+    month of every user are built once from the log when it is opened, and then updated by every entry added to it.
+    Several processes can append to the same log, each one reading the entries of the others before adding its own
+    """
+
+    __slots__ = ('path', 'catalog', 'names', 'ids', 'offsets', 'size', 'totals')
+
+    def __init__(self, path: str = 'consumption_log', catalog: FoodCatalog = None):
+        """
+        Opens the log, creating its directory when it does not exist
+
+        :param path: path of the directory of the log
+        :param catalog: catalog of the dishes, the shared catalog of food_nutrition.csv is used when not given
+        """
+
+        if catalog is None:
+            from catalog import load_catalog
+            catalog = load_catalog()
+
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.catalog = catalog
+
+        # the names of the users and of the food labels, the id of each name and the number of bytes read of each file
+        self.names = {column: [] for column in NAME_FILES}
+        self.ids = {column: dict() for column in NAME_FILES}
+        self.offsets = dict.fromkeys(NAME_FILES, 0)
+
+        # the number of entries that were read, and the rolling totals of each user
+        self.size = 0
+        self.totals = dict()
+
+        with open(os.path.join(path, 'lock'), 'a') as lock:
+            _lock(lock, shared=True)
+            try:
+                self._catch_up()
+            finally:
+                _unlock(lock)
+
+    def _file(self, column: str) -> str:
+        """
+        :param column: name of a column
+        :return: the path of the binary file of the column in the directory of the log
+        """
+
+        return os.path.join(self.path, f'{column}.bin')
+
+    def _names_file(self, column: str) -> str:
+        """
+        :param column: user or label
+        :return: the path of the file of the names of the column in the directory of the log
+        """
+
+        return os.path.join(self.path, NAME_FILES[column])
+
+    def _complete_size(self) -> int:
+        """
+        :return: the number of entries written to every column, an interrupted append leaves some columns longer
+        """
+
+        sizes = []
+        for column, code in COLUMNS.items():
+            try:
+                sizes.append(os.path.getsize(self._file(column)) // array(code).itemsize)
+            except FileNotFoundError:
+                sizes.append(0)
+
+        return min(sizes)
+
+    def _read_columns(self, start: int, end: int) -> dict:
+        """
+        :param start: first entry to read
+        :param end: entry after the last one to read
+        :return: a dictionary of the NumPy array of each column
+        """
+
+        columns = dict()
+        for column, code in COLUMNS.items():
+            dtype = np.dtype(np.int32 if code == 'i' else np.float64)
+            if end <= start:
+                columns[column] = np.empty(0, dtype=dtype)
+                continue
+            with open(self._file(column), 'rb') as fh:
+                fh.seek(start * dtype.itemsize)
+                columns[column] = np.fromfile(fh, dtype=dtype, count=end - start)
+
+        return columns
+
+    def _catch_up(self):
+        """
+        Reads the names and the entries added since the last read, by this process or another one, and adds the
+        entries to the rolling totals
+        """
+
+        for column in NAME_FILES:
+            try:
+                with open(self._names_file(column), 'rb') as fh:
+                    fh.seek(self.offsets[column])
+                    data = fh.read()
+            except FileNotFoundError:
+                data = b''
+
+            # the last line has no newline yet when a name is being written
+            data = data[:data.rfind(b'\n') + 1]
+            self.offsets[column] += len(data)
+            for name in data.decode('utf-8').split('\n')[:-1]:
+                self.ids[column][name] = len(self.names[column])
+                self.names[column].append(name)
+
+        end = self._complete_size()
+        if end <= self.size:
+            return
+
+        columns = self._read_columns(self.size, end)
+        self.size = end
+        nutrients = self._nutrients(columns['label'], columns['servings'])
+
+        # the totals of each day of each user, in the order of the users and then of the days
+        keys = (columns['user'].astype(np.int64) << 32) | columns['day'].astype(np.int64)
+        keys, groups = np.unique(keys, return_inverse=True)
+        totals = np.column_stack([np.bincount(groups, nutrients[:, j], len(keys)) for j in range(nutrients.shape[1])])
+        users, days = keys >> 32, keys & 0xFFFFFFFF
+
+        # only the days in the longest window before the latest day of each user are added to its totals
+        ends = np.r_[np.flatnonzero(users[1:] != users[:-1]), len(users) - 1]
+        latest = np.repeat(days[ends], np.diff(np.r_[-1, ends]))
+        recent = days > latest - HISTORY_DAYS
+
+        users, days, totals = users[recent], days[recent], totals[recent]
+
+        # the users that are new are created from their days at once, the others add the days one at a time
+        starts = np.r_[0, np.flatnonzero(users[1:] != users[:-1]) + 1, len(users)]
+        for start, end in zip(starts[:-1].tolist(), starts[1:].tolist()):
+            name = self.names['user'][int(users[start])]
+            if name not in self.totals:
+                self.totals[name] = RollingTotals.from_days(days[start:end], totals[start:end])
+                continue
+            for day, values in zip(days[start:end].tolist(), totals[start:end]):
+                self.totals[name].add(day, values)
+
+    def _nutrients(self, labels: np.ndarray, servings: np.ndarray) -> np.ndarray:
+        """
+        :param labels: label id of each entry
+        :param servings: servings of each entry
+        :return: the nutrients of each entry, zero for the food labels that are not in the catalog
+        """
+
+        nutrients = np.zeros((len(labels), len(self.catalog.nutrients)))
+        if len(labels) == 0:
+            return nutrients
+
+        index = self.catalog.index
+        rows = np.array([index.get(name, -1) for name in self.names['label']], dtype=np.int64)[labels]
+        known = rows >= 0
+        nutrients[known] = NutrientEngine(self.catalog).matrix[rows[known]] * servings[known, None]
+
+        return nutrients
+
+    def _repair_names(self):
+        """
+        Removes the last line of the names files when an interrupted append left it without a newline
+        """
+
+        for column in NAME_FILES:
+            with open(self._names_file(column), 'ab+') as fh:
+                end = fh.seek(0, os.SEEK_END)
+                if end == 0:
+                    continue
+                fh.seek(end - 1)
+                if fh.read(1) != b'\n':
+                    fh.seek(0)
+                    fh.truncate(fh.read().rfind(b'\n') + 1)
+
+    def _id(self, column: str, name: str, fh) -> int:
+        """
+        Returns the id of a name, writing it to its names file when it is new
+
+        :param column: user or label
+        :param name: the name
+        :param fh: names file opened for appending
+        :return: the id of the name
+        """
+
+        if name not in self.ids[column]:
+            if '\n' in name or name == '':
+                raise ValueError(f'The {column} {name!r} should not be empty or contain a new line')
+            fh.write(name + '\n')
+            self.offsets[column] += len(name.encode('utf-8')) + 1
+            self.ids[column][name] = len(self.names[column])
+            self.names[column].append(name)
+
+        return self.ids[column][name]
+
+    def append(self, user: str, consumption: dict, date=None):
+        """
+        Adds the consumption of a user on a day to the log and to the rolling totals
+
+        :param user: name of the user
+        :param consumption: dictionary containing food labels and serving amount
+        :param date: the day of the consumption (datetime.date or YYYY-MM-DD), today when not given
+        """
+
+        day = to_day(date)
+        entries = [(label, float(serving)) for label, serving in consumption.items()]
+        if any(serving < 0 for label, serving in entries):
+            raise ValueError('The amount of serving should not be negative')
+
+        with open(os.path.join(self.path, 'lock'), 'a') as lock:
+            _lock(lock)
+            try:
+                self._catch_up()
+
+                # the files are cut to the last complete entry before appending
+                self._repair_names()
+                for column, code in COLUMNS.items():
+                    with open(self._file(column), 'ab') as fh:
+                        fh.truncate(self.size * array(code).itemsize)
+
+                with open(self._names_file('user'), 'a', encoding='utf-8', newline='\n') as users, \
+                        open(self._names_file('label'), 'a', encoding='utf-8', newline='\n') as labels:
+                    user_id = self._id('user', user, users)
+                    label_ids = [self._id('label', label, labels) for label, serving in entries]
+
+                values = {'user': [user_id] * len(entries), 'day': [day] * len(entries), 'label': label_ids,
+                          'servings': [serving for label, serving in entries]}
+                for column, code in COLUMNS.items():
+                    with open(self._file(column), 'ab') as fh:
+                        array(code, values[column]).tofile(fh)
+
+                self.size += len(entries)
+            finally:
+                _unlock(lock)
+
+        # the nutrients of the entries, like in calculating_nutrients()
+        nutrients = consumption_totals(dict(entries), self.catalog)
+        if nutrients is None:
+            nutrients = np.zeros(len(self.catalog.nutrients))
+
+        if user not in self.totals:
+            self.totals[user] = RollingTotals(day, len(self.catalog.nutrients))
+        self.totals[user].add(day, nutrients)
+
+    def history(self, user: str, start, end) -> tuple:
+        """
+        Adds up the nutrients of a user between two days by reading the whole log, for periods that are not one of the
+        rolling windows
+
+        :param user: name of the user
+        :param start: the first day (datetime.date or YYYY-MM-DD)
+        :param end: the last day (datetime.date or YYYY-MM-DD)
+        :return: a tuple of the dictionary of consumed nutrients and the number of days with entries
+        """
+
+        user_id = self.ids['user'].get(user)
+        columns = self._read_columns(0, self.size)
+        keep = (columns['user'] == user_id) & (columns['day'] >= to_day(start)) & (columns['day'] <= to_day(end))
+        totals = self._nutrients(columns['label'][keep], columns['servings'][keep]).sum(axis=0)
+
+        return dict(zip(self.catalog.nutrients, totals.tolist())), len(np.unique(columns['day'][keep]))
+
+    def window(self, user: str, window: str = 'week', date=None) -> tuple:
+        """
+        Returns the nutrients of a user over one of the rolling windows, without reading the log when the window ends on
+        the latest day of the user or later
+
+        :param user: name of the user
+        :param window: the name of the window (day, week or month)
+        :param date: the last day of the window (datetime.date or YYYY-MM-DD), today when not given
+        :return: a tuple of the dictionary of consumed nutrients and the number of days with entries
+        """
+
+        if window not in WINDOWS:
+            raise ValueError(f'The window should be one of {", ".join(WINDOWS)}')
+
+        day = to_day(date)
+        rolling = self.totals.get(user)
+        if rolling is None:
+            return dict.fromkeys(self.catalog.nutrients, 0.0), 0
+
+        # windows that end before the latest day of the user are added up from the log
+        if day < rolling.last:
+            first = datetime.date.fromordinal(day - WINDOWS[window] + 1)
+            return self.history(user, first, datetime.date.fromordinal(day))
+
+        totals, count = rolling.window(window, day)
+        return dict(zip(self.catalog.nutrients, totals.tolist())), count
+
+    def daily_average(self, user: str, window: str = 'week', date=None) -> dict:
+        """
+        :param user: name of the user
+        :param window: the name of the window (day, week or month)
+        :param date: the last day of the window (datetime.date or YYYY-MM-DD), today when not given
+        :return: a dictionary of the nutrients consumed per day, over the days of the window that have entries
+        """
+
+        totals, count = self.window(user, window, date)
+        return {nutrient: value / count if count else 0.0 for nutrient, value in totals.items()}
+
+
+# logs that have already been opened, so that a process only reads each log once and then keeps its totals up to date
+_logs = dict()
+
+
+def load_log(path: str = 'consumption_log') -> ConsumptionLog:
+    """
+    Returns the shared consumption log of a directory, opening it only the first time it is asked for. The entries that
+    other processes add later are read when an entry is appended
+
+    :param path: path of the directory of the log
+    :return: the log of the directory
+    """
+
+    if path not in _logs:
+        _logs[path] = ConsumptionLog(path)
+
+    return _logs[path]
@@ -0,0 +1,70 @@
+import numpy as np
+
+from catalog import FoodCatalog
+from nutrient_engine import catalog_matrix
+
+
+# the ranks of every nutrient of the catalogs, so that a catalog is only ranked again after dishes are added to it
+_ranks = dict()
+
+
+def rank_matrix(catalog: FoodCatalog) -> np.ndarray:
+    """
+    :param catalog: catalog of the dishes
+    :return: the rank of each dish for each nutrient of the catalog, one column per nutrient, as given by rank()
+    """
+
+    ranks = _ranks.get(catalog.path)
+    if ranks is None or ranks[0] is not catalog or len(ranks[1]) != len(catalog):
+        ranks = _ranks[catalog.path] = (catalog, np.column_stack([np.asarray(catalog.rank(nutrient))
+                                                                  for nutrient in catalog.nutrients]))
+
+    return ranks[1]
+
+
+def advice_contributors(current_s: dict, consumption: dict, catalog: FoodCatalog, k: int = 1) -> dict:
+    """
+    Ranks the dishes consumed by the user for every nutrient of the catalog at once and returns the best k of each, in
+    the direction of its excess or deficit. When a nutrient is in excess, the dishes are ranked by how much of it they
+    add to the day (value per serving times servings), since reducing those helps the most. When it is in deficit, they
+    are ranked by value per serving, since one more serving of those helps the most. Ties go to the dish with the higher
+    value per serving and then to the dish listed first in the file. Only the consumed dishes are looked at, so the time
+    depends on the size of the consumption and not of the catalog
+
+    :param current_s: dictionary containing excess/deficit nutrients of current diet
+    :param consumption: dictionary containing food labels and serving amount
+    :param catalog: catalog of the dishes
+    :param k: number of dishes to return for each nutrient
+    :return: a dictionary with a list of up to k dictionaries for each nutrient, with the label, name, value per
+             serving, servings and total of each dish
+    """
+
+    nutrients = catalog.nutrients
+    consumed = [(catalog.index[food_label], serving) for food_label, serving in consumption.items()
+                if food_label in catalog.index]
+    if not consumed or k <= 0:
+        return {nutrient: [] for nutrient in nutrients}
+
+    # the values per serving, the totals of the day and the ranks of the consumed dishes, one column per nutrient
+    rows, servings = zip(*consumed)
+    values = catalog_matrix(catalog)[list(rows)]
+    ranks = rank_matrix(catalog)[list(rows)]
+    totals = values * np.array(servings, dtype=np.float64)[:, None]
+
+    # the order of the dishes for every nutrient at once: the dishes that contain the nutrient first, then by total in
+    # excess, then by rank
+    excess = np.array([current_s[nutrient] > 0 for nutrient in nutrients])
+    contained = values > 0
+    order = np.lexsort((ranks, np.where(excess, -totals, 0.0), ~contained), axis=0)[:k].T.tolist()
+
+    # only the dishes that contain the nutrient at all are named
+    counts = contained.sum(axis=0).tolist()
+
+    result = dict()
+    for nutrient, best, count in zip(nutrients, order, counts):
+        column = catalog.columns[nutrient]
+        result[nutrient] = [{'label': catalog.labels[i], 'name': catalog.names[i], 'value': column[i],
+                             'servings': serving, 'total': column[i] * serving}
+                            for i, serving in (consumed[r] for r in best[:count])]
+
+    return result
@@ -0,0 +1,110 @@
+import numpy as np
+
+from catalog_file import load_columns
+
+
+class ExerciseTable:
+    """
+    Holds exercises.csv in memory as an array with one row per exercise and one column per body weight of the header.
+    The calories an exercise burns are interpolated linearly between the weights of the table, so that a user is not
+    snapped to the closest of the three columns
+    """
+
+    __slots__ = ('path', 'ids', 'names', 'weights', 'burn', 'index')
+
+    def __init__(self, path: str = 'exercises.csv'):
+        """
+        Loads the exercises from the compiled form of the csv file
+
+        :param path: path of the csv file that contains list of exercises and the calories they burn in one hour
+        """
+
+        header, self.ids, self.names, columns = load_columns(path, 'exercise')
+        self.path = path
+
+        # the body weights (in pounds) of the numeric columns and the calories burned in one hour at each of them,
+        # sorted from the lightest to the heaviest weight
+        weights = np.array([float(weight) for weight in header[2:]])
+        order = np.argsort(weights)
+        self.weights = weights[order]
+        self.burn = np.column_stack([np.frombuffer(columns[j], dtype=np.float64) for j in order])
+
+        # a dictionary that contains the row of each exercise number
+        self.index = dict(zip(self.ids, range(len(self.ids))))
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __contains__(self, exercise_id) -> bool:
+        return str(exercise_id) in self.index
+
+    def rates(self, weight) -> np.ndarray:
+        """
+        Calculates the calories every exercise burns in one hour for one or more body weights. Between two weights of
+        the table the value is interpolated linearly, and outside the table it is scaled in proportion to the weight
+        from the closest column
+
+        :param weight: body weight in pounds, or an array of them
+        :return: array with one row for each weight and one column for each exercise
+        """
+
+        weight = np.atleast_1d(np.asarray(weight, dtype=np.float64))
+        weights = self.weights
+
+        # the two columns around each weight
+        upper = np.clip(np.searchsorted(weights, weight), 1, len(weights) - 1)
+        lower = upper - 1
+        fraction = (weight - weights[lower]) / (weights[upper] - weights[lower])
+
+        rates = self.burn[:, lower] + fraction * (self.burn[:, upper] - self.burn[:, lower])
+
+        # weights outside the table are scaled from the lightest or heaviest column
+        below = weight < weights[0]
+        above = weight > weights[-1]
+        rates[:, below] = self.burn[:, :1] * (weight[below] / weights[0])
+        rates[:, above] = self.burn[:, -1:] * (weight[above] / weights[-1])
+
+        return rates.T
+
+    def minutes(self, cal, weight) -> np.ndarray:
+        """
+        Calculates how many minutes every exercise has to be done to burn excess calories, for many users at once
+
+        :param cal: excess calories, or an array of them
+        :param weight: body weight in pounds, or an array of them with the same length as cal
+        :return: array with one row for each user and one column for each exercise
+        """
+
+        cal = np.atleast_1d(np.asarray(cal, dtype=np.float64))
+        return 60 * cal[:, None] / self.rates(weight)
+
+    def exercise_minutes(self, exercise_id, cal: float, weight: float) -> float:
+        """
+        Calculates how many minutes one exercise has to be done to burn excess calories
+
+        :param exercise_id: number of the exercise
+        :param cal: excess calories
+        :param weight: body weight in pounds
+        :return: the number of minutes
+        """
+
+        i = self.index[str(exercise_id)]
+        return float(self.minutes(cal, weight)[0, i])
+
+
+# tables that have already been loaded, so that a session only loads each file once
+_tables = dict()
+
+
+def load_exercise_table(path: str = 'exercises.csv') -> ExerciseTable:
+    """
+    Returns the shared exercise table of the csv file, loading it only the first time it is asked for
+
+    :param path: path of the csv file that contains list of exercises and the calories they burn in one hour
+    :return: the exercise table of the file
+    """
+
+    if path not in _tables:
+        _tables[path] = ExerciseTable(path)
+
+    return _tables[path]
@@ -0,0 +1,159 @@
+import os
+import re
+
+from instrumentation import record_io
+
+try:
+    import fcntl
+except ImportError:
+    # windows has no fcntl, so msvcrt is used to lock the file instead
+    fcntl = None
+    import msvcrt
+
+
+# file extension of the label counter, added to the path of the csv file
+COUNTER_EXTENSION = '.counter'
+
+# the form of the labels of dishes added by users
+USER_LABEL = re.compile(r'U(\d+)$')
+
+
+def _lock(fh, shared: bool = False):
+    """
+    Blocks until this process holds the lock of an open file
+
+    :param fh: open file to lock
+    :param shared: whether to take a shared lock, which only waits for exclusive locks (windows has no shared locks,
+                   so the lock is always exclusive there)
+    """
+
+    if fcntl is not None:
+        fcntl.flock(fh.fileno(), fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+    else:
+        fh.seek(0)
+        msvcrt.locking(fh.fileno(), msvcrt.LK_LOCK, 1)
+
+
+def _unlock(fh):
+    """
+    Releases the lock taken by _lock()
+
+    :param fh: open file to unlock
+    """
+
+    if fcntl is not None:
+        fcntl.flock(fh.fileno(), fcntl.LOCK_UN)
+    else:
+        fh.seek(0)
+        msvcrt.locking(fh.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def _scan_last_number(fh) -> int:
+    """
+    Finds the highest number of the user labels (U1, U2, ...) by reading the whole csv file. This is only needed when
+    the label counter is missing or the file was changed without it
+
+    :param fh: csv file opened in binary mode
+    :return: the highest number, 0 if there is no user label
+    """
+
+    fh.seek(0)
+    last_number = 0
+
+    for line in fh:
+        record_io(len(line), 1)
+        match = USER_LABEL.match(line.split(b',')[0].strip().decode())
+        if match:
+            last_number = max(last_number, int(match.group(1)))
+
+    return last_number
+
+
+def _read_counter(counter_path: str, size: int):
+    """
+    Reads the label counter of a csv file. The counter stores the size of the csv file when it was written, so a counter
+    that does not match the current size is ignored
+
+    :param counter_path: path of the label counter
+    :param size: current size of the csv file
+    :return: the highest number of the user labels, or None if the counter cannot be used
+    """
+
+    try:
+        with open(counter_path, 'r') as fh:
+            last_number, counted_size = (int(field) for field in fh.read().split())
+    except (OSError, ValueError):
+        return None
+
+    if counted_size != size:
+        return None
+
+    return last_number
+
+
+def _write_counter(counter_path: str, last_number: int, size: int):
+    """
+    Stores the label counter of a csv file, replacing the old counter at once
+
+    :param counter_path: path of the label counter
+    :param last_number: highest number of the user labels
+    :param size: size of the csv file after the last append
+    """
+
+    tmp_path = f'{counter_path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w') as fh:
+        fh.write(f'{last_number} {size}\n')
+
+    os.replace(tmp_path, counter_path)
+
+
+def append_foods(foods: list, path: str = 'food_nutrition.csv') -> list:
+    """
+    Appends one or more dishes to the csv file in a single write and gives each of them the next free user label. The
+    csv file is locked while the labels are allocated and written, so dishes added at the same time by several
+    processes never share a label or mix their lines
+
+    :param foods: list of tuples of the name of each dish followed by its value per serving of each nutrient column of
+                  the csv file, in the order of the columns of its header (the nutrients of the catalog)
+    :param path: path of the csv file that contains list of food and their nutritional values
+    :return: the labels of the new dishes, in the order of foods
+    """
+
+    if len(foods) == 0:
+        return []
+
+    # checks the dishes before anything is written
+    for food in foods:
+        if ',' in food[0] or '\n' in food[0] or food[0].strip() == '':
+            raise ValueError(f'The name of the dish {food[0]!r} should not be empty or contain commas or newlines')
+
+    counter_path = path + COUNTER_EXTENSION
+
+    # the file is opened for appending so that it is never truncated, and read from only to allocate labels
+    with open(path, 'ab+') as fh:
+        _lock(fh)
+        try:
+            size = fh.seek(0, os.SEEK_END)
+
+            last_number = _read_counter(counter_path, size)
+            if last_number is None:
+                last_number = _scan_last_number(fh)
+
+            labels = [f'U{last_number + i}' for i in range(1, len(foods) + 1)]
+            lines = [', '.join([label, food[0].strip()] + [str(float(value)) for value in food[1:]])
+                     for label, food in zip(labels, foods)]
+
+            # the csv file does not end with a newline, so each new line starts with one
+            if size > 0:
+                fh.seek(size - 1)
+                if fh.read(1) != b'\n':
+                    lines.insert(0, '')
+
+            fh.write('\n'.join(lines).encode())
+            fh.flush()
+
+            _write_counter(counter_path, last_number + len(foods), fh.tell())
+        finally:
+            _unlock(fh)
+
+    return labels
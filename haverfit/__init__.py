@@ -0,0 +1,49 @@
+import argparse
+import importlib
+import os
+import sys
+
+
+# the subcommands, with the module whose main() runs each one and its description. A module is only imported when its
+# subcommand runs, so that a subcommand does not wait for the modules (and numpy) of the others
+COMMANDS = {'interactive': ('main', 'ask about the profile and the dishes of the user and give advice (default)'),
+            'batch': ('batch', 'score profiles and food logs from a JSON lines or csv file'),
+            'serve': ('server', 'serve the calculations over HTTP'),
+            'compile-catalog': ('catalog_file', 'check catalog csv files and compile them into binary form'),
+            'stats': ('population_stats', 'summarize the results of the batch mode over a population'),
+            'venues': ('venues', 'split the dishes of a venue into shards'),
+            'load-test': ('load_test', 'replay recorded sessions of the interactive program'),
+            'benchmark': ('benchmark', 'time each stage of the pipeline and the startup of the subcommands')}
+
+# the directory of the modules of the subcommands, next to this package, so that they are found from any directory
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def main(argv: list = None) -> int:
+    """
+    Command line entry point of python -m haverfit. Runs the main() of the module of a subcommand with the rest of the
+    arguments, or the interactive program with every argument when the first one is not a subcommand
+
+    :param argv: command line arguments, sys.argv is used when not given
+    :return: exit status
+    """
+
+    commands = '\n'.join(f'  {name:<17} {description}' for name, (module, description) in COMMANDS.items())
+    parser = argparse.ArgumentParser(prog='haverfit', description='Haverfit helps the students of Haverford College '
+                                                                  'with their eating habits.',
+                                     epilog=f'subcommands:\n{commands}\n\nRun haverfit <subcommand> --help for the '
+                                            f'options of a subcommand.',
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('command', nargs='?', default='interactive', choices=COMMANDS, metavar='subcommand',
+                        help='the subcommand to run (default: interactive)')
+    parser.add_argument('args', nargs=argparse.REMAINDER, help='the arguments of the subcommand')
+
+    argv = sys.argv[1:] if argv is None else list(argv)
+    if argv and argv[0] not in COMMANDS and argv[0] not in ('-h', '--help'):
+        argv = ['interactive'] + argv
+    args = parser.parse_args(argv)
+
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)
+
+    return importlib.import_module(COMMANDS[args.command][0]).main(args.args)
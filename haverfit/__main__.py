@@ -0,0 +1,6 @@
+import sys
+
+from haverfit import main
+
+
+sys.exit(main())
@@ -0,0 +1,239 @@
+import cProfile
+import json
+import os
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+
+
+# the stages that are currently being measured by each thread, innermost last, so that sessions running side by side
+# only count their own reads
+_active = threading.local()
+
+
+class StageRecord:
+    """
+    The measurements of one run of one stage: wall time, cpu time, bytes read from files and rows read or processed
+    """
+
+    __slots__ = ('stage', 'wall', 'cpu', 'bytes_read', 'rows')
+
+    def __init__(self, stage: str):
+        """
+        :param stage: name of the stage
+        """
+
+        self.stage = stage
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.bytes_read = 0
+        self.rows = 0
+
+    def as_dict(self) -> dict:
+        """
+        :return: the measurements as a dictionary
+        """
+
+        return {'stage': self.stage, 'wall': self.wall, 'cpu': self.cpu, 'bytes_read': self.bytes_read,
+                'rows': self.rows}
+
+
+def record_io(bytes_read: int = 0, rows: int = 0):
+    """
+    Adds bytes read and rows to every stage that is being measured. Called by the functions that read the catalog
+    files, and does nothing when no stage is being measured
+
+    :param bytes_read: number of bytes read from a file
+    :param rows: number of rows read or processed
+    """
+
+    for record in getattr(_active, 'stages', ()):
+        record.bytes_read += bytes_read
+        record.rows += rows
+
+
+class Instrumentation:
+    """
+    Measures the stages of a pipeline. Callbacks receive the StageRecord of every finished stage, and around hooks
+    return a context manager that is entered around every stage, for example to profile it. The totals of every stage
+    can be written in the Prometheus text format
+    """
+
+    __slots__ = ('callbacks', 'around', 'totals')
+
+    def __init__(self, callbacks: list = None, around: list = None):
+        """
+        :param callbacks: functions called with the StageRecord of every finished stage
+        :param around: functions called with the name of a stage that return a context manager to run it in
+        """
+
+        self.callbacks = list(callbacks or [])
+        self.around = list(around or [])
+
+        # the runs and summed measurements of each stage
+        self.totals = dict()
+
+    def add_callback(self, callback):
+        """
+        :param callback: function called with the StageRecord of every finished stage
+        """
+
+        self.callbacks.append(callback)
+
+    def add_around(self, factory):
+        """
+        :param factory: function called with the name of a stage that returns a context manager to run it in
+        """
+
+        self.around.append(factory)
+
+    @contextmanager
+    def stage(self, name: str):
+        """
+        Measures the code run inside the with block as one stage. The wall time includes the time spent waiting for
+        the user to answer, the cpu time does not
+
+        :param name: name of the stage
+        :return: the StageRecord of the stage, so that the block can add rows it processed
+        """
+
+        record = StageRecord(name)
+        stages = _active.__dict__.setdefault('stages', [])
+        stages.append(record)
+
+        # a stage that raises an exception is still measured
+        try:
+            with ExitStack() as stack:
+                for factory in self.around:
+                    stack.enter_context(factory(name))
+
+                wall = time.perf_counter()
+                cpu = time.process_time()
+                try:
+                    yield record
+                finally:
+                    record.wall = time.perf_counter() - wall
+                    record.cpu = time.process_time() - cpu
+                    stages.remove(record)
+        finally:
+            self._finish(record)
+
+    def _finish(self, record: StageRecord):
+        """
+        Adds a finished stage to the totals and passes it to the callbacks
+
+        :param record: the measurements of the stage
+        """
+
+        totals = self.totals.setdefault(record.stage, {'runs': 0, 'wall': 0.0, 'cpu': 0.0, 'bytes_read': 0, 'rows': 0})
+        totals['runs'] += 1
+        totals['wall'] += record.wall
+        totals['cpu'] += record.cpu
+        totals['bytes_read'] += record.bytes_read
+        totals['rows'] += record.rows
+
+        for callback in self.callbacks:
+            callback(record)
+
+    def prometheus(self) -> str:
+        """
+        Returns the totals of every stage in the Prometheus text exposition format
+
+        :return: the metrics as text
+        """
+
+        metrics = (('runs', 'haverfit_stage_runs_total', 'Number of runs of the stage'),
+                   ('wall', 'haverfit_stage_wall_seconds_total', 'Wall time spent in the stage'),
+                   ('cpu', 'haverfit_stage_cpu_seconds_total', 'CPU time spent in the stage'),
+                   ('bytes_read', 'haverfit_stage_read_bytes_total', 'Bytes read from files in the stage'),
+                   ('rows', 'haverfit_stage_rows_total', 'Rows read or processed in the stage'))
+        lines = []
+
+        for key, metric, description in metrics:
+            lines.append(f'# HELP {metric} {description}')
+            lines.append(f'# TYPE {metric} counter')
+            for stage, totals in self.totals.items():
+                lines.append(f'{metric}{{stage="{stage}"}} {totals[key]}')
+
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, path: str):
+        """
+        Writes the totals of every stage into a Prometheus text file, replacing it at once so that a collector never
+        reads half of it
+
+        :param path: path of the text file
+        """
+
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as fh:
+            fh.write(self.prometheus())
+
+        os.replace(tmp_path, path)
+
+
+class JsonLinesSink:
+    """
+    Callback that appends every finished stage to a JSON lines file
+    """
+
+    __slots__ = ('path',)
+
+    def __init__(self, path: str):
+        """
+        :param path: path of the JSON lines file
+        """
+
+        self.path = path
+
+    def __call__(self, record: StageRecord):
+        with open(self.path, 'a') as fh:
+            fh.write(json.dumps(dict(record.as_dict(), time=time.time(), pid=os.getpid())) + '\n')
+
+
+def cprofile_around(directory: str):
+    """
+    Returns an around hook that runs every stage under cProfile and writes its statistics to directory/<stage>.prof
+
+    :param directory: directory for the statistics files
+    :return: the around hook
+    """
+
+    os.makedirs(directory, exist_ok=True)
+
+    @contextmanager
+    def profile(name: str):
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            profiler.dump_stats(os.path.join(directory, f'{name}.prof'))
+
+    return profile
+
+
+def from_environment():
+    """
+    Creates the instrumentation asked for by environment variables: HAVERFIT_METRICS_JSONL (JSON lines file of every
+    stage), HAVERFIT_METRICS_PROM (Prometheus text file of the totals) and HAVERFIT_PROFILE_DIR (cProfile statistics of
+    every stage)
+
+    :return: a tuple of the instrumentation and the Prometheus path, or (None, None) when nothing was asked for
+    """
+
+    jsonl_path = os.environ.get('HAVERFIT_METRICS_JSONL')
+    prom_path = os.environ.get('HAVERFIT_METRICS_PROM')
+    profile_dir = os.environ.get('HAVERFIT_PROFILE_DIR')
+
+    if not (jsonl_path or prom_path or profile_dir):
+        return None, None
+
+    instrumentation = Instrumentation()
+    if jsonl_path:
+        instrumentation.add_callback(JsonLinesSink(jsonl_path))
+    if profile_dir:
+        instrumentation.add_around(cprofile_around(profile_dir))
+
+    return instrumentation, prom_path
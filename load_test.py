@@ -0,0 +1,266 @@
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import catalog
+import consumption_log
+import exercise_table
+from console import ScriptedConsole, using
+from instrumentation import Instrumentation
+from main import user_interface
+
+
+# percentiles of the latencies that are reported
+PERCENTILES = (50, 90, 99)
+
+# number of sessions replayed at the same time by default, like a row of kiosks
+CONCURRENCY = 8
+
+# files of the program that a session reads and writes, copied into the working directory of the replay
+DATA_FILES = ('food_nutrition.csv', 'exercises.csv')
+
+
+def read_scripts(path: str) -> list:
+    """
+    Reads recorded session scripts from a JSON lines file. Each line is the list of answers of one session, or a
+    dictionary with that list under answers and optionally the options of user_interface() under options, like the
+    lines written by main.py when HAVERFIT_RECORD_SESSION is set
+
+    :param path: path of the JSON lines file
+    :return: a list of (answers, options) tuples, one for each session
+    """
+
+    scripts = []
+    with open(path, 'r') as fh:
+        for number, line in enumerate(fh, 1):
+            # skips empty lines
+            if line.strip() == '':
+                continue
+
+            script = json.loads(line)
+            options = dict()
+            if isinstance(script, dict):
+                script, options = script.get('answers'), script.get('options') or dict()
+            if not isinstance(script, list):
+                raise ValueError(f'{path}, line {number}: expected a list of answers')
+            if not isinstance(options, dict):
+                raise ValueError(f'{path}, line {number}: the options should be a dictionary')
+            scripts.append(([str(answer) for answer in script], options))
+
+    return scripts
+
+
+class SessionResult:
+    """
+    The measurements of one replayed session: the latency of each prompt, the wall time and bytes read of each stage,
+    the wall time of the whole session and the error that stopped it, if any
+    """
+
+    __slots__ = ('prompts', 'stages', 'wall', 'error')
+
+    def __init__(self, prompts: list, stages: list, wall: float, error: str = None):
+        """
+        :param prompts: list of (prompt, seconds) tuples
+        :param stages: list of (stage, seconds, bytes read) tuples
+        :param wall: seconds of the whole session
+        :param error: the error that stopped the session, None when it finished
+        """
+
+        self.prompts = prompts
+        self.stages = stages
+        self.wall = wall
+        self.error = error
+
+
+def replay(answers: list, options: dict = None) -> SessionResult:
+    """
+    Runs the whole interactive program once with the answers of a session script, without showing its text
+
+    :param answers: answers given to the prompts, in order
+    :param options: the options of user_interface() the session was recorded with
+    :return: the measurements of the session
+    """
+
+    console = ScriptedConsole(answers, keep_output=False)
+    stages = []
+    instrumentation = Instrumentation([lambda record: stages.append((record.stage, record.wall, record.bytes_read))])
+    error = None
+
+    start = time.perf_counter()
+    try:
+        with using(console):
+            user_interface(instrumentation, **(options or dict()))
+
+    # a session that fails is counted, and the others go on
+    except (EOFError, AssertionError, LookupError, TypeError, ValueError) as exception:
+        error = f'{type(exception).__name__}: {exception}'
+
+    return SessionResult(console.latencies, stages, time.perf_counter() - start, error)
+
+
+def run_load(scripts: list, sessions: int, concurrency: int = CONCURRENCY) -> tuple:
+    """
+    Replays the session scripts in turn until the given number of sessions ran, with several sessions at the same
+    time in threads of this process, so that they share the catalogs like the sessions of one kiosk machine
+
+    :param scripts: (answers, options) tuples of the session scripts, as returned by read_scripts()
+    :param sessions: number of sessions to replay
+    :param concurrency: number of sessions replayed at the same time
+    :return: a tuple of the list of SessionResult and the seconds the whole load took
+    """
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(lambda script: replay(*script), (scripts[i % len(scripts)] for i in range(sessions))))
+
+    return results, time.perf_counter() - start
+
+
+def latency_table(samples: dict) -> dict:
+    """
+    :param samples: dictionary of the name of each prompt or stage and a list of its latencies in seconds
+    :return: a dictionary with the count, the percentiles and the largest latency of each name, in milliseconds
+    """
+
+    table = dict()
+    for name, values in samples.items():
+        values = np.array(values) * 1000
+        table[name] = {'count': len(values), **{f'p{p}': q for p, q in zip(PERCENTILES,
+                                                                          np.percentile(values, PERCENTILES).tolist())},
+                       'max': float(values.max())}
+
+    return table
+
+
+def summarize(results: list, seconds: float) -> dict:
+    """
+    Gathers the latencies of every prompt and stage of the replayed sessions
+
+    :param results: list of SessionResult
+    :param seconds: seconds the whole load took
+    :return: a dictionary with the number of sessions, the failures, the sessions per second and the latency tables
+             of the sessions, the prompts and the stages, with the mean bytes read by each stage
+    """
+
+    prompts = dict()
+    stages = dict()
+    bytes_read = dict()
+    errors = dict()
+
+    for result in results:
+        for prompt, latency in result.prompts:
+            prompts.setdefault(prompt, []).append(latency)
+        for stage, latency, read in result.stages:
+            stages.setdefault(stage, []).append(latency)
+            bytes_read[stage] = bytes_read.get(stage, 0) + read
+        if result.error is not None:
+            errors[result.error] = errors.get(result.error, 0) + 1
+
+    stage_table = latency_table(stages)
+    for stage, row in stage_table.items():
+        row['bytes_read'] = bytes_read[stage] / row['count']
+
+    return {'sessions': len(results), 'failed': sum(errors.values()), 'errors': errors, 'seconds': seconds,
+            'sessions_per_second': len(results) / seconds if seconds > 0 else None,
+            'session': latency_table({'session': [result.wall for result in results]})['session'] if results else None,
+            'prompts': latency_table(prompts), 'stages': stage_table}
+
+
+def print_summary(summary: dict):
+    """
+    Prints the latencies of the prompts and the stages as tables
+
+    :param summary: dictionary returned by summarize()
+    """
+
+    print(f"{summary['sessions']} sessions in {summary['seconds']:.2f} s ({summary['sessions_per_second']:.1f} per "
+          f"second), {summary['failed']} failed")
+    for error, count in summary['errors'].items():
+        print(f'  {count} x {error}')
+
+    columns = ''.join(f'{f"p{p}":>10}' for p in PERCENTILES) + f'{"max":>10}'
+    for title, table in (('session', {'session': summary['session']}), ('stage', summary['stages']),
+                         ('prompt', summary['prompts'])):
+        if not table or None in table.values():
+            continue
+
+        extra = f'{"KB read":>10}' if title == 'stage' else ''
+        print(f'\n{title:<60}{"count":>8}{columns}{extra}   (ms)')
+        for name, row in table.items():
+            name = name if len(name) <= 58 else name[:55] + '...'
+            line = f"{name:<60}{row['count']:>8}" + ''.join(f"{row[f'p{p}']:>10.3f}" for p in PERCENTILES)
+            line += f"{row['max']:>10.3f}"
+            if title == 'stage':
+                line += f"{row['bytes_read'] / 1024:>10.1f}"
+            print(line)
+
+
+def main(argv: list = None) -> int:
+    """
+    Command line entry point of the load test. Replays the session scripts in a copy of the data files, so that the
+    dishes added and the consumption saved by the sessions do not change the real ones
+
+    :param argv: command line arguments, sys.argv is used when not given
+    :return: exit status
+    """
+
+    parser = argparse.ArgumentParser(prog='haverfit load-test', description='Replays recorded sessions of the '
+                                                                            'interactive program and reports the '
+                                                                            'latency of every prompt and stage.')
+    parser.add_argument('scripts', help='JSON lines file of session scripts, one list of answers per line')
+    parser.add_argument('-n', '--sessions', type=int, default=100, help='number of sessions to replay (default: 100)')
+    parser.add_argument('-c', '--concurrency', type=int, default=CONCURRENCY, help='number of sessions replayed at '
+                                                                                   'the same time (default: '
+                                                                                   f'{CONCURRENCY})')
+    parser.add_argument('--data', default='.', help='directory of food_nutrition.csv and exercises.csv (default: the '
+                                                    'current directory)')
+    parser.add_argument('--json', help='file to write the summary to as JSON')
+    args = parser.parse_args(argv)
+
+    try:
+        scripts = read_scripts(args.scripts)
+    except FileNotFoundError:
+        print(f'The file {args.scripts} does not exist', file=sys.stderr)
+        return 1
+    except ValueError as error:
+        print(error, file=sys.stderr)
+        return 1
+
+    if not scripts:
+        print(f'The file {args.scripts} has no session', file=sys.stderr)
+        return 1
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as workdir:
+        for name in DATA_FILES:
+            if os.path.exists(os.path.join(args.data, name)):
+                shutil.copy(os.path.join(args.data, name), workdir)
+
+        # the sessions read the files relative to the current directory, and start with nothing loaded
+        catalog._catalogs.clear()
+        consumption_log._logs.clear()
+        exercise_table._tables.clear()
+        os.chdir(workdir)
+        try:
+            summary = summarize(*run_load(scripts, args.sessions, args.concurrency))
+        finally:
+            os.chdir(cwd)
+
+    print_summary(summary)
+
+    if args.json:
+        with open(args.json, 'w') as fh:
+            json.dump(summary, fh, indent=1)
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,17 +1,98 @@
+import argparse
+import os
+import sys
+
 import access_file as a
+from console import RecordingConsole, say, using
+from instrumentation import Instrumentation, from_environment
+
 
+def user_interface(instrumentation: Instrumentation = None, prometheus_path: str = None, log_path: str = None,
+                   plan: bool = False, substitutes: int = 0):
+    """
+    Runs the whole program, measuring each of its stages
 
-def user_interface():
-    print('''Welcome to Haverfit.
+    :param instrumentation: instrumentation that measures the stages, a new one without hooks is used when not given
+    :param prometheus_path: path of a Prometheus text file to write the totals of the stages to at the end
+    :param log_path: directory of the consumption log, the user is only offered to save their consumption when given
+    :param plan: whether to offer a meal plan that fits the ideal nutrients at the end
+    :param substitutes: number of dishes suggested in place of every dish named for a nutrient in excess
+    """
+
+    if log_path is None:
+        say('''Welcome to Haverfit.
 This program provides you with information about how healthy you are currently eating. But for this to happen, it needs 
 some information from you. Don't worry, this program does not store any private information. :)''')
+    else:
+        say(f'''Welcome to Haverfit.
+This program provides you with information about how healthy you are currently eating. But for this to happen, it needs 
+some information from you. Don't worry, nothing you enter is stored unless you choose to save your consumption at the 
+end, which keeps your name and the dishes you ate in the {log_path} directory. :)''')
+
+    if instrumentation is None:
+        instrumentation = Instrumentation()
+
+    with instrumentation.stage('user_information_and_cal'):
+        ideal_cal = a.user_information_and_cal()
+    with instrumentation.stage('calculating_ideal_nutrients'):
+        ideal_nutrients = a.calculating_ideal_nutrients(ideal_cal)
+    with instrumentation.stage('display_and_receive_food'):
+        consumption = a.display_and_receive_food()
+    with instrumentation.stage('calculating_nutrients') as stage:
+        current_nutrients = a.calculating_nutrients(consumption)
+        stage.rows += len(consumption)
+    with instrumentation.stage('comparing_nutrients'):
+        current_status = a.comparing_nutrients(ideal_nutrients, current_nutrients)
+    with instrumentation.stage('advice') as stage:
+        a.advice(current_status, consumption, swaps=substitutes)
+        stage.rows += len(consumption)
+    if log_path is not None:
+        with instrumentation.stage('log_consumption') as stage:
+            a.log_consumption(consumption, ideal_nutrients, path=log_path)
+            stage.rows += len(consumption)
+    if plan:
+        with instrumentation.stage('meal_plan'):
+            a.meal_plan(ideal_nutrients)
+
+    if prometheus_path:
+        instrumentation.write_prometheus(prometheus_path)
+
+
+def main(argv: list = None) -> int:
+    """
+    Command line entry point of the interactive program
+
+    :param argv: command line arguments, sys.argv is used when not given
+    :return: exit status
+    """
+
+    parser = argparse.ArgumentParser(prog='haverfit interactive', description='Asks about the profile and the dishes '
+                                                                              'of the user and gives advice.')
+    parser.add_argument('--record', default=os.environ.get('HAVERFIT_RECORD_SESSION'),
+                        help='JSON lines file to append the answers of the session to, so that load_test.py can '
+                             'replay it (default: HAVERFIT_RECORD_SESSION)')
+    parser.add_argument('--log', nargs='?', const='consumption_log', metavar='DIRECTORY',
+                        help='offer to save the consumption of the user to the consumption log of a directory '
+                             '(default directory: consumption_log)')
+    parser.add_argument('-s', '--substitutes', type=int, default=0, help='number of dishes to suggest in place of '
+                                                                         'every dish named for a nutrient in excess '
+                                                                         '(default: 0)')
+    parser.add_argument('--plan', action='store_true', help='offer a meal plan that fits the ideal nutrients at the '
+                                                            'end')
+    args = parser.parse_args(argv)
+
+    # the stages that only run when asked for, which a recorded session needs again to be replayed
+    options = {'log_path': args.log, 'plan': args.plan, 'substitutes': args.substitutes}
+
+    if args.record:
+        with using(RecordingConsole()) as console:
+            user_interface(*from_environment(), **options)
+        console.save(args.record, {name: value for name, value in options.items() if value})
+    else:
+        user_interface(*from_environment(), **options)
 
-    ideal_cal = a.user_information_and_cal()
-    ideal_nutrients = a.calculating_ideal_nutrients(ideal_cal)
-    consumption = a.display_and_receive_food()
-    current_nutrients = a.calculating_nutrients(consumption)
-    current_status = a.comparing_nutrients(ideal_nutrients, current_nutrients)
-    a.advice(current_status, consumption)
+    return 0
 
 
-user_interface()
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,193 @@
+import numpy as np
+
+from catalog import FoodCatalog
+from nutrient_engine import NutrientEngine
+from substitutes import SubstitutionIndex
+
+
+# largest number of servings of one dish in a plan
+MAX_SERVINGS = 3
+
+# catalogs with more dishes than this compare each serving only with the dishes nearest to what is missing
+POOL_SIZE = 4096
+
+# number of dishes nearest to what is missing that are compared for each serving of a large catalog
+SHORTLIST = 32
+
+# largest number of values calculated at once
+BLOCK_SIZE = 1 << 22
+
+
+class MealPlanner:
+    """
+    Builds serving plans that fill the ideal ranges of nutrients. The plan starts empty and greedily adds the serving
+    that brings the nutrients of the day closest to their ranges, until no serving brings them closer. The distance is
+    measured like in the substitution index, with each nutrient divided by its standard deviation over the dishes.
+    Every user of a cohort takes one serving at each step, so the whole cohort is planned with a few matrix operations
+    per serving. Large catalogs only compare the dishes nearest to what each user is missing
+    """
+
+    __slots__ = ('catalog', 'sections', 'step', 'max_servings', 'rows', 'values', 'scale', 'index')
+
+    def __init__(self, catalog: FoodCatalog, sections: str = None, step: float = 1.0,
+                 max_servings: float = MAX_SERVINGS, matrix: np.ndarray = None):
+        """
+        :param catalog: catalog of the dishes
+        :param sections: first letters of the labels of the sections the dishes are chosen from (Example: BLD), after
+                         the venue of the labels that have one, every section when not given
+        :param step: the servings of a dish are multiples of step, 1 for whole servings and 0.5 for half servings
+        :param max_servings: largest number of servings of one dish
+        :param matrix: nutrient matrix of the catalog if it was already built, for example by a NutrientEngine
+        """
+
+        if step <= 0 or max_servings < step:
+            raise ValueError('step should be positive and not larger than max_servings')
+
+        # the sections of the catalog, after the venue of the labels that have one
+        known = {label.rpartition(':')[2][:1].upper() for label in catalog.labels}
+        unknown = sorted(set(sections.upper()) - known) if sections else ()
+        if unknown:
+            raise ValueError(f'the catalog has no section {", ".join(unknown)}, only {", ".join(sorted(known))}')
+
+        self.catalog = catalog
+        self.sections = sections.upper() if sections else None
+        self.step = step
+        self.max_servings = max_servings
+
+        matrix = NutrientEngine(catalog).matrix if matrix is None else matrix
+        if self.sections:
+            self.rows = np.array([i for i, label in enumerate(catalog.labels)
+                                  if label.rpartition(':')[2][:1] in self.sections], dtype=np.int64)
+        else:
+            self.rows = np.arange(len(catalog), dtype=np.int64)
+        self.values = matrix[self.rows]
+
+        # nutrients that are the same in every dish are not scaled
+        self.scale = self.values.std(axis=0) if len(self.values) else np.ones(len(catalog.nutrients))
+        self.scale[self.scale == 0] = 1.0
+
+        # the index of the dishes that can be chosen, only needed when they are too many to compare them all
+        self.index = None
+        if len(self.rows) > POOL_SIZE:
+            pool = FoodCatalog.from_columns(catalog.path, [catalog.labels[i] for i in self.rows],
+                                            [catalog.names[i] for i in self.rows], catalog.nutrients,
+                                            [self.values[:, j] for j in range(len(catalog.nutrients))])
+            self.index = SubstitutionIndex(pool, self.values)
+
+    def _cost(self, totals: np.ndarray, lower: np.ndarray, upper: np.ndarray) -> np.ndarray:
+        """
+        :param totals: nutrients of the day, the last axis being the nutrients
+        :param lower: lower bound of each nutrient, broadcast against totals
+        :param upper: upper bound of each nutrient, broadcast against totals
+        :return: the squared scaled distance of the nutrients from their ranges
+        """
+
+        outside = np.maximum(lower - totals, 0) + np.maximum(totals - upper, 0)
+        return ((outside / self.scale) ** 2).sum(axis=-1)
+
+    def plan(self, lower, upper) -> tuple:
+        """
+        Plans the servings of every user of a cohort
+
+        :param lower: lower bound of each nutrient of the catalog of each user, one row per user
+        :param upper: upper bound of each nutrient of each user, one row per user
+        :return: a tuple of the plans, as dictionaries of food labels and servings, and the nutrients of each plan
+        """
+
+        lower = np.atleast_2d(np.asarray(lower, dtype=np.float64))
+        upper = np.atleast_2d(np.asarray(upper, dtype=np.float64))
+        totals = np.zeros(lower.shape)
+
+        if len(self.rows) == 0 or len(lower) == 0:
+            return [dict() for _ in lower], totals
+
+        if self.index is None:
+            counts = self._plan_pool(lower, upper, totals)
+        else:
+            counts = self._plan_shortlist(lower, upper, totals)
+
+        labels = self.catalog.labels
+        plans = [{labels[self.rows[j]]: n * self.step for j, n in sorted(user_counts.items())}
+                 for user_counts in counts]
+
+        return plans, totals
+
+    def _plan_pool(self, lower: np.ndarray, upper: np.ndarray, totals: np.ndarray) -> list:
+        """
+        Compares every dish at each serving, a block of users at a time
+
+        :param lower: lower bounds of the users
+        :param upper: upper bounds of the users
+        :param totals: nutrients of the plans, updated in place
+        :return: the number of steps of servings of each dish, by position in the pool, for each user
+        """
+
+        counts = np.zeros((len(lower), len(self.rows)), dtype=np.int16)
+        limit = int(round(self.max_servings / self.step))
+        added = self.step * self.values
+        block = max(1, BLOCK_SIZE // (len(self.rows) * len(self.catalog.nutrients)))
+
+        active = np.arange(len(lower))
+        while active.size:
+            chosen = np.full(active.size, -1)
+
+            for start in range(0, active.size, block):
+                users = active[start:start + block]
+                cost = self._cost(totals[users, None, :] + added[None, :, :], lower[users, None, :],
+                                  upper[users, None, :])
+                cost[counts[users] >= limit] = np.inf
+
+                best = cost.argmin(axis=1)
+                better = cost[np.arange(len(users)), best] < self._cost(totals[users], lower[users], upper[users])
+                chosen[start:start + len(users)] = np.where(better, best, -1)
+
+            # the users that no serving brings closer to their ranges are done
+            keep = chosen >= 0
+            active, chosen = active[keep], chosen[keep]
+            counts[active, chosen] += 1
+            totals[active] += added[chosen]
+
+        return [{j: int(counts[user, j]) for j in np.flatnonzero(counts[user]).tolist()}
+                for user in range(len(lower))]
+
+    def _plan_shortlist(self, lower: np.ndarray, upper: np.ndarray, totals: np.ndarray) -> list:
+        """
+        Compares at each serving only the dishes nearest to what is missing. When every nutrient is below its range,
+        the serving that brings the day closest to the middle of the ranges is exactly the dish nearest to the missing
+        nutrients divided by the step
+
+        :param lower: lower bounds of the users
+        :param upper: upper bounds of the users
+        :param totals: nutrients of the plans, updated in place
+        :return: the number of steps of servings of each dish, by position in the pool, for each user
+        """
+
+        counts = [dict() for _ in lower]
+        limit = int(round(self.max_servings / self.step))
+        middle = (lower + upper) / 2
+
+        active = np.arange(len(lower))
+        while active.size:
+            targets = np.maximum(middle[active] - totals[active], 0) / self.step
+            full = [{j for j, n in counts[user].items() if n >= limit} for user in active.tolist()]
+            shortlists = self.index.nearest(targets, SHORTLIST, full)
+
+            chosen = np.full(active.size, -1)
+            for position, (user, shortlist) in enumerate(zip(active.tolist(), shortlists)):
+                if not shortlist:
+                    continue
+
+                candidates = np.array([j for j, distance in shortlist])
+                cost = self._cost(totals[user] + self.step * self.values[candidates], lower[user], upper[user])
+                best = int(cost.argmin())
+                if cost[best] < self._cost(totals[user], lower[user], upper[user]):
+                    chosen[position] = candidates[best]
+
+            # the users that no serving brings closer to their ranges are done
+            keep = chosen >= 0
+            active, chosen = active[keep], chosen[keep]
+            for user, j in zip(active.tolist(), chosen.tolist()):
+                counts[user][j] = counts[user].get(j, 0) + 1
+            totals[active] += self.step * self.values[chosen]
+
+        return counts
@@ -0,0 +1,221 @@
+import heapq
+import re
+from bisect import bisect_left, insort
+from collections import Counter
+
+
+# the meal section of each first letter of a food label
+SECTIONS = {'B': 'breakfast', 'L': 'lunch', 'D': 'dinner', 'U': 'additional dishes'}
+
+# the smallest share of the trigrams of a query that a name has to contain to be suggested
+MIN_SIMILARITY = 0.5
+
+# characters that separate the words of a name
+SEPARATORS = re.compile(r'[^0-9a-z]+')
+
+
+def normalize(text: str) -> str:
+    """
+    Converts a name or a query into lowercase words separated by single spaces
+
+    :param text: the name or the query
+    :return: the normalized text
+    """
+
+    return ' '.join(SEPARATORS.split(text.lower())).strip()
+
+
+def trigrams(text: str) -> set:
+    """
+    :param text: normalized text
+    :return: the set of three consecutive characters of each word of the text, padded so that the start and the end of
+             the words count too
+    """
+
+    grams = set()
+    for word in text.split():
+        word = f'  {word} '
+        grams.update(word[i:i + 3] for i in range(len(word) - 2))
+
+    return grams
+
+
+def section(label: str) -> str:
+    """
+    :param label: food label of a dish, optionally after its venue like dc:B1
+    :return: the meal section of the dish, None when the label has no known section
+    """
+
+    return SECTIONS.get(label.rpartition(':')[2][:1])
+
+
+class NameIndex:
+    """
+    Finds dishes by name. The different words of the names are kept in sorted order, so the words that start with a
+    word of the query are found by binary search, and each word points to the names that contain it, shortest first,
+    so the best names for a single word are found without looking at every name. A misspelled word of the query is
+    replaced by the words that contain most of its trigrams. Dishes with the same name in several sections (like the
+    same dish at breakfast and lunch) are one result with several labels
+    """
+
+    __slots__ = ('keys', 'display', 'labels', 'groups', 'order', 'words', 'postings', 'grams')
+
+    def __init__(self, labels: list, names: list):
+        """
+        :param labels: food label of each dish
+        :param names: name of each dish
+        """
+
+        # the normalized name, the name as written and the labels of each different name
+        self.keys = []
+        self.display = []
+        self.labels = []
+        self.groups = dict()
+
+        # the order of the names that match equally well: shorter names first, then the order of the file
+        self.order = []
+
+        # the different words in sorted order, with the names that contain each word
+        self.words = []
+        self.postings = dict()
+
+        # the words that contain each trigram
+        self.grams = dict()
+
+        for label, name in zip(labels, names):
+            self.add(label, name, sort=False)
+
+        self.words.sort()
+        for posting in self.postings.values():
+            posting.sort(key=self.order.__getitem__)
+
+    def add(self, label: str, name: str, sort: bool = True):
+        """
+        Adds a dish to the index
+
+        :param label: food label of the dish
+        :param name: name of the dish
+        :param sort: whether to keep the lists of the index sorted, only False while the index is being built
+        """
+
+        key = normalize(name)
+
+        # a name that is already in the index only gets another label
+        if key in self.groups:
+            self.labels[self.groups[key]].append(label)
+            return
+
+        group = len(self.keys)
+        self.groups[key] = group
+        self.keys.append(key)
+        self.display.append(name)
+        self.labels.append([label])
+        self.order.append((len(key), group))
+
+        for word in set(key.split()):
+            if word not in self.postings:
+                self.postings[word] = []
+                if sort:
+                    insort(self.words, word)
+                else:
+                    self.words.append(word)
+                for gram in trigrams(word):
+                    self.grams.setdefault(gram, []).append(word)
+
+            posting = self.postings[word]
+            posting.append(group)
+            if sort:
+                posting.sort(key=self.order.__getitem__)
+
+    def _matching_words(self, token: str) -> list:
+        """
+        Finds the words that can stand for a word of the query: the words starting with it, or when there are none, the
+        words that contain most of its trigrams
+
+        :param token: a word of the query
+        :return: a list of (similarity, words) tuples from the most to the least similar, empty when nothing matches
+        """
+
+        start = bisect_left(self.words, token)
+        end = bisect_left(self.words, token + '\uffff', start)
+        if start < end:
+            return [(1.0, self.words[start:end])]
+
+        grams = trigrams(token)
+        shared = Counter()
+        for gram in grams:
+            shared.update(self.grams.get(gram, ()))
+
+        tiers = dict()
+        for word, count in shared.items():
+            if count / len(grams) >= MIN_SIMILARITY:
+                tiers.setdefault(count / len(grams), []).append(word)
+
+        return sorted(tiers.items(), reverse=True)
+
+    def search(self, query: str, k: int = 10) -> list:
+        """
+        Finds the names that best match a query. The exact name comes first, then the names with a word matching every
+        word of the query, from the most similar and shortest names. Words of the query that match no word at all are
+        ignored
+
+        :param query: the name, or the start of the words of the name, of a dish
+        :param k: the largest number of results
+        :return: a list of dictionaries with the name, the labels and the similarity (from 0 to 1) of each result
+        """
+
+        query = normalize(query)
+        if query == '' or k <= 0:
+            return []
+
+        tokens = [(token, tiers) for token, tiers in ((token, self._matching_words(token)) for token in query.split())
+                  if tiers]
+        if not tokens:
+            return []
+
+        # the exact name comes first
+        results = [(self.groups[query], 1.0)] if query in self.groups else []
+        seen = {group for group, similarity in results}
+
+        # a single word reads the names from the lists of its matching words, shortest first, until there are enough
+        if len(tokens) == 1:
+            for similarity, words in tokens[0][1]:
+                for group in heapq.merge(*(self.postings[word] for word in words), key=self.order.__getitem__):
+                    if len(results) >= k:
+                        break
+                    if group not in seen:
+                        seen.add(group)
+                        results.append((group, similarity))
+
+        # several words keep the names that match all of them, starting with the word with the fewest names
+        else:
+            candidates = None
+            misspelled = []
+            for token, tiers in sorted(tokens, key=lambda t: sum(len(self.postings[word]) for similarity, words in t[1]
+                                                                 for word in words)):
+                if tiers[0][0] == 1.0:
+                    groups = set().union(*(self.postings[word] for word in tiers[0][1]))
+                else:
+                    # the similarity of the most similar word of each name
+                    groups = dict()
+                    for similarity, words in reversed(tiers):
+                        for word in words:
+                            groups.update(dict.fromkeys(self.postings[word], similarity))
+                    misspelled.append(groups)
+
+                candidates = set(groups) if candidates is None else candidates.intersection(groups)
+                if not candidates:
+                    break
+
+            def score(group: int) -> float:
+                return (len(tokens) - len(misspelled) + sum(groups[group] for groups in misspelled)) / len(tokens)
+
+            if misspelled:
+                best = heapq.nsmallest(k - len(results), candidates - seen,
+                                       key=lambda group: (-score(group), self.order[group]))
+            else:
+                best = heapq.nsmallest(k - len(results), candidates - seen, key=self.order.__getitem__)
+            results += [(group, score(group)) for group in best]
+
+        return [{'name': self.display[g], 'labels': list(self.labels[g]), 'similarity': similarity}
+                for g, similarity in results]
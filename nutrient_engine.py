@@ -0,0 +1,177 @@
+import numpy as np
+
+from catalog import FoodCatalog
+from nutrients import bounds
+
+
+# the nutrient matrices of the catalogs, so that a catalog is only stacked again after dishes are added to it
+_matrices = dict()
+
+
+def catalog_matrix(catalog: FoodCatalog) -> np.ndarray:
+    """
+    Returns the nutrient matrix of a catalog, with one row per dish and one column per nutrient of the catalog, building
+    it again when the catalog changed
+
+    :param catalog: catalog of the dishes
+    :return: the matrix of the catalog
+    """
+
+    matrix = _matrices.get(catalog.path)
+    if matrix is None or matrix[0] is not catalog or len(matrix[1]) != len(catalog):
+        matrix = _matrices[catalog.path] = (catalog, np.column_stack([np.asarray(column, dtype=np.float64)
+                                                                      for column in catalog.columns.values()]))
+
+    return matrix[1]
+
+
+class NutrientEngine:
+    """
+    Calculates the nutrients and the excess/deficit nutrients of many users at once. The catalog is stored as a dense
+    matrix with one row per dish and one column per nutrient of the catalog, and the consumption of the users as a
+    sparse matrix of servings, so that the totals of every user and nutrient are a single matrix product
+    """
+
+    __slots__ = ('catalog', 'matrix')
+
+    def __init__(self, catalog: FoodCatalog, matrix: np.ndarray = None):
+        """
+        :param catalog: catalog of the dishes
+        :param matrix: nutrient matrix of the catalog if it was already built, for example in shared memory
+        """
+
+        self.catalog = catalog
+        self.matrix = np.empty((0, len(catalog.nutrients))) if matrix is None else matrix
+        self._refresh()
+
+    def _refresh(self):
+        """
+        Rebuilds the nutrient matrix when dishes were appended to the catalog after the engine was created
+        """
+
+        if len(self.matrix) != len(self.catalog):
+            self.matrix = catalog_matrix(self.catalog)
+
+    def servings(self, consumptions: list) -> tuple:
+        """
+        Converts the consumption dictionaries of many users into a sparse matrix in compressed row form. Food labels
+        that are not present in the catalog are skipped, like in calculating_nutrients()
+
+        :param consumptions: list of dictionaries containing food labels and serving amount, one for each user
+        :return: a tuple of row pointers, dish rows and servings
+        """
+
+        index = self.catalog.index
+        indptr = np.zeros(len(consumptions) + 1, dtype=np.int64)
+        indices = []
+        servings = []
+
+        for user, consumption in enumerate(consumptions):
+            for food_label, serving in consumption.items():
+                i = index.get(food_label)
+                if i is not None:
+                    indices.append(i)
+                    servings.append(serving)
+
+            indptr[user + 1] = len(indices)
+
+        return indptr, np.array(indices, dtype=np.int64), np.array(servings, dtype=np.float64)
+
+    def totals(self, servings: tuple) -> np.ndarray:
+        """
+        Multiplies the sparse matrix of servings with the nutrient matrix
+
+        :param servings: sparse matrix of servings returned by servings()
+        :return: array with one row of consumed nutrients for each user
+        """
+
+        self._refresh()
+        indptr, indices, amounts = servings
+        users = len(indptr) - 1
+
+        # the user of each stored serving
+        rows = np.repeat(np.arange(users), np.diff(indptr))
+
+        # the nutrients of each consumed dish are weighted by its serving and summed per user
+        weighted = self.matrix[indices] * amounts[:, None]
+        result = np.empty((users, self.matrix.shape[1]))
+        for j in range(self.matrix.shape[1]):
+            result[:, j] = np.bincount(rows, weights=weighted[:, j], minlength=users)
+
+        return result
+
+    def calculating_nutrients(self, consumptions: list) -> np.ndarray:
+        """
+        Vectorized version of calculating_nutrients() for many users
+
+        :param consumptions: list of dictionaries containing food labels and serving amount, one for each user
+        :return: array with one row of consumed nutrients for each user, in the order of the nutrients of the catalog
+        """
+
+        return self.totals(self.servings(consumptions))
+
+
+def consumption_totals(consumption: dict, catalog: FoodCatalog) -> np.ndarray:
+    """
+    Calculates the nutrients of the consumption of one user for every nutrient of the catalog at once. The servings are
+    added in the order of the consumption, one dish after another, so the totals are the same as adding each dish in a
+    loop. Food labels that are not present in the catalog are skipped
+
+    :param consumption: dictionary containing food labels and serving amount
+    :param catalog: catalog of the dishes
+    :return: array of the consumed nutrients, None when no food of the consumption is in the catalog
+    """
+
+    consumed = [(catalog.index[food_label], serving) for food_label, serving in consumption.items()
+                if food_label in catalog.index]
+    if not consumed:
+        return None
+
+    rows, servings = zip(*consumed)
+    values = catalog_matrix(catalog)[list(rows)] * np.array(servings, dtype=np.float64)[:, None]
+
+    # cumsum adds the dishes one after another, where sum would add them pairwise
+    return np.cumsum(values, axis=0)[-1]
+
+
+def ideal_ranges(ideal_cal: np.ndarray, nutrients: tuple) -> tuple:
+    """
+    Vectorized version of calculating_ideal_nutrients() for many users and nutrients. The calorie has no range, so its
+    minimum and maximum are both the ideal calorie
+
+    :param ideal_cal: array of the ideal calorie of each user
+    :param nutrients: keys of the nutrients, the nutrients of the catalog
+    :return: a tuple of two arrays with the minimum and the maximum of each nutrient for each user
+    """
+
+    ideal_cal = np.asarray(ideal_cal, dtype=np.float64)[:, None]
+    lower_share, lower_divisor, lower_amount, upper_share, upper_divisor, upper_amount = bounds(tuple(nutrients))
+
+    return (ideal_cal * lower_share / lower_divisor + lower_amount,
+            ideal_cal * upper_share / upper_divisor + upper_amount)
+
+
+def comparing_nutrients(lower: np.ndarray, upper: np.ndarray, current: np.ndarray) -> np.ndarray:
+    """
+    Vectorized version of comparing_nutrients() for many users. The difference from a range is the value minus the
+    value clipped into the range, which is 0 inside the range like in comparing_range()
+
+    :param lower: array of the minimum of each nutrient for each user
+    :param upper: array of the maximum of each nutrient for each user
+    :param current: array of the consumed nutrients of each user
+    :return: array of excess/deficit nutrients for each user
+    """
+
+    return current - np.clip(current, lower, upper)
+
+
+def to_dicts(values: np.ndarray, nutrients: tuple) -> list:
+    """
+    Converts an array of nutrients into the dictionaries used by the functions in access_file.py
+
+    :param values: array with one row of nutrients for each user
+    :param nutrients: keys of the nutrients, the nutrients of the catalog
+    :return: list of dictionaries with one value for each nutrient
+    """
+
+    return [dict(zip(nutrients, row)) for row in values.tolist()]
@@ -0,0 +1,151 @@
+from collections import namedtuple
+from functools import lru_cache
+
+
+# a nutrient that a catalog can have: its key, the name of its column in the csv file, its unit, the words used for it
+# in the advice, and the bounds of its ideal range. Each bound is a tuple (share, divisor, amount) standing for
+# ideal_cal * share / divisor + amount, so that a bound can follow the ideal calorie, be a fixed amount, or both
+Nutrient = namedtuple('Nutrient', ['key', 'column', 'unit', 'category', 'plural', 'lower', 'upper'])
+
+# every nutrient that a catalog can have. The calorie has no range, so both of its bounds are the ideal calorie
+SCHEMA = (Nutrient('cal', 'calories', 'calories', 'calorie', 'calories', (1, 1, 0), (1, 1, 0)),
+          Nutrient('carb', 'carbohydrates', 'grams', 'carbohydrate', 'carbohydrates', (0.45, 4, 0), (0.65, 4, 0)),
+          Nutrient('pro', 'protein', 'grams', 'protein', 'proteins', (0.10, 4, 0), (0.35, 4, 0)),
+          Nutrient('fat', 'fat', 'grams', 'fat', 'fats', (0.20, 9, 0), (0.35, 9, 0)),
+          # 14 grams per 1000 calories, and not so much that it upsets the stomach
+          Nutrient('fiber', 'fiber', 'grams', 'fiber', 'fibers', (14, 1000, 0), (0, 1, 70)),
+          # at most 10% of the calories from sugar and from saturated fat
+          Nutrient('sugar', 'sugar', 'grams', 'sugar', 'sugars', (0, 1, 0), (0.10, 4, 0)),
+          Nutrient('sat_fat', 'saturated fat', 'grams', 'saturated fat', 'saturated fats', (0, 1, 0), (0.10, 9, 0)),
+          Nutrient('sodium', 'sodium', 'milligrams', 'sodium', 'sodium', (0, 1, 1500), (0, 1, 2300)))
+
+# the nutrient of each key, and of each name a csv column can have
+BY_KEY = {nutrient.key: nutrient for nutrient in SCHEMA}
+BY_COLUMN = {**{nutrient.key: nutrient for nutrient in SCHEMA}, **{nutrient.column: nutrient for nutrient in SCHEMA}}
+
+# the nutrients that have one ideal value instead of a range, like the calorie
+EXACT = frozenset(nutrient.key for nutrient in SCHEMA if nutrient.lower == nutrient.upper)
+
+# the keys of the minimum and the maximum of each nutrient in the dictionary of ideal nutrients
+RANGE_KEYS = {nutrient.key: (f'min_{nutrient.key}', f'max_{nutrient.key}') for nutrient in SCHEMA}
+
+# the nutrient of each category used in the advice
+BY_CATEGORY = {nutrient.category: nutrient for nutrient in SCHEMA}
+
+# the nutrients of food_nutrition.csv, used when there is no catalog to take them from
+DEFAULT_NUTRIENTS = ('cal', 'carb', 'pro', 'fat')
+
+
+def nutrient_keys(columns: list, path: str = 'food_nutrition.csv') -> tuple:
+    """
+    Finds the nutrient of each numeric column of a catalog csv file from its name. The calorie has to be the first
+    column, as the excess calories are what the exercises burn
+
+    :param columns: the names of the numeric columns, after the label and the name
+    :param path: path of the csv file, used in the error messages
+    :return: a tuple of the key of the nutrient of each column
+    """
+
+    keys = []
+    for column in columns:
+        nutrient = BY_COLUMN.get(column.strip().lower())
+        if nutrient is None:
+            raise ValueError(f'{path}, line 1: unknown nutrient {column!r}, expected one of '
+                             f'{", ".join(nutrient.column for nutrient in SCHEMA)}')
+        if nutrient.key in keys:
+            raise ValueError(f'{path}, line 1: the nutrient {column!r} is repeated')
+        keys.append(nutrient.key)
+
+    if not keys or keys[0] != 'cal':
+        raise ValueError(f'{path}, line 1: the first numeric column should be calories')
+
+    return tuple(keys)
+
+
+def is_exact(nutrient: str) -> bool:
+    """
+    :param nutrient: key of a nutrient
+    :return: whether the nutrient has one ideal value instead of a range, like the calorie
+    """
+
+    return nutrient in EXACT
+
+
+@lru_cache(maxsize=None)
+def bounds(nutrients: tuple) -> tuple:
+    """
+    Returns the bounds of the nutrients as arrays, so that the ranges of many users and nutrients are calculated with a
+    few array operations
+
+    :param nutrients: keys of the nutrients
+    :return: a tuple of the share, divisor and amount arrays of the lower bounds, followed by the ones of the upper
+             bounds
+    """
+
+    # numpy is only imported when it is first needed, so that reading a catalog does not load it
+    import numpy as np
+
+    arrays = []
+    for side in ('lower', 'upper'):
+        for part in range(3):
+            values = np.array([getattr(BY_KEY[nutrient], side)[part] for nutrient in nutrients], dtype=np.float64)
+            values.flags.writeable = False
+            arrays.append(values)
+
+    return tuple(arrays)
+
+
+def ideal_dict(lower: list, upper: list, nutrients: tuple) -> dict:
+    """
+    Converts the bounds of the nutrients of one user into the dictionary returned by calculating_ideal_nutrients():
+    nutrients with one ideal value are stored under their key, and the others as min_ and max_ keys
+
+    :param lower: lower bound of each nutrient
+    :param upper: upper bound of each nutrient
+    :param nutrients: keys of the nutrients
+    :return: a dictionary containing ideal nutrition to be consumed daily
+    """
+
+    ideal_n = dict()
+    for nutrient, low, high in zip(nutrients, lower, upper):
+        if is_exact(nutrient):
+            ideal_n[nutrient] = low
+        else:
+            ideal_n[RANGE_KEYS[nutrient][0]] = low
+            ideal_n[RANGE_KEYS[nutrient][1]] = high
+
+    return ideal_n
+
+
+def ideal_nutrients(ideal_cal: float, nutrients: tuple = DEFAULT_NUTRIENTS) -> dict:
+    """
+    Calculates the ideal range of each nutrient from the ideal calorie
+
+    :param ideal_cal: the ideal calorie that should be consumed by the user
+    :param nutrients: keys of the nutrients
+    :return: a dictionary containing ideal nutrition to be consumed daily
+    """
+
+    lower = [(ideal_cal * BY_KEY[nutrient].lower[0]) / BY_KEY[nutrient].lower[1] + BY_KEY[nutrient].lower[2]
+             for nutrient in nutrients]
+    upper = [(ideal_cal * BY_KEY[nutrient].upper[0]) / BY_KEY[nutrient].upper[1] + BY_KEY[nutrient].upper[2]
+             for nutrient in nutrients]
+
+    return ideal_dict(lower, upper, nutrients)
+
+
+def ranges_of(ideal_n: dict) -> tuple:
+    """
+    Converts the dictionary returned by calculating_ideal_nutrients() into arrays of bounds
+
+    :param ideal_n: dictionary containing ideal nutrition to be consumed daily
+    :return: a tuple of the lower and the upper bound of each nutrient, equal for the nutrients with one ideal value
+    """
+
+    import numpy as np
+
+    lower = [value for name, value in ideal_n.items() if not name.startswith('max_')]
+    upper = [value for name, value in ideal_n.items() if not name.startswith('min_')]
+
+    return np.array(lower), np.array(upper)
+
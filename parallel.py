@@ -0,0 +1,126 @@
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from batch import CHUNK_SIZE, TOP, score_cached, score_chunk
+from catalog import FoodCatalog
+from exercise_table import ExerciseTable, load_exercise_table
+from meal_plan import MealPlanner
+from nutrient_engine import NutrientEngine
+from report_cache import ReportCache
+
+
+# the nutrient engine of each worker process, created once by _init_worker()
+_engine = None
+
+# the exercise table of each worker process, mapped from the compiled exercises file by _init_worker()
+_table = None
+
+# the meal planner of each worker process, created by _init_worker() when meal plans are asked for
+_planner = None
+
+# the report cache of each worker process, opened by _init_worker() when a cache directory is given
+_cache = None
+
+# the shared memory block of each worker process, kept so that the matrix stays valid
+_shared = None
+
+
+def _init_worker(shared_name: str, shape: tuple, path: str, labels: list, names: list, nutrients: tuple,
+                 exercises_path: str, plan_options: tuple = None, cache_options: tuple = None):
+    """
+    Attaches a worker process to the shared nutrient matrix. The labels and names are sent once per worker, not once
+    per chunk, and the exercise table is memory-mapped from its compiled file
+
+    :param shared_name: name of the shared memory block of the nutrient matrix
+    :param shape: shape of the nutrient matrix
+    :param path: path of the csv file of the catalog
+    :param labels: food label of each dish
+    :param names: name of each dish
+    :param nutrients: key of the nutrient of each column of the matrix
+    :param exercises_path: path of the csv file of the exercises, or None for no exercise plan
+    :param plan_options: sections, step and largest servings of the meal planner, or None for no meal plan
+    :param cache_options: directory and largest size of the report cache, or None for no cache
+    """
+
+    global _cache, _engine, _planner, _shared, _table
+
+    _shared = shared_memory.SharedMemory(name=shared_name)
+    matrix = np.ndarray(shape, dtype=np.float64, buffer=_shared.buf)
+    catalog = FoodCatalog.from_columns(path, labels, names, nutrients, [matrix[:, j] for j in range(len(nutrients))])
+    _engine = NutrientEngine(catalog, matrix)
+    _table = load_exercise_table(exercises_path) if exercises_path else None
+    _planner = MealPlanner(catalog, *plan_options, matrix=matrix) if plan_options else None
+    _cache = ReportCache(*cache_options) if cache_options else None
+
+
+def _score(chunk: list, top: int, swaps: int) -> list:
+    """
+    Scores a chunk of records in a worker process
+
+    :param chunk: list of record dictionaries
+    :param top: number of dishes named in the advice of each nutrient
+    :param swaps: number of dishes suggested in place of every dish named for a nutrient in excess
+    :return: list of result dictionaries in the order of the records
+    """
+
+    if _cache is not None:
+        return score_cached(chunk, _engine, _cache, top, _table, swaps, _planner)
+    return score_chunk(chunk, _engine, top, _table, swaps, _planner)
+
+
+def score_parallel(records, catalog: FoodCatalog, workers: int = None, chunk_size: int = CHUNK_SIZE, top: int = TOP,
+                   table: ExerciseTable = None, swaps: int = 0, planner: MealPlanner = None,
+                   cache: ReportCache = None):
+    """
+    Scores a stream of records in chunks across several processes. Only a few chunks per worker are in flight at a
+    time, so the memory stays bounded however long the stream is
+
+    :param records: iterable of record dictionaries
+    :param catalog: catalog of the dishes
+    :param workers: number of worker processes, the number of cpus is used when not given
+    :param chunk_size: number of records scored together
+    :param top: number of dishes named in the advice of each nutrient
+    :param table: table of the exercises, no exercise plan is added when not given
+    :param swaps: number of dishes suggested in place of every dish named for a nutrient in excess
+    :param planner: meal planner of the catalog, only its options are sent to the workers
+    :param cache: cache of the reports, only its directory and size are sent to the workers
+    :return: a generator of result dictionaries in the order of the records
+    """
+
+    workers = workers or os.cpu_count() or 1
+    matrix = NutrientEngine(catalog).matrix
+
+    # copies the nutrient matrix into shared memory once for all the workers
+    shared = shared_memory.SharedMemory(create=True, size=max(matrix.nbytes, 1))
+    try:
+        np.ndarray(matrix.shape, dtype=np.float64, buffer=shared.buf)[:] = matrix
+
+        initargs = (shared.name, matrix.shape, catalog.path, catalog.labels, catalog.names, catalog.nutrients,
+                    table.path if table is not None else None,
+                    (planner.sections, planner.step, planner.max_servings) if planner is not None else None,
+                    (cache.path, cache.max_bytes) if cache is not None else None)
+        with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=initargs) as executor:
+            records = iter(records)
+            pending = deque()
+
+            while True:
+                # keeps two chunks per worker in flight
+                while len(pending) < 2 * workers:
+                    chunk = list(islice(records, chunk_size))
+                    if len(chunk) == 0:
+                        break
+                    pending.append(executor.submit(_score, chunk, top, swaps))
+
+                if len(pending) == 0:
+                    break
+
+                # the results come back in the order the chunks were submitted
+                yield from pending.popleft().result()
+    finally:
+        shared.close()
+        shared.unlink()
@@ -0,0 +1,415 @@
+import argparse
+import heapq
+import json
+import math
+import sys
+from collections import Counter
+from itertools import islice
+
+import numpy as np
+
+from nutrients import SCHEMA
+
+
+# largest relative error of the quantiles of a sketch
+RELATIVE_ACCURACY = 0.01
+
+# values whose magnitude is below this are counted as zero, and values above MAX_VALUE in the largest bucket
+MIN_VALUE = 1e-3
+MAX_VALUE = 1e7
+
+# the quantiles of the summary
+QUANTILES = (0.05, 0.25, 0.5, 0.75, 0.95)
+
+# number of dishes listed in the summary for each nutrient and action
+TOP_DISHES = 10
+
+# number of results added to the statistics together
+CHUNK_SIZE = 1024
+
+# the nutrient of each category used in the advice of the batch mode
+CATEGORIES = {nutrient.category: nutrient.key for nutrient in SCHEMA}
+
+
+class QuantileSketch:
+    """
+    Estimates the quantiles of a stream of values in constant memory. The values are counted in buckets whose limits
+    grow geometrically (by a factor gamma), one set of buckets for positive and one for negative values, so every
+    quantile is returned with a relative error of at most RELATIVE_ACCURACY. Two sketches with the same accuracy are
+    merged by adding their counts, so the sketches of several shards give the same quantiles as one sketch of everything
+    """
+
+    __slots__ = ('accuracy', 'log_gamma', 'offset', 'positive', 'negative', 'zeros', 'count', 'total', 'minimum',
+                 'maximum')
+
+    def __init__(self, accuracy: float = RELATIVE_ACCURACY):
+        """
+        :param accuracy: largest relative error of the quantiles, between 0 and 1
+        """
+
+        if not 0 < accuracy < 1:
+            raise ValueError('accuracy should be between 0 and 1')
+
+        self.accuracy = accuracy
+        self.log_gamma = math.log((1 + accuracy) / (1 - accuracy))
+
+        # the bucket i holds the magnitudes between gamma ** (i + offset - 1) and gamma ** (i + offset)
+        self.offset = math.ceil(math.log(MIN_VALUE) / self.log_gamma)
+        size = math.ceil(math.log(MAX_VALUE) / self.log_gamma) - self.offset + 1
+        self.positive = np.zeros(size, dtype=np.int64)
+        self.negative = np.zeros(size, dtype=np.int64)
+        self.zeros = 0
+
+        # the exact count, sum, smallest and largest value
+        self.count = 0
+        self.total = 0.0
+        self.minimum = math.inf
+        self.maximum = -math.inf
+
+    def _buckets(self, magnitudes: np.ndarray) -> np.ndarray:
+        """
+        :param magnitudes: absolute values, not below MIN_VALUE
+        :return: the bucket of each value
+        """
+
+        buckets = np.ceil(np.log(magnitudes) / self.log_gamma).astype(np.int64) - self.offset
+        return np.clip(buckets, 0, len(self.positive) - 1)
+
+    def add(self, values):
+        """
+        Adds values to the sketch. Values that are not finite are skipped
+
+        :param values: a value or an array of values
+        """
+
+        values = np.asarray(values, dtype=np.float64).ravel()
+        values = values[np.isfinite(values)]
+        if len(values) == 0:
+            return
+
+        self.count += len(values)
+        self.total += float(values.sum())
+        self.minimum = min(self.minimum, float(values.min()))
+        self.maximum = max(self.maximum, float(values.max()))
+
+        small = np.abs(values) < MIN_VALUE
+        self.zeros += int(small.sum())
+        for store, part in ((self.positive, values[~small & (values > 0)]),
+                            (self.negative, -values[~small & (values < 0)])):
+            if len(part):
+                store += np.bincount(self._buckets(part), minlength=len(store))
+
+    def merge(self, other: 'QuantileSketch'):
+        """
+        Adds the values of another sketch to this one
+
+        :param other: a sketch with the same accuracy
+        """
+
+        if other.accuracy != self.accuracy:
+            raise ValueError('Only sketches with the same accuracy can be merged')
+
+        self.positive += other.positive
+        self.negative += other.negative
+        self.zeros += other.zeros
+        self.count += other.count
+        self.total += other.total
+        self.minimum = min(self.minimum, other.minimum)
+        self.maximum = max(self.maximum, other.maximum)
+
+    def quantiles(self, qs=QUANTILES) -> list:
+        """
+        :param qs: the quantiles, between 0 and 1
+        :return: the estimated value of each quantile, None for every quantile of an empty sketch
+        """
+
+        if self.count == 0:
+            return [None] * len(qs)
+
+        # the value of every bucket from the most negative to the most positive, in the middle of its limits
+        middles = 2 * np.exp((np.arange(len(self.positive)) + self.offset) * self.log_gamma) / \
+            (1 + math.exp(self.log_gamma))
+        values = np.concatenate([-middles[::-1], [0.0], middles])
+        counts = np.concatenate([self.negative[::-1], [self.zeros], self.positive]).cumsum()
+
+        ranks = np.asarray(qs, dtype=np.float64) * (self.count - 1)
+        found = values[np.searchsorted(counts, ranks, side='right')]
+
+        return np.clip(found, self.minimum, self.maximum).tolist()
+
+    def as_dict(self) -> dict:
+        """
+        :return: the sketch as a dictionary that can be written as JSON, with only the buckets that are not empty
+        """
+
+        return {'accuracy': self.accuracy, 'count': self.count, 'total': self.total, 'zeros': self.zeros,
+                'minimum': self.minimum if self.count else None, 'maximum': self.maximum if self.count else None,
+                'positive': {str(i): int(self.positive[i]) for i in np.flatnonzero(self.positive).tolist()},
+                'negative': {str(i): int(self.negative[i]) for i in np.flatnonzero(self.negative).tolist()}}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'QuantileSketch':
+        """
+        :param data: a dictionary returned by as_dict()
+        :return: the sketch of the dictionary
+        """
+
+        sketch = cls(data['accuracy'])
+        sketch.count = data['count']
+        sketch.total = data['total']
+        sketch.zeros = data['zeros']
+        if sketch.count:
+            sketch.minimum = data['minimum']
+            sketch.maximum = data['maximum']
+        for store, buckets in ((sketch.positive, data['positive']), (sketch.negative, data['negative'])):
+            for i, count in buckets.items():
+                store[int(i)] = count
+
+        return sketch
+
+
+class PopulationStats:
+    """
+    Statistics of the results of the batch mode over a whole population, computed in one pass: the distribution of the
+    excess/deficit of every nutrient, the number of users in excess, in deficit and in range, and how often each dish is
+    named in the advice of each nutrient. The memory does not grow with the number of users, and the statistics of
+    several shards can be merged
+    """
+
+    __slots__ = ('accuracy', 'users', 'errors', 'sketches', 'actions', 'dishes', 'names')
+
+    def __init__(self, accuracy: float = RELATIVE_ACCURACY):
+        """
+        :param accuracy: largest relative error of the quantiles
+        """
+
+        self.accuracy = accuracy
+
+        # the number of results that were scored and that had an error
+        self.users = 0
+        self.errors = 0
+
+        # the distribution of the excess/deficit and the number of users with each action, for each nutrient of the
+        # results, added by _nutrient() when the nutrient is first seen
+        self.sketches = dict()
+        self.actions = dict()
+
+        # the number of times each dish is named, for each nutrient and action, and the name of each dish
+        self.dishes = dict()
+        self.names = dict()
+
+    def _nutrient(self, nutrient: str):
+        """
+        Adds empty statistics for a nutrient that was not seen before
+
+        :param nutrient: key of the nutrient
+        """
+
+        if nutrient not in self.sketches:
+            self.sketches[nutrient] = QuantileSketch(self.accuracy)
+            self.actions[nutrient] = Counter()
+            self.dishes[nutrient] = {'reduce': Counter(), 'increase': Counter()}
+
+    def add_results(self, results: list):
+        """
+        Adds a chunk of results of the batch mode
+
+        :param results: list of result dictionaries, as returned by score_chunk()
+        """
+
+        scored = []
+        for result in results:
+            if 'error' in result:
+                self.errors += 1
+            else:
+                scored.append(result)
+
+        if not scored:
+            return
+
+        # the results of one run share the nutrients of their catalog
+        self.users += len(scored)
+        nutrients = list(scored[0]['status'])
+        status = np.array([[result['status'][nutrient] for nutrient in nutrients] for result in scored])
+        for j, nutrient in enumerate(nutrients):
+            self._nutrient(nutrient)
+            self.sketches[nutrient].add(status[:, j])
+            self.actions[nutrient].update({'excess': int((status[:, j] > 0).sum()),
+                                           'deficit': int((status[:, j] < 0).sum()),
+                                           'in range': int((status[:, j] == 0).sum())})
+
+        for result in scored:
+            for item in result.get('advice', ()):
+                if item['action'] is None:
+                    continue
+                counter = self.dishes[CATEGORIES[item['nutrient']]][item['action']]
+                for food in item['foods']:
+                    counter[food['label']] += 1
+                    self.names[food['label']] = food['name']
+
+    def merge(self, other: 'PopulationStats'):
+        """
+        Adds the statistics of another shard to these ones
+
+        :param other: statistics with the same accuracy
+        """
+
+        self.users += other.users
+        self.errors += other.errors
+        for nutrient in other.sketches:
+            self._nutrient(nutrient)
+            self.sketches[nutrient].merge(other.sketches[nutrient])
+            self.actions[nutrient].update(other.actions[nutrient])
+            for action, counter in other.dishes[nutrient].items():
+                self.dishes[nutrient][action].update(counter)
+        self.names.update(other.names)
+
+    def summary(self, qs=QUANTILES, top: int = TOP_DISHES) -> dict:
+        """
+        :param qs: the quantiles of the excess/deficit of each nutrient
+        :param top: number of dishes listed for each nutrient and action, the most named first and then by label
+        :return: a dictionary with the statistics of each nutrient
+        """
+
+        nutrients = dict()
+        for nutrient in self.sketches:
+            sketch = self.sketches[nutrient]
+            nutrients[nutrient] = {
+                'mean': sketch.total / sketch.count if sketch.count else None,
+                'quantiles': dict(zip((f'p{round(q * 100)}' for q in qs), sketch.quantiles(qs))),
+                'users': {action: self.actions[nutrient][action] for action in ('excess', 'deficit', 'in range')},
+                'dishes': {action: [{'label': label, 'name': self.names.get(label), 'count': count,
+                                     'share': count / self.users}
+                                    for label, count in heapq.nsmallest(top, counter.items(),
+                                                                        key=lambda item: (-item[1], item[0]))]
+                           for action, counter in self.dishes[nutrient].items()}}
+
+        return {'users': self.users, 'errors': self.errors, 'nutrients': nutrients}
+
+    def as_dict(self) -> dict:
+        """
+        :return: the statistics as a dictionary that can be written as JSON and merged later
+        """
+
+        return {'accuracy': self.accuracy, 'users': self.users, 'errors': self.errors,
+                'sketches': {nutrient: sketch.as_dict() for nutrient, sketch in self.sketches.items()},
+                'actions': self.actions, 'dishes': self.dishes, 'names': self.names}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'PopulationStats':
+        """
+        :param data: a dictionary returned by as_dict()
+        :return: the statistics of the dictionary
+        """
+
+        stats = cls(data['accuracy'])
+        stats.users = data['users']
+        stats.errors = data['errors']
+        for nutrient in data['sketches']:
+            stats._nutrient(nutrient)
+            stats.sketches[nutrient] = QuantileSketch.from_dict(data['sketches'][nutrient])
+            stats.actions[nutrient].update(data['actions'][nutrient])
+            for action, counter in data['dishes'][nutrient].items():
+                stats.dishes[nutrient][action].update(counter)
+        stats.names.update(data['names'])
+
+        return stats
+
+
+def collect(results, stats: PopulationStats = None, chunk_size: int = CHUNK_SIZE) -> PopulationStats:
+    """
+    Adds a stream of results of the batch mode to statistics, one chunk at a time
+
+    :param results: iterable of result dictionaries
+    :param stats: statistics to add the results to, new statistics when not given
+    :param chunk_size: number of results added together
+    :return: the statistics
+    """
+
+    stats = PopulationStats() if stats is None else stats
+    results = iter(results)
+
+    while True:
+        chunk = list(islice(results, chunk_size))
+        if len(chunk) == 0:
+            break
+        stats.add_results(chunk)
+
+    return stats
+
+
+def collecting(results, stats: PopulationStats, chunk_size: int = CHUNK_SIZE):
+    """
+    Passes a stream of results of the batch mode through, adding them to statistics along the way
+
+    :param results: iterable of result dictionaries
+    :param stats: statistics to add the results to
+    :param chunk_size: number of results added together
+    :return: a generator of the same results
+    """
+
+    chunk = []
+    for result in results:
+        chunk.append(result)
+        if len(chunk) >= chunk_size:
+            stats.add_results(chunk)
+            chunk = []
+        yield result
+
+    stats.add_results(chunk)
+
+
+def main(argv: list = None) -> int:
+    """
+    Command line entry point of the population statistics. Reads the JSON lines results of the batch mode, or the
+    partial statistics of several shards, and writes the summary or the partial statistics as JSON
+
+    :param argv: command line arguments, sys.argv is used when not given
+    :return: exit status
+    """
+
+    parser = argparse.ArgumentParser(prog='haverfit stats', description='Summarizes the results of the batch mode '
+                                                                        'over a whole population.')
+    parser.add_argument('inputs', nargs='*', default=['-'], help='JSON lines results of the batch mode, or partial '
+                                                                 'statistics with --merge (default: stdin)')
+    parser.add_argument('-o', '--output', default='-', help='file to write the JSON to (default: stdout)')
+    parser.add_argument('--merge', action='store_true', help='the inputs are partial statistics written with '
+                                                             '--partial')
+    parser.add_argument('--partial', action='store_true', help='write the partial statistics instead of the summary, '
+                                                               'to merge them with the ones of other shards')
+    parser.add_argument('--top', type=int, default=TOP_DISHES, help='number of dishes listed for each nutrient and '
+                                                                    'action')
+    args = parser.parse_args(argv)
+
+    stats = PopulationStats()
+    for path in args.inputs:
+        try:
+            fh = sys.stdin if path == '-' else open(path, 'r')
+        except FileNotFoundError:
+            print(f'The file {path} does not exist', file=sys.stderr)
+            return 1
+
+        try:
+            if args.merge:
+                stats.merge(PopulationStats.from_dict(json.load(fh)))
+            else:
+                collect((json.loads(line) for line in fh if line.strip()), stats)
+        finally:
+            if fh is not sys.stdin:
+                fh.close()
+
+    output = stats.as_dict() if args.partial else stats.summary(top=args.top)
+
+    fh_out = sys.stdout if args.output == '-' else open(args.output, 'w')
+    try:
+        json.dump(output, fh_out, indent=None if args.partial else 2)
+        fh_out.write('\n')
+    finally:
+        if fh_out is not sys.stdout:
+            fh_out.close()
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,233 @@
+import csv
+import io
+import json
+
+from name_index import section
+from nutrients import BY_CATEGORY, BY_KEY, is_exact
+
+
+# the formats the reports can be written in
+FORMATS = ('jsonl', 'csv', 'text')
+
+# the columns of the csv form of the reports, one row for each nutrient of each report
+CSV_FIELDS = ('id', 'nutrient', 'unit', 'min', 'max', 'current', 'difference', 'action', 'foods', 'substitutes',
+              'error')
+
+
+def nutrient_text(name: str, name_value: float, value: float, value_unit: str, category: str) -> str:
+    """
+    Writes the advice of one nutrient in the words printed by the interactive program
+
+    :param name: name of the food, or the names of several foods separated by commas
+    :param name_value: value of a nutrient in food, in total for the day when the nutrient is in excess and per serving
+    when it is in deficit, or the values of several foods separated by commas in the order of their names
+    :param value: value of current excess/deficit consumption of a nutrient
+    :param value_unit: unit of the nutrient
+    :param category: the type of nutrient
+    :return: the sentences, ending with an empty line
+    """
+
+    # the plural of the nutrient, which is not always the category followed by s
+    plural = BY_CATEGORY[category].plural if category in BY_CATEGORY else f'{category}s'
+
+    # too much of a nutrient is being consumed
+    if value > 0:
+        return (f'You are consuming {value} {value_unit} of {plural} more than you should.\n'
+                f'Out of all the food that you consume daily, {name} add(s) the most {plural} to your day with \n'
+                f'{name_value} {value_unit} of {plural}. You should consider reducing the consumption of {name}\n\n')
+
+    # too little of a nutrient is being consumed
+    elif value < 0:
+        return (f'You are consuming {abs(value)} {value_unit} of {plural} less than you should.\n'
+                f'Out of all the food that you consume daily, {name} has/have the highest {category} content with \n'
+                f'{name_value} {value_unit} of {plural} per serving. You should consider increasing the '
+                f'consumption of {name}\n\n')
+
+    # sufficient nutrient is being consumed
+    else:
+        return f'Congratulations! You are consuming the right amount of {plural}!\n\n'
+
+
+def structured_advice(current_s: dict, contributors: dict) -> list:
+    """
+    Structured version of the sentences of the advice
+
+    :param current_s: dictionary containing excess/deficit nutrients of current diet
+    :param contributors: dictionary returned by advice_contributors()
+    :return: a list with one dictionary for each nutrient
+    """
+
+    result = []
+
+    for nutrient, value in current_s.items():
+        # too much of a nutrient is reduced, too little is increased
+        if value > 0:
+            action = 'reduce'
+        elif value < 0:
+            action = 'increase'
+        else:
+            action = None
+
+        result.append({'nutrient': BY_KEY[nutrient].category, 'unit': BY_KEY[nutrient].unit, 'difference': value,
+                       'action': action, 'foods': contributors[nutrient] if action else []})
+
+    return result
+
+
+class Report:
+    """
+    The report of one user: ideal nutrients, current nutrients, excess/deficit nutrients, advice for each nutrient and,
+    when they were asked for, the minutes of every exercise and the meal plan. A record that could not be scored only
+    has an id and an error. Reports are written as JSON lines, csv rows or the sentences of the interactive program
+    """
+
+    __slots__ = ('id', 'ideal', 'current', 'status', 'advice', 'exercises', 'meal_plan', 'error')
+
+    def __init__(self, id=None, ideal: dict = None, current: dict = None, status: dict = None, advice: list = None,
+                 exercises: dict = None, meal_plan: dict = None, error: str = None):
+        """
+        :param id: id of the record
+        :param ideal: dictionary containing ideal nutrients
+        :param current: dictionary containing current nutrients consumed
+        :param status: dictionary of excess/deficit nutrients
+        :param advice: list returned by structured_advice(), with the substitutes of the dishes when they were asked for
+        :param exercises: dictionary of the minutes of every exercise needed to burn the excess calories
+        :param meal_plan: dictionary of the servings, nutrients and status of the meal plan
+        :param error: the reason the record could not be scored
+        """
+
+        self.id = id
+        self.ideal = ideal
+        self.current = current
+        self.status = status
+        self.advice = advice if advice is not None else []
+        self.exercises = exercises
+        self.meal_plan = meal_plan
+        self.error = error
+
+    @classmethod
+    def from_dict(cls, result: dict) -> 'Report':
+        """
+        :param result: a result dictionary of the batch mode
+        :return: the report of the result
+        """
+
+        return cls(result.get('id'), result.get('ideal'), result.get('current'), result.get('status'),
+                   result.get('advice'), result.get('exercises'), result.get('meal_plan'), result.get('error'))
+
+    def as_dict(self) -> dict:
+        """
+        :return: the report as a result dictionary of the batch mode, without the parts that were not asked for
+        """
+
+        if self.error is not None:
+            return {'id': self.id, 'error': self.error}
+
+        result = {'id': self.id, 'ideal': self.ideal, 'current': self.current, 'status': self.status,
+                  'advice': self.advice}
+        if self.exercises is not None:
+            result['exercises'] = self.exercises
+        if self.meal_plan is not None:
+            result['meal_plan'] = self.meal_plan
+
+        return result
+
+    def text(self) -> str:
+        """
+        :return: the report in the words of the interactive program
+        """
+
+        if self.error is not None:
+            return f'Record {self.id}: {self.error}\n\n'
+
+        parts = [] if self.id is None else [f'REPORT {self.id}\n']
+
+        for item in self.advice:
+            # the value of each dish, in the order of the names: the total of the day when the nutrient is in excess
+            # and the value per serving when it is in deficit
+            field = 'total' if item['difference'] > 0 else 'value'
+            names = ', '.join(food['name'] for food in item['foods'])
+            value = ', '.join(str(food[field]) for food in item['foods']) if names else 0
+            parts.append(nutrient_text(names, value, item['difference'], item['unit'], item['nutrient']))
+
+        # the dishes to eat in place of the ones in excess, once for each dish
+        suggested = dict()
+        for item in self.advice:
+            for food in item['foods']:
+                if food.get('substitutes') and food['label'] not in suggested:
+                    suggested[food['label']] = (food['name'], [swap['name'] for swap in food['substitutes']])
+        for name, names in suggested.values():
+            parts.append(f"Instead of {name}, you could have {' or '.join(names)}, which would \n"
+                         f'bring your day closer to the ideal amount of each nutrient.\n\n')
+
+        if self.exercises:
+            parts += [f'To burn your excess calories, you must do {name} for {int(minutes)} minutes\n'
+                      for name, minutes in self.exercises.items()]
+            parts.append('\n')
+
+        if self.meal_plan is not None:
+            parts.append('MEAL PLAN\n')
+            parts += [f'{label} ({section(label)}): {amount:g} serving(s)\n'
+                      for label, amount in self.meal_plan['servings'].items()]
+            parts.append('\n')
+
+        return ''.join(parts)
+
+    def rows(self) -> list:
+        """
+        :return: the csv rows of the report, one for each nutrient, or one row with the error
+        """
+
+        if self.error is not None:
+            return [[self.id] + [''] * (len(CSV_FIELDS) - 2) + [self.error]]
+
+        rows = []
+        for nutrient, item in zip(self.status, self.advice):
+            low = self.ideal[nutrient] if is_exact(nutrient) else self.ideal[f'min_{nutrient}']
+            high = self.ideal[nutrient] if is_exact(nutrient) else self.ideal[f'max_{nutrient}']
+            rows.append([self.id, nutrient, item['unit'], low, high, self.current[nutrient],
+                         self.status[nutrient], item['action'] or '', ';'.join(food['label'] for food in item['foods']),
+                         ';'.join(swap['label'] for food in item['foods'] for swap in food.get('substitutes', ())),
+                         ''])
+
+        return rows
+
+
+def serialize(reports: list, fmt: str = 'jsonl', header: bool = True) -> str:
+    """
+    Writes reports into one string, so that a whole chunk of reports is written to a file at once
+
+    :param reports: list of Report objects
+    :param fmt: format of the reports (jsonl, csv or text)
+    :param header: whether to start csv with the names of the columns
+    :return: the reports in the format
+    """
+
+    if fmt == 'jsonl':
+        return ''.join([json.dumps(report.as_dict()) + '\n' for report in reports])
+    if fmt == 'text':
+        return ''.join([report.text() for report in reports])
+    if fmt != 'csv':
+        raise ValueError(f'The format should be one of {", ".join(FORMATS)}')
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    if header:
+        writer.writerow(CSV_FIELDS)
+    for report in reports:
+        writer.writerows(report.rows())
+
+    return buffer.getvalue()
+
+
+def write_reports(fh, reports: list, fmt: str = 'jsonl', header: bool = True):
+    """
+    Writes reports to a file in one write
+
+    :param fh: file opened for writing text
+    :param reports: list of Report objects
+    :param fmt: format of the reports (jsonl, csv or text)
+    :param header: whether to start csv with the names of the columns
+    """
+
+    fh.write(serialize(reports, fmt, header))
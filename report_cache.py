@@ -0,0 +1,271 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+import time
+from collections import OrderedDict
+
+from catalog import FoodCatalog
+from exercise_table import ExerciseTable
+from targets import normalize_profile
+
+
+# largest total size of the reports of a cache
+MAX_BYTES = 256 << 20
+
+# the directory inside the path of the cache that holds the directory of each catalog version, so that the cache never
+# removes anything it did not create, even when its path is a directory with other files
+VERSIONS = 'haverfit-report-cache'
+
+# the file written into the directory of each catalog version, touched whenever the version is used
+MARKER = '.haverfit-report-cache'
+
+# the form of the name of the directory of a catalog version, the sha256 hash of the catalog
+VERSION_NAME = re.compile(r'[0-9a-f]{64}$')
+
+# seconds a catalog version has to go unused before another version removes it, so that processes using different
+# catalogs with the same cache do not remove each other's reports
+STALE_SECONDS = 3600
+
+# the versions of the catalogs that were already hashed, so that a catalog is only hashed again after it changed
+_versions = dict()
+
+
+def catalog_version(catalog: FoodCatalog) -> str:
+    """
+    Hashes the nutrients of a catalog and the labels, names and values of every dish, so that any change to the
+    catalog, in its file or in memory, gives another version
+
+    :param catalog: catalog of the dishes
+    :return: the hexadecimal sha256 hash of the catalog
+    """
+
+    version = _versions.get(catalog.path)
+    if version is not None and version[0] is catalog and version[1] == len(catalog):
+        return version[2]
+
+    digest = hashlib.sha256()
+    digest.update('\0'.join(catalog.nutrients).encode())
+    digest.update(b'\1')
+    digest.update('\0'.join(catalog.labels).encode())
+    digest.update(b'\1')
+    digest.update('\0'.join(catalog.names).encode())
+    for column in catalog.columns.values():
+        digest.update(memoryview(column).tobytes())
+
+    _versions[catalog.path] = (catalog, len(catalog), digest.hexdigest())
+    return digest.hexdigest()
+
+
+def table_version(table: ExerciseTable) -> str:
+    """
+    :param table: table of the exercises, or None
+    :return: the hexadecimal sha256 hash of the names and calories of the exercises, None when there is no table
+    """
+
+    if table is None:
+        return None
+
+    digest = hashlib.sha256()
+    digest.update('\0'.join(table.names).encode())
+    digest.update(table.weights.tobytes())
+    digest.update(table.burn.tobytes())
+    return digest.hexdigest()
+
+
+def report_key(record: dict, options: dict) -> str:
+    """
+    Hashes what a report depends on: the normalized profile, the consumption and the options it was calculated with.
+    Profiles written differently (in pounds or kilograms, with a different case) but equal once normalized have the
+    same key
+
+    :param record: dictionary containing the profile fields and the consumption of a user
+    :param options: dictionary of the options of the report, for example the number of dishes named in the advice
+    :return: the hexadecimal sha256 hash of the report, None when the profile is not valid
+    """
+
+    try:
+        profile = normalize_profile(record)
+        consumption = sorted((str(label), float(serving)) for label, serving in (record.get('consumption') or
+                                                                                  dict()).items())
+    except (KeyError, TypeError, ValueError, AttributeError):
+        return None
+
+    canonical = json.dumps({'profile': profile._asdict(), 'consumption': consumption, 'options': options},
+                           sort_keys=True)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+class ReportCache:
+    """
+    Stores the reports (ideal nutrients, status, advice and exercises) of the batch mode on disk, one JSON file per
+    report named by the hash of what it depends on, so that the same profile and consumption are only calculated once.
+    The reports of each catalog version are kept in their own directory, which is removed when another version is used
+    and it was not used for STALE_SECONDS. When the reports take more than max_bytes, the least recently used ones are
+    removed first. Several processes can share a cache, each one only counting the reports it saw when it opened the
+    catalog version or wrote itself
+    """
+
+    __slots__ = ('path', 'max_bytes', 'version', 'entries', 'size', 'hits', 'misses', 'lock')
+
+    def __init__(self, path: str = 'report_cache', max_bytes: int = MAX_BYTES):
+        """
+        :param path: path of the directory of the cache
+        :param max_bytes: largest total size of the reports
+        """
+
+        self.path = path
+        self.max_bytes = max_bytes
+
+        # the catalog version of the reports, and the size of each report from the least to the most recently used
+        self.version = None
+        self.entries = OrderedDict()
+        self.size = 0
+
+        # the number of reports found and not found
+        self.hits = 0
+        self.misses = 0
+
+        # the cache is used by the threads of the server at the same time
+        self.lock = threading.Lock()
+
+    def _file(self, key: str) -> str:
+        """
+        :param key: key of a report
+        :return: the path of the file of the report
+        """
+
+        return os.path.join(self.path, VERSIONS, self.version, key[:2], key + '.json')
+
+    def _remove_stale(self, version: str):
+        """
+        Removes the directories of the other catalog versions that were not used for STALE_SECONDS. Only directories
+        named like a version that contain the marker file of the cache are removed
+
+        :param version: the catalog version that is used now
+        """
+
+        now = time.time()
+        for entry in os.scandir(os.path.join(self.path, VERSIONS)):
+            if entry.name == version or not VERSION_NAME.match(entry.name) or not entry.is_dir(follow_symlinks=False):
+                continue
+
+            try:
+                if now - os.stat(os.path.join(entry.path, MARKER)).st_mtime > STALE_SECONDS:
+                    shutil.rmtree(entry.path)
+
+            # a directory without the marker was not created by the cache, and one removed meanwhile by another process
+            # is already gone
+            except FileNotFoundError:
+                pass
+
+    def use(self, catalog: FoodCatalog):
+        """
+        Switches the cache to the version of a catalog. The reports of the other versions that are no longer used are
+        removed, and the reports of this version that are already on disk are counted from the oldest to the most
+        recently used
+
+        :param catalog: catalog of the dishes
+        """
+
+        version = catalog_version(catalog)
+        if version == self.version:
+            return
+
+        with self.lock:
+            root = os.path.join(self.path, VERSIONS, version)
+            os.makedirs(root, exist_ok=True)
+
+            # the marker tells the processes that use other versions that this one is in use
+            with open(os.path.join(root, MARKER), 'a'):
+                pass
+            os.utime(os.path.join(root, MARKER))
+            self._remove_stale(version)
+
+            found = []
+            for directory in os.scandir(root):
+                if directory.is_dir():
+                    for entry in os.scandir(directory.path):
+                        if entry.name.endswith('.json'):
+                            stat = entry.stat()
+                            found.append((stat.st_mtime_ns, entry.name[:-5], stat.st_size))
+
+            self.version = version
+            self.entries = OrderedDict((key, size) for mtime, key, size in sorted(found))
+            self.size = sum(self.entries.values())
+            self._evict()
+
+    def _evict(self):
+        """
+        Removes the least recently used reports until the cache is not larger than max_bytes, called with the lock held
+        """
+
+        while self.size > self.max_bytes and self.entries:
+            old, size = self.entries.popitem(last=False)
+            self.size -= size
+            try:
+                os.remove(self._file(old))
+            except FileNotFoundError:
+                pass
+
+    def get(self, key: str) -> dict:
+        """
+        :param key: key of a report, returned by report_key()
+        :return: the report, None when it is not in the cache
+        """
+
+        try:
+            with open(self._file(key), 'rb') as fh:
+                data = fh.read()
+            report = json.loads(data)
+        except (OSError, ValueError):
+            with self.lock:
+                self.misses += 1
+            return None
+
+        # the modification time is the last use, for the other processes that open the cache
+        try:
+            os.utime(self._file(key))
+            os.utime(os.path.join(self.path, VERSIONS, self.version, MARKER))
+        except OSError:
+            pass
+
+        # a report written by another process is counted from now on
+        with self.lock:
+            self.hits += 1
+            self.size += len(data) - self.entries.pop(key, 0)
+            self.entries[key] = len(data)
+            self._evict()
+
+        return report
+
+    def put(self, key: str, report: dict):
+        """
+        Stores a report, removing the least recently used reports when the cache is full. The report is written under a
+        temporary name and then renamed, so that readers never see half of a report
+
+        :param key: key of the report, returned by report_key()
+        :param report: the report
+        """
+
+        data = json.dumps(report).encode()
+        path = self._file(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'wb') as fh:
+            fh.write(data)
+        os.replace(tmp_path, path)
+
+        # the version stays in use for the other processes as long as reports are written
+        try:
+            os.utime(os.path.join(self.path, VERSIONS, self.version, MARKER))
+        except OSError:
+            pass
+
+        with self.lock:
+            self.size += len(data) - self.entries.pop(key, 0)
+            self.entries[key] = len(data)
+            self._evict()
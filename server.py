@@ -0,0 +1,408 @@
+import argparse
+import asyncio
+import json
+import math
+import sys
+import traceback
+
+import access_file as a
+from batch import TOP, check_consumption, score_cached, score_chunk
+from catalog import FoodCatalog, load_catalog
+from catalog_watcher import CatalogWatcher
+from exercise_table import ExerciseTable, load_exercise_table
+from meal_plan import MealPlanner
+from nutrient_engine import NutrientEngine, comparing_nutrients, to_dicts
+from nutrients import ranges_of
+from report_cache import MAX_BYTES, ReportCache
+from targets import ideal_targets
+from venues import VenueCatalog
+
+
+# the reason phrases of the status codes the server answers with
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed', 413: 'Payload Too Large',
+           500: 'Internal Server Error'}
+
+# the largest request body that is accepted
+MAX_BODY = 1 << 20
+
+
+class HaverfitServer:
+    """
+    Serves the calculations behind user_interface() over HTTP with JSON bodies. The catalog and the exercise table stay
+    in memory for the whole life of the server, and identical requests that arrive while one of them is being
+    calculated share its result instead of being calculated again
+    """
+
+    __slots__ = ('catalog', 'engine', 'table', 'cache', 'venues', 'routes', 'inflight', 'planners')
+
+    def __init__(self, catalog: FoodCatalog, table: ExerciseTable = None, cache: ReportCache = None,
+                 venues: VenueCatalog = None):
+        """
+        :param catalog: catalog of the dishes, the view of no shard when venues are given
+        :param table: table of the exercises, the /exercises endpoint answers 404 when not given
+        :param cache: cache of the reports of /advice, every request is calculated when not given
+        :param venues: catalog of the venues, whose shards are read only when a consumption refers to them
+        """
+
+        self.catalog = catalog
+        self.engine = NutrientEngine(catalog)
+        self.venues = venues
+        self.table = table
+        self.cache = cache
+        self.routes = {'/targets': self.targets, '/nutrients': self.nutrients, '/status': self.status,
+                       '/advice': self.advice, '/exercises': self.exercises, '/search': self.search,
+                       '/plan': self.plan}
+
+        # the calculations that are running, by endpoint and canonical request body
+        self.inflight = dict()
+
+        # the meal planners of the catalog, by sections and step
+        self.planners = dict()
+
+    def _engine(self, body: dict) -> NutrientEngine:
+        """
+        :param body: a dictionary with the consumption of the user
+        :return: the nutrient engine of the catalog, or of the view of the shards of the venues that the consumption
+                 refers to
+        """
+
+        if self.venues is None:
+            return self.engine
+
+        consumption = body.get('consumption')
+        return self.venues.engine(self.venues.shards_of(consumption if isinstance(consumption, dict) else ()))
+
+    def targets(self, body: dict) -> dict:
+        """
+        :param body: a profile (age, sex, activity_level, system, height, weight)
+        :return: the ideal nutrients of the profile
+        """
+
+        return ideal_targets(body, self.catalog.nutrients)
+
+    def nutrients(self, body: dict) -> dict:
+        """
+        :param body: a dictionary with the consumption of the user
+        :return: the nutrients of the consumption
+        """
+
+        catalog = self._engine(body).catalog
+        return a.calculating_nutrients(check_consumption(body['consumption'], catalog), catalog)
+
+    def status(self, body: dict) -> dict:
+        """
+        :param body: a profile with the consumption of the user
+        :return: the ideal nutrients, the current nutrients and the excess/deficit nutrients
+        """
+
+        catalog = self._engine(body).catalog
+        consumption = check_consumption(body['consumption'], catalog)
+        ideal_n = ideal_targets(body, catalog.nutrients)
+        current_n = a.calculating_nutrients(consumption, catalog)
+        return {'ideal': ideal_n, 'current': current_n, 'status': a.comparing_nutrients(ideal_n, current_n)}
+
+    def advice(self, body: dict) -> dict:
+        """
+        :param body: a profile with the consumption of the user, and optionally the number of dishes to name (top) and
+                     to suggest in place of each dish in excess (substitutes)
+        :return: the same result as one record of the batch mode
+        """
+
+        # the consumption is checked by the batch mode, which gives an error result when it is not valid
+        top, swaps = int(body.get('top', TOP)), int(body.get('substitutes', 0))
+        if self.cache is not None:
+            result = score_cached([body], self._engine(body), self.cache, top, self.table, swaps)[0]
+        else:
+            result = score_chunk([body], self._engine(body), top, self.table, swaps)[0]
+        if 'error' in result:
+            raise ValueError(result['error'])
+
+        return result
+
+    def plan(self, body: dict) -> dict:
+        """
+        :param body: a profile, and optionally the first letters of the sections to choose the dishes from (sections)
+                     and whether half servings are allowed (half_servings)
+        :return: the servings of the meal plan, its nutrients and its excess/deficit nutrients
+        """
+
+        # the dishes of the plan are chosen from every venue
+        engine = self.engine if self.venues is None else self.venues.engine(tuple(self.venues.shards))
+        catalog = engine.catalog
+        key = (str(body.get('sections') or ''), 0.5 if body.get('half_servings') else 1.0)
+
+        # a planner is built once for each options and catalog
+        planner = self.planners.get(key)
+        if planner is None or planner.catalog is not catalog:
+            planner = self.planners[key] = MealPlanner(catalog, key[0], key[1], matrix=engine.matrix)
+
+        lower, upper = ranges_of(ideal_targets(body, catalog.nutrients))
+        servings, totals = planner.plan(lower, upper)
+
+        return {'servings': servings[0], 'nutrients': to_dicts(totals, catalog.nutrients)[0],
+                'status': to_dicts(comparing_nutrients(lower, upper, totals), catalog.nutrients)[0]}
+
+    def search(self, body: dict) -> list:
+        """
+        :param body: a dictionary with the name of a dish (query) and optionally the number of results (k)
+        :return: the dishes whose name best matches the query
+        """
+
+        catalog = self.catalog if self.venues is None else self.venues.merged()
+        return catalog.search(str(body['query']), int(body.get('k', 10)))
+
+    def exercises(self, body: dict) -> dict:
+        """
+        :param body: a dictionary with the excess calories (cal) and the body weight in pounds (weight)
+        :return: the minutes of every exercise needed to burn the calories
+        """
+
+        if self.table is None:
+            raise LookupError('no exercise table is loaded')
+
+        cal = float(body['cal'])
+        weight = float(body['weight'])
+        if not (math.isfinite(cal) and math.isfinite(weight)) or cal < 0 or weight <= 0:
+            raise ValueError('cal should be a finite number that is not negative and weight a finite positive number')
+
+        return dict(zip(self.table.names, self.table.minutes(cal, weight)[0].tolist()))
+
+    async def calculate(self, path: str, body: dict) -> dict:
+        """
+        Runs the calculation of an endpoint in a thread, sharing it with identical requests that arrive meanwhile
+
+        :param path: path of the endpoint
+        :param body: the request body
+        :return: the result of the calculation
+        """
+
+        key = (path, json.dumps(body, sort_keys=True))
+        future = self.inflight.get(key)
+
+        if future is None:
+            future = asyncio.get_running_loop().run_in_executor(None, self.routes[path], body)
+            self.inflight[key] = future
+            future.add_done_callback(lambda _: self.inflight.pop(key, None))
+
+        return await asyncio.shield(future)
+
+    async def respond(self, method: str, path: str, data: bytes) -> tuple:
+        """
+        Answers one request
+
+        :param method: HTTP method of the request
+        :param path: path of the request
+        :param data: body of the request
+        :return: a tuple of the status code and the JSON response
+        """
+
+        if path == '/health':
+            return 200, {'status': 'ok', 'dishes': len(self.catalog if self.venues is None else self.venues)}
+        if path not in self.routes:
+            return 404, {'error': f'unknown endpoint {path}'}
+        if method != 'POST':
+            return 405, {'error': 'use POST with a JSON body'}
+
+        try:
+            body = json.loads(data or b'{}')
+            if not isinstance(body, dict):
+                raise ValueError('the body should be a JSON object')
+            return 200, await self.calculate(path, body)
+
+        except LookupError as error:
+            return (404 if path == '/exercises' else 400), {'error': str(error) or repr(error)}
+        except (TypeError, ValueError, AssertionError) as error:
+            return 400, {'error': str(error) or repr(error)}
+
+        # any other error is a bug of the server, which is logged while the connection is still answered
+        except Exception as error:
+            print(f'Error while answering {path}:', file=sys.stderr)
+            traceback.print_exc()
+            return 500, {'error': f'internal error ({type(error).__name__})'}
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """
+        Reads HTTP/1.1 requests from one connection and answers them until the client closes it
+
+        :param reader: stream of the connection
+        :param writer: stream of the connection
+        """
+
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+
+                method, path, version = request_line.decode('latin-1').split()
+
+                # reads the headers until the empty line
+                headers = dict()
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                length = int(headers.get('content-length', 0))
+                if length > MAX_BODY:
+                    code, result = 413, {'error': 'the request body is too large'}
+                    keep_alive = False
+                else:
+                    data = await reader.readexactly(length)
+                    code, result = await self.respond(method, path.split('?')[0], data)
+                    keep_alive = headers.get('connection', '').lower() != 'close' and version == 'HTTP/1.1'
+
+                payload = json.dumps(result).encode()
+                writer.write(f'HTTP/1.1 {code} {REASONS[code]}\r\nContent-Type: application/json\r\n'
+                             f'Content-Length: {len(payload)}\r\n'
+                             f'Connection: {"keep-alive" if keep_alive else "close"}\r\n\r\n'.encode() + payload)
+                await writer.drain()
+
+                if not keep_alive:
+                    break
+
+        except (ValueError, asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def watch(self, watcher: CatalogWatcher, interval: float):
+        """
+        Polls the csv file of the catalog in a thread and swaps in the new catalog and its engine when it changed. The
+        requests that already took the previous catalog finish with it
+
+        :param watcher: watcher of the csv file of the catalog
+        :param interval: seconds between two polls
+        """
+
+        loop = asyncio.get_running_loop()
+
+        while True:
+            await asyncio.sleep(interval)
+
+            if await loop.run_in_executor(None, watcher.poll):
+                catalog = watcher.current
+                engine = await loop.run_in_executor(None, NutrientEngine, catalog)
+                self.catalog, self.engine = catalog, engine
+                print(f'Reloaded {watcher.path} with {len(catalog)} dishes', file=sys.stderr)
+            elif watcher.error is not None:
+                print(f'Could not reload {watcher.path}: {watcher.error}', file=sys.stderr)
+
+    async def serve(self, host: str = '127.0.0.1', port: int = 8080) -> asyncio.AbstractServer:
+        """
+        Starts listening for connections
+
+        :param host: address to listen on
+        :param port: port to listen on, 0 for any free port
+        :return: the running asyncio server
+        """
+
+        return await asyncio.start_server(self.handle, host, port)
+
+
+async def fetch(host: str, port: int, path: str, body: dict = None) -> tuple:
+    """
+    Small client that sends one request to a running server, for example from tests or scripts
+
+    :param host: address of the server
+    :param port: port of the server
+    :param path: path of the endpoint
+    :param body: JSON body, the request is a GET when not given
+    :return: a tuple of the status code and the JSON response
+    """
+
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        payload = json.dumps(body).encode() if body is not None else b''
+        method = 'POST' if body is not None else 'GET'
+        writer.write(f'{method} {path} HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\n'
+                     f'Content-Length: {len(payload)}\r\nConnection: close\r\n\r\n'.encode() + payload)
+        await writer.drain()
+
+        code = int((await reader.readline()).split()[1])
+        length = 0
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            if name.strip().lower() == 'content-length':
+                length = int(value)
+
+        return code, json.loads(await reader.readexactly(length))
+    finally:
+        writer.close()
+
+
+def main(argv: list = None) -> int:
+    """
+    Command line entry point of the service mode
+
+    :param argv: command line arguments, sys.argv is used when not given
+    :return: exit status
+    """
+
+    parser = argparse.ArgumentParser(prog='haverfit serve', description='Serves the Haverfit calculations over HTTP.')
+    parser.add_argument('--host', default='127.0.0.1', help='address to listen on (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=8080, help='port to listen on (default: 8080)')
+    parser.add_argument('--catalog', default='food_nutrition.csv', help='csv file of the dishes')
+    parser.add_argument('--manifest', help='manifest of the venues, whose shards are served instead of the catalog and '
+                                           'read when a food label (Example: dc:B1) first refers to them')
+    parser.add_argument('--exercises', default='exercises.csv', help='csv file of the exercises')
+    parser.add_argument('--reload', type=float, default=2.0, metavar='SECONDS',
+                        help='seconds between checks of the csv file of the dishes for changes, 0 to never reload '
+                             '(default: 2)')
+    parser.add_argument('--cache', help='directory of the cache of the reports of /advice')
+    parser.add_argument('--cache-size', type=int, default=MAX_BYTES >> 20, help='largest size of the cache in MB '
+                                                                                 f'(default: {MAX_BYTES >> 20})')
+    args = parser.parse_args(argv)
+
+    # the cache keeps the reports of a single catalog, and the views of the venues change with each consumption
+    if args.manifest and args.cache:
+        parser.error('--manifest cannot be used with --cache')
+
+    try:
+        venues = VenueCatalog(args.manifest) if args.manifest else None
+        watcher = CatalogWatcher(args.catalog) if args.reload > 0 and venues is None else None
+        if venues is not None:
+            catalog = venues.view(())
+        else:
+            catalog = watcher.current if watcher is not None else load_catalog(args.catalog)
+    except FileNotFoundError as error:
+        print(f'The file {error.filename} does not exist', file=sys.stderr)
+        return 1
+    except ValueError as error:
+        print(error, file=sys.stderr)
+        return 1
+
+    try:
+        table = load_exercise_table(args.exercises)
+    except FileNotFoundError:
+        print(f'The file {args.exercises} does not exist, /exercises is disabled', file=sys.stderr)
+        table = None
+
+    async def run():
+        cache = ReportCache(args.cache, args.cache_size << 20) if args.cache else None
+        haverfit = HaverfitServer(catalog, table, cache, venues)
+        server = await haverfit.serve(args.host, args.port)
+        print(f'Serving Haverfit on http://{args.host}:{args.port}', file=sys.stderr)
+
+        # the catalog is polled for as long as the server runs
+        async with server:
+            if watcher is not None:
+                await asyncio.gather(server.serve_forever(), haverfit.watch(watcher, args.reload))
+            else:
+                await server.serve_forever()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
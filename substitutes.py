@@ -0,0 +1,262 @@
+import heapq
+
+import numpy as np
+
+from catalog import FoodCatalog
+from nutrient_engine import NutrientEngine
+
+
+# catalogs up to this size are searched by comparing every dish at once instead of walking a tree
+BRUTE_FORCE_SIZE = 4096
+
+# largest number of dishes in a leaf of the tree
+LEAF_SIZE = 32
+
+# largest number of distances calculated at once by the brute force search
+BLOCK_SIZE = 1 << 22
+
+# number of dishes suggested in place of each dish
+SUBSTITUTES = 3
+
+
+class SubstitutionIndex:
+    """
+    Finds the dishes whose nutrients per serving are closest to a target, to suggest swaps for the dishes named in the
+    advice. Each nutrient is divided by its standard deviation over the catalog so that calories do not outweigh the
+    grams of the other nutrients. Small catalogs are searched by brute force with NumPy, and larger ones with a k-d tree
+    whose nodes store the bounding box of their dishes, so that most of the catalog is never looked at
+    """
+
+    __slots__ = ('catalog', 'values', 'scale', 'points', 'order', 'starts', 'ends', 'lefts', 'rights', 'lows',
+                 'highs')
+
+    def __init__(self, catalog: FoodCatalog, matrix: np.ndarray = None, leaf_size: int = LEAF_SIZE):
+        """
+        :param catalog: catalog of the dishes
+        :param matrix: nutrient matrix of the catalog if it was already built, for example by a NutrientEngine
+        :param leaf_size: largest number of dishes in a leaf of the tree
+        """
+
+        self.catalog = catalog
+        self.values = NutrientEngine(catalog).matrix if matrix is None else matrix
+
+        # nutrients that are the same in every dish are not scaled
+        self.scale = self.values.std(axis=0) if len(self.values) else np.ones(len(catalog.nutrients))
+        self.scale[self.scale == 0] = 1.0
+        self.points = self.values / self.scale
+
+        self.order = None
+        if len(self.points) > BRUTE_FORCE_SIZE:
+            self._build(leaf_size)
+
+    def _build(self, leaf_size: int):
+        """
+        Builds the k-d tree. Each node splits its dishes at the median of the nutrient with the widest range, and the
+        dishes are reordered so that every node holds a contiguous block of them
+
+        :param leaf_size: largest number of dishes in a leaf
+        """
+
+        order = np.arange(len(self.points))
+        starts, ends, lefts, rights, lows, highs = [], [], [], [], [], []
+
+        def new_node(start: int, end: int) -> int:
+            box = self.points[order[start:end]]
+            starts.append(start)
+            ends.append(end)
+            lefts.append(-1)
+            rights.append(-1)
+            lows.append(tuple(box.min(axis=0).tolist()))
+            highs.append(tuple(box.max(axis=0).tolist()))
+            return len(starts) - 1
+
+        stack = [new_node(0, len(order))]
+        while stack:
+            node = stack.pop()
+            start, end = starts[node], ends[node]
+            spread = np.subtract(highs[node], lows[node])
+
+            # small nodes and nodes of identical dishes are leaves
+            if end - start <= leaf_size or not spread.any():
+                continue
+
+            dim = int(spread.argmax())
+            middle = (start + end) // 2
+            block = order[start:end]
+            order[start:end] = block[np.argpartition(self.points[block, dim], middle - start)]
+
+            lefts[node] = new_node(start, middle)
+            rights[node] = new_node(middle, end)
+            stack += [lefts[node], rights[node]]
+
+        self.order = order
+        self.points = self.points[order]
+        self.starts, self.ends, self.lefts, self.rights, self.lows, self.highs = starts, ends, lefts, rights, lows, \
+            highs
+
+    def swap_targets(self, rows, servings, status) -> np.ndarray:
+        """
+        Calculates the nutrients per serving a dish would need to have to remove the excess/deficit of the day if it
+        replaced every serving of a consumed dish
+
+        :param rows: row of each consumed dish
+        :param servings: servings of each consumed dish
+        :param status: the excess/deficit of every nutrient of the user of each dish, one row per dish
+        :return: the target nutrients of each dish, one row per dish
+        """
+
+        servings = np.asarray(servings, dtype=np.float64).reshape(-1, 1)
+        return np.maximum(self.values[np.asarray(rows, dtype=np.int64)] - np.asarray(status) / servings, 0)
+
+    def nearest(self, targets: np.ndarray, k: int = SUBSTITUTES, exclude: list = None) -> list:
+        """
+        Finds the k dishes closest to each target
+
+        :param targets: nutrients per serving of each target, one row per target
+        :param k: number of dishes to find for each target
+        :param exclude: set of rows that should not be found for each target, for example the consumed dishes
+        :return: a list with the (row, distance) tuples of each target, from the closest dish
+        """
+
+        targets = np.asarray(targets, dtype=np.float64).reshape(-1, len(self.catalog.nutrients)) / self.scale
+        exclude = exclude if exclude is not None else [()] * len(targets)
+
+        if k <= 0:
+            return [[] for _ in targets]
+        if self.order is None:
+            return self._brute_force(targets, k, exclude)
+
+        return [self._search(target, k, excluded) for target, excluded in zip(targets.tolist(), exclude)]
+
+    def _brute_force(self, targets: np.ndarray, k: int, exclude: list) -> list:
+        """
+        Compares every target with every dish, a block of targets at a time
+
+        :param targets: scaled targets
+        :param k: number of dishes to find for each target
+        :param exclude: set of rows that should not be found for each target
+        :return: a list with the (row, distance) tuples of each target, from the closest dish
+        """
+
+        found = []
+        block = max(1, BLOCK_SIZE // max(len(self.points), 1))
+
+        for start in range(0, len(targets), block):
+            distances = ((targets[start:start + block, None, :] - self.points[None, :, :]) ** 2).sum(axis=2)
+
+            for row_distances, excluded in zip(distances, exclude[start:start + block]):
+                if excluded:
+                    row_distances[list(excluded)] = np.inf
+
+                size = min(k, int(np.isfinite(row_distances).sum()))
+                rows = np.argpartition(row_distances, size - 1)[:size] if size > 0 else np.empty(0, dtype=np.int64)
+                rows = rows[np.argsort(row_distances[rows], kind='stable')]
+                found.append(list(zip(rows.tolist(), np.sqrt(row_distances[rows]).tolist())))
+
+        return found
+
+    def _search(self, target: list, k: int, exclude) -> list:
+        """
+        Walks the tree from the nodes whose bounding box is closest to the target, and stops when no box can hold a
+        dish closer than the k dishes found so far
+
+        :param target: scaled target
+        :param k: number of dishes to find
+        :param exclude: rows that should not be found
+        :return: a list of (row, distance) tuples, from the closest dish
+        """
+
+        # the k closest dishes so far, as a heap of negative squared distances
+        best = []
+        nodes = [(0.0, 0)]
+
+        while nodes:
+            box_distance, node = heapq.heappop(nodes)
+            if len(best) == k and box_distance >= -best[0][0]:
+                break
+
+            if self.lefts[node] < 0:
+                start, end = self.starts[node], self.ends[node]
+                distances = ((self.points[start:end] - target) ** 2).sum(axis=1)
+
+                for distance, row in zip(distances.tolist(), self.order[start:end].tolist()):
+                    if row in exclude:
+                        continue
+                    if len(best) < k:
+                        heapq.heappush(best, (-distance, row))
+                    elif distance < -best[0][0]:
+                        heapq.heapreplace(best, (-distance, row))
+                continue
+
+            for child in (self.lefts[node], self.rights[node]):
+                # the squared distance from the target to the bounding box of the child
+                distance = 0.0
+                for x, low, high in zip(target, self.lows[child], self.highs[child]):
+                    if x < low:
+                        distance += (low - x) ** 2
+                    elif x > high:
+                        distance += (x - high) ** 2
+
+                if len(best) < k or distance < -best[0][0]:
+                    heapq.heappush(nodes, (distance, child))
+
+        return [(row, (-distance) ** 0.5) for distance, row in sorted(best, reverse=True)]
+
+    def describe(self, row: int, distance: float) -> dict:
+        """
+        :param row: row of a dish
+        :param distance: distance of the dish from its target
+        :return: a dictionary with the label, the name, the nutrients per serving and the distance of the dish
+        """
+
+        result = {'label': self.catalog.labels[row], 'name': self.catalog.names[row]}
+        result.update(zip(self.catalog.nutrients, self.values[row].tolist()))
+        result['distance'] = distance
+
+        return result
+
+    def substitutes(self, labels: list, consumption: dict, current_s: dict, k: int = SUBSTITUTES) -> dict:
+        """
+        Suggests dishes to eat in place of consumed dishes, closest to the nutrients that would remove the excess/
+        deficit of the day. Dishes that are already consumed are never suggested
+
+        :param labels: food labels of the consumed dishes to replace
+        :param consumption: dictionary containing food labels and serving amount
+        :param current_s: dictionary containing excess/deficit nutrients of current diet
+        :param k: number of dishes to suggest for each dish
+        :return: a dictionary with the list of suggested dishes, as returned by describe(), for each label
+        """
+
+        index = self.catalog.index
+        labels = [label for label in labels if label in index]
+        if not labels:
+            return dict()
+
+        status = np.tile([current_s[nutrient] for nutrient in self.catalog.nutrients], (len(labels), 1))
+        targets = self.swap_targets([index[label] for label in labels], [consumption[label] for label in labels],
+                                    status)
+        consumed = {index[label] for label in consumption if label in index}
+        found = self.nearest(targets, k, [consumed] * len(labels))
+
+        return {label: [self.describe(row, distance) for row, distance in rows] for label, rows in zip(labels, found)}
+
+
+# indexes that have already been built, so that a catalog is only indexed again after dishes are added to it
+_indexes = dict()
+
+
+def load_substitution_index(catalog: FoodCatalog, matrix: np.ndarray = None) -> SubstitutionIndex:
+    """
+    Returns the shared substitution index of a catalog, building it again when the catalog changed
+
+    :param catalog: catalog of the dishes
+    :param matrix: nutrient matrix of the catalog if it was already built, for example by a NutrientEngine
+    :return: the index of the catalog
+    """
+
+    index = _indexes.get(catalog.path)
+    if index is None or index.catalog is not catalog or len(index.values) != len(catalog):
+        index = _indexes[catalog.path] = SubstitutionIndex(catalog, matrix if matrix is not None and
+                                                           len(matrix) == len(catalog) else None)
+
+    return index
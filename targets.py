@@ -0,0 +1,143 @@
+import math
+from collections import namedtuple
+from functools import lru_cache
+
+from nutrients import DEFAULT_NUTRIENTS, ideal_nutrients
+
+
+# dictionary containing multiplier value for each activity level
+ACTIVITY_MULTIPLIER = {'1': 1.2, '2': 1.375, '3': 1.55, '4': 1.725, '5': 1.9}
+
+# accepted spellings of the unit system, converted into the answers used by user_information_and_cal()
+SYSTEMS = {'1': '1', 'imperial': '1', '2': '2', 'metric': '2'}
+
+# the conversion factors implied by the imperial formula of the BMR (4.536 = 10 * 0.4536 and 15.88 = 6.25 * 2.5408),
+# so that a profile converted into the metric system gets exactly the BMR of the imperial formula
+KG_PER_POUND = 0.4536
+CM_PER_INCH = 2.5408
+
+# the profile of a user after its answers were checked and converted into the metric system (cms and kgs)
+Profile = namedtuple('Profile', ['age', 'sex', 'activity_level', 'height', 'weight'])
+
+# number of different profiles whose targets are remembered
+CACHE_SIZE = 65536
+
+
+def normalize_profile(record: dict) -> Profile:
+    """
+    Checks the profile fields of a record the same way user_information_and_cal() checks the answers of the user, and
+    converts the height and weight into the metric system
+
+    :param record: dictionary containing age, sex, activity_level, system, height and weight
+    :return: the normalized profile
+    """
+
+    age = int(record['age'])
+    sex = str(record['sex']).lower()
+    activity_level = str(record['activity_level'])
+    system = SYSTEMS.get(str(record['system']).lower())
+    height = float(record['height'])
+    weight = float(record['weight'])
+
+    if age <= 0 or not (math.isfinite(height) and height > 0) or not (math.isfinite(weight) and weight > 0):
+        raise ValueError('age, height and weight should be positive numbers')
+    if sex != 'male' and sex != 'female':
+        raise ValueError(f'biological sex should be either male or female, not {sex}')
+    if activity_level not in ACTIVITY_MULTIPLIER:
+        raise ValueError(f'activity level should be one of 1,2,3,4,5, not {activity_level}')
+    if system is None:
+        raise ValueError(f"system should be 1 (imperial) or 2 (metric), not {record['system']}")
+
+    # converts inches and pounds into cms and kgs
+    if system == '1':
+        height = height * CM_PER_INCH
+        weight = weight * KG_PER_POUND
+
+    return Profile(age, sex, activity_level, height, weight)
+
+
+def calculating_bmr(profile: Profile) -> float:
+    """
+    Calculates the BMR (Basal Metabolic Rate) of a profile with the Mifflin-St Jeor equation
+
+    :param profile: normalized profile
+    :return: the BMR of the profile
+    """
+
+    bmr = (10 * profile.weight) + (6.25 * profile.height) - (5 * profile.age)
+
+    if profile.sex == 'male':
+        return bmr + 5
+    else:
+        return bmr - 161
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def ideal_cal(profile: Profile) -> float:
+    """
+    Calculates the amount of calorie a profile should ideally consume in a day. The results are remembered, so a
+    profile that was seen before is answered without calculating again
+
+    :param profile: normalized profile
+    :return: ideal calorie to be consumed daily
+    """
+
+    bmr = calculating_bmr(profile)
+    if bmr <= 0:
+        raise ValueError(f'BMR was calculated to be less than 0 for age {profile.age}, height {profile.height:.1f} cms '
+                         f'and weight {profile.weight:.1f} kgs')
+
+    return bmr * ACTIVITY_MULTIPLIER[profile.activity_level]
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _targets(profile: Profile, nutrients: tuple) -> tuple:
+    """
+    Remembers the ideal nutrients of a profile as a tuple, so that the cached value cannot be changed by a caller
+
+    :param profile: normalized profile
+    :param nutrients: keys of the nutrients
+    :return: a tuple of the items of the ideal nutrients
+    """
+
+    # the range of each nutrient, like in calculating_ideal_nutrients()
+    return tuple(ideal_nutrients(ideal_cal(profile), nutrients).items())
+
+
+def ideal_targets(profile, nutrients: tuple = DEFAULT_NUTRIENTS) -> dict:
+    """
+    Returns the ideal nutrients of a profile without asking for any input. The profile is normalized first, so the
+    same person entered in the imperial or the metric system shares one cache entry
+
+    :param profile: a normalized profile or a dictionary containing age, sex, activity_level, system, height and weight
+    :param nutrients: keys of the nutrients, the nutrients of the catalog
+    :return: a dictionary containing ideal nutrition to be consumed daily, like calculating_ideal_nutrients()
+    """
+
+    if not isinstance(profile, Profile):
+        profile = normalize_profile(profile)
+
+    return dict(_targets(profile, tuple(nutrients)))
+
+
+def ideal_cal_array(profiles: list) -> 'np.ndarray':
+    """
+    Vectorized version of ideal_cal() for many profiles at once
+
+    :param profiles: list of normalized profiles
+    :return: array of the ideal calorie of each profile, NaN for the profiles whose BMR is not positive
+    """
+
+    # numpy is only imported when it is first needed, so that the interactive program starts without it
+    import numpy as np
+
+    if len(profiles) == 0:
+        return np.empty(0)
+
+    ages, sexes, activity_levels, heights, weights = zip(*profiles)
+
+    bmr = (10 * np.array(weights)) + (6.25 * np.array(heights)) - (5 * np.array(ages, dtype=np.float64))
+    bmr += np.where(np.array(sexes) == 'male', 5, -161)
+
+    multiplier = np.array([ACTIVITY_MULTIPLIER[level] for level in activity_levels])
+    return np.where(bmr > 0, bmr * multiplier, np.nan)
@@ -0,0 +1,74 @@
+import datetime
+import random
+
+import pytest
+
+from catalog import FoodCatalog
+from consumption_log import WINDOWS, ConsumptionLog
+from nutrients import DEFAULT_NUTRIENTS
+
+
+# the dishes of the small catalog of the tests
+LABELS = ['B1', 'B2', 'L1', 'D1', 'U1']
+
+
+def small_catalog() -> FoodCatalog:
+    """
+    :return: a catalog of a few dishes with values that are not round, so that rounding errors would show
+    """
+
+    rng = random.Random(7)
+    columns = [[rng.uniform(0, 500) for _ in LABELS] for _ in DEFAULT_NUTRIENTS]
+    return FoodCatalog.from_columns('food_nutrition.csv', LABELS, [f'Dish {label}' for label in LABELS],
+                                    DEFAULT_NUTRIENTS, columns)
+
+
+def assert_windows(log: ConsumptionLog, user: str, day: int):
+    """
+    Checks that each rolling window of a user ending on a day adds up to the entries of the log in that window
+
+    :param log: the consumption log
+    :param user: name of the user
+    :param day: the last day of the windows
+    """
+
+    date = datetime.date.fromordinal(day)
+    for window, days in WINDOWS.items():
+        totals, count = log.window(user, window, date)
+        expected, expected_count = log.history(user, datetime.date.fromordinal(day - days + 1), date)
+
+        assert count == expected_count, (user, window, date)
+        assert totals == pytest.approx(expected, rel=1e-9, abs=1e-6), (user, window, date)
+
+
+def test_rolling_totals_match_history(tmp_path):
+    rng = random.Random(1)
+    log = ConsumptionLog(str(tmp_path / 'log'), small_catalog())
+    users = ['ana', 'bo', 'cy']
+    day = datetime.date(2024, 1, 1).toordinal()
+
+    for _ in range(300):
+        # mostly the same or the next days, sometimes a long gap, and sometimes an entry for an earlier day
+        day += rng.choice([0, 0, 1, 1, 2, 3, 8, 31])
+        entry_day = day - rng.choice([0, 0, 0, 1, 5, 40])
+        user = rng.choice(users)
+        consumption = {label: rng.choice([0.5, 1, 1.5, 2, 3]) for label in rng.sample(LABELS, rng.randint(1, 3))}
+
+        log.append(user, consumption, datetime.date.fromordinal(entry_day))
+        assert_windows(log, user, day)
+        assert_windows(log, user, day + rng.randint(1, 35))
+
+    # the totals built when the log is opened again are the same
+    reopened = ConsumptionLog(log.path, log.catalog)
+    for user in users:
+        for later in (0, 1, 6, 29, 30):
+            assert_windows(reopened, user, day + later)
+
+
+def test_unknown_user_has_empty_windows(tmp_path):
+    log = ConsumptionLog(str(tmp_path / 'log'), small_catalog())
+    log.append('ana', {'B1': 1}, '2024-01-01')
+
+    totals, count = log.window('bo', 'week', '2024-01-01')
+    assert count == 0
+    assert totals == dict.fromkeys(DEFAULT_NUTRIENTS, 0.0)
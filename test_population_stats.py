@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+
+from population_stats import MAX_VALUE, MIN_VALUE, QUANTILES, RELATIVE_ACCURACY, PopulationStats, QuantileSketch
+
+
+# the quantiles checked, with the extremes where the buckets are the sparsest
+QS = (0.0, 0.001, 0.01, 0.05, 0.25, 0.5, 0.75, 0.95, 0.99, 0.999, 1.0)
+
+
+def sample(seed: int, size: int = 20000) -> np.ndarray:
+    """
+    :param seed: seed of the random values
+    :param size: number of values
+    :return: positive and negative values spread over many orders of magnitude, all between MIN_VALUE and MAX_VALUE
+    """
+
+    rng = np.random.default_rng(seed)
+    magnitudes = np.clip(rng.lognormal(2, 3, size), MIN_VALUE, MAX_VALUE)
+    return np.where(rng.random(size) < 0.3, -magnitudes, magnitudes)
+
+
+def assert_within_accuracy(estimates: list, values: np.ndarray, accuracy: float):
+    """
+    Checks quantiles estimated by a sketch against the exact quantiles of the values. The sketch returns the value of
+    rank q * (count - 1) rounded down, which is numpy's 'lower' quantile
+
+    :param estimates: the estimated value of each quantile of QS
+    :param values: every value added to the sketch
+    :param accuracy: largest relative error of the estimates
+    """
+
+    exact = np.quantile(values, QS, method='lower')
+    for q, estimate, value in zip(QS, estimates, exact):
+        assert abs(estimate - value) <= accuracy * abs(value) * (1 + 1e-9), (q, estimate, value)
+
+
+@pytest.mark.parametrize('accuracy', [RELATIVE_ACCURACY, 0.05])
+def test_quantiles_within_relative_accuracy(accuracy):
+    values = sample(1)
+    sketch = QuantileSketch(accuracy)
+    sketch.add(values)
+
+    assert sketch.count == len(values)
+    assert_within_accuracy(sketch.quantiles(QS), values, accuracy)
+
+
+def test_merged_shards_match_one_sketch():
+    shards = [sample(seed, 5000) for seed in range(4)]
+    whole = QuantileSketch()
+    whole.add(np.concatenate(shards))
+
+    merged = QuantileSketch()
+    for shard in shards:
+        sketch = QuantileSketch()
+        sketch.add(shard)
+        merged.merge(QuantileSketch.from_dict(sketch.as_dict()))
+
+    assert merged.quantiles(QS) == whole.quantiles(QS)
+    assert_within_accuracy(merged.quantiles(QS), np.concatenate(shards), RELATIVE_ACCURACY)
+
+
+def test_summary_quantiles_of_the_status():
+    values = sample(2, 3000)
+    stats = PopulationStats()
+    stats.add_results([{'status': {'cal': value}} for value in values.tolist()] + [{'error': 'no profile'}])
+
+    summary = stats.summary()
+    assert summary['users'] == len(values)
+    assert summary['errors'] == 1
+
+    estimates = list(summary['nutrients']['cal']['quantiles'].values())
+    exact = np.quantile(values, QUANTILES, method='lower')
+    assert np.all(np.abs(np.array(estimates) - exact) <= RELATIVE_ACCURACY * np.abs(exact) * (1 + 1e-9))
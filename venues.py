@@ -0,0 +1,349 @@
+import argparse
+import json
+import os
+import re
+import sys
+from array import array
+from collections import OrderedDict
+
+import numpy as np
+
+import contributors
+import nutrient_engine
+import substitutes
+from catalog import FoodCatalog, load_catalog
+from catalog_file import read_csv
+from nutrient_engine import NutrientEngine, catalog_matrix
+from nutrients import nutrient_keys
+
+
+# file name of the manifest of the venues, kept in the directory of the shards
+MANIFEST = 'manifest.json'
+MANIFEST_VERSION = 1
+
+# the form of the name of a venue, which cannot contain the characters that separate labels, servings and venues
+VENUE_NAME = re.compile(r'[a-z0-9_]+$')
+
+# the character between the venue and the food label of a dish, like dc:B1
+SEPARATOR = ':'
+
+# number of views (sets of shards) kept with their nutrient engines, the least recently used ones are dropped first
+MAX_VIEWS = 64
+
+
+def namespaced(venue: str, label: str) -> str:
+    """
+    :param venue: name of the venue
+    :param label: food label of a dish in the shard of the venue
+    :return: the label of the dish across every venue, like dc:B1
+    """
+
+    return f'{venue}{SEPARATOR}{label}'
+
+
+def shard_key(label: str) -> str:
+    """
+    :param label: label of a dish across every venue, like dc:B1
+    :return: the key of the shard of the dish, its venue and the first letter of its section like dc:B, None when the
+             label has no venue
+    """
+
+    venue, separator, food_label = label.partition(SEPARATOR)
+    if not separator or not venue or not food_label:
+        return None
+
+    return f'{venue}{SEPARATOR}{food_label[:1].upper()}'
+
+
+class VenueView(FoodCatalog):
+    """
+    Read-only catalog of the dishes of some shards of the venues, with the labels of the dishes namespaced by their
+    venue. It has every nutrient that all of its shards have. Dishes are added to the csv file of their shard instead
+    """
+
+    __slots__ = ('shards',)
+
+    def append(self, label: str, name: str, values: list):
+        raise TypeError(f'{self.path} is a read-only view of several shards, add the dish to the csv file of its shard')
+
+
+class VenueCatalog:
+    """
+    The dishes of several dining halls and cafés, split into one csv file per venue and meal section (the shards) and
+    described by a small manifest. A shard is only read the first time a label of its venue and section is asked for,
+    so scoring a breakfast log of one venue does not read the menus of the other venues and meals. The shards a
+    consumption refers to are merged into a read-only view that the rest of the program uses like any other catalog
+    """
+
+    __slots__ = ('path', 'directory', 'shards', 'views')
+
+    def __init__(self, path: str = os.path.join('venues', MANIFEST)):
+        """
+        Reads the manifest, without reading any shard
+
+        :param path: path of the manifest
+        """
+
+        self.path = path
+        self.directory = os.path.dirname(path)
+
+        manifest = read_manifest(path)
+
+        # the path, the number of dishes and the nutrients of each shard, in the order of the manifest
+        self.shards = {key: (os.path.join(self.directory, shard['path']), shard['rows'], tuple(shard['nutrients']))
+                       for key, shard in manifest['shards'].items()}
+
+        # the shards, their number of dishes, the view and its nutrient engine (None until it is asked for) of the
+        # views that were already built, by the keys of their shards, from the least to the most recently used
+        self.views = OrderedDict()
+
+    def __len__(self) -> int:
+        return sum(rows for path, rows, nutrients in self.shards.values())
+
+    def shard(self, key: str) -> FoodCatalog:
+        """
+        Returns the catalog of a shard, reading it only the first time it is asked for
+
+        :param key: key of the shard, like dc:B
+        :return: the catalog of the shard, with the food labels of its csv file
+        """
+
+        return load_catalog(self.shards[key][0])
+
+    def shards_of(self, labels) -> tuple:
+        """
+        :param labels: labels of dishes across every venue, like the food labels of a consumption
+        :return: the keys of the shards of the labels, in the order of the manifest. Labels without a venue or of an
+                 unknown venue or section are skipped
+        """
+
+        keys = {shard_key(label) for label in labels}
+        return tuple(key for key in self.shards if key in keys)
+
+    def nutrients(self, keys: tuple) -> tuple:
+        """
+        :param keys: keys of the shards, every shard when empty
+        :return: the nutrients that every one of the shards has, in the order of the first shard
+        """
+
+        columns = [self.shards[key][2] for key in keys or self.shards]
+        if not columns:
+            return ()
+
+        return tuple(nutrient for nutrient in columns[0] if all(nutrient in other for other in columns[1:]))
+
+    def view(self, keys: tuple) -> VenueView:
+        """
+        Returns the read-only catalog of some shards, reading the shards that were not read yet. A view is built once
+        for each set of shards, and again after dishes were added to one of them. Only the MAX_VIEWS most recently used
+        views are kept
+
+        :param keys: keys of the shards, in the order of the manifest as returned by shards_of()
+        :return: the view of the shards
+        """
+
+        keys = tuple(keys)
+        shards = tuple(self.shard(key) for key in keys)
+
+        view = self.views.get(keys)
+        if view is not None and all(old is new for old, new in zip(view[0], shards)) and \
+                view[1] == tuple(map(len, shards)):
+            self.views.move_to_end(keys)
+            return view[2]
+
+        nutrients = self.nutrients(keys)
+        labels = []
+        names = []
+        values = [array('d') for _ in nutrients]
+
+        for key, shard in zip(keys, shards):
+            venue = key.partition(SEPARATOR)[0]
+            labels += [namespaced(venue, label) for label in shard.labels]
+            names += shard.names
+            for column, nutrient in zip(values, nutrients):
+                column.frombytes(memoryview(shard.columns[nutrient]).tobytes())
+
+        catalog = VenueView.from_columns(f'{self.path}#{"+".join(keys)}', labels, names, nutrients, values)
+        catalog.shards = keys
+
+        self.views[keys] = [shards, tuple(map(len, shards)), catalog, None]
+        self.views.move_to_end(keys)
+
+        # the view that was used the longest time ago is dropped, with what the other modules keep for it
+        if len(self.views) > MAX_VIEWS:
+            forget(self.views.popitem(last=False)[1][2].path)
+
+        return catalog
+
+    def merged(self) -> VenueView:
+        """
+        :return: the read-only catalog of every shard of every venue, which reads all of them
+        """
+
+        return self.view(tuple(self.shards))
+
+    def engine(self, keys: tuple) -> NutrientEngine:
+        """
+        :param keys: keys of the shards, in the order of the manifest as returned by shards_of()
+        :return: the nutrient engine of the view of the shards, built once for each view from the nutrient matrices of
+                 its shards, which every view of the shard shares
+        """
+
+        catalog = self.view(keys)
+        view = self.views[tuple(keys)]
+        if view[3] is None:
+            matrices = [catalog_matrix(shard)[:, [shard.nutrients.index(nutrient) for nutrient in catalog.nutrients]]
+                        for shard in view[0]]
+            # in the same memory order as a matrix built from the view, so that the sums are added in the same order
+            matrix = np.ascontiguousarray(np.vstack(matrices)) if matrices else np.empty((0, len(catalog.nutrients)))
+            view[3] = NutrientEngine(catalog, matrix)
+
+        return view[3]
+
+
+def forget(path: str):
+    """
+    Drops the nutrient matrix, the ranks and the substitution index that were kept for a view that is no longer used
+
+    :param path: path of the view
+    """
+
+    nutrient_engine._matrices.pop(path, None)
+    contributors._ranks.pop(path, None)
+    substitutes._indexes.pop(path, None)
+
+
+def read_manifest(path: str) -> dict:
+    """
+    Reads and checks the manifest of the venues
+
+    :param path: path of the manifest
+    :return: the manifest, with the path relative to the manifest, the number of dishes and the nutrients of each shard
+    """
+
+    with open(path, 'r') as fh:
+        try:
+            manifest = json.load(fh)
+        except ValueError as error:
+            raise ValueError(f'{path}: the manifest is not valid JSON ({error})')
+
+    if not isinstance(manifest, dict) or manifest.get('version') != MANIFEST_VERSION:
+        raise ValueError(f'{path}: expected a manifest of version {MANIFEST_VERSION}')
+
+    shards = manifest.get('shards')
+    if not isinstance(shards, dict):
+        raise ValueError(f'{path}: the manifest has no shards')
+    for key, shard in shards.items():
+        if shard_key(key + '1') != key or not isinstance(shard, dict) or \
+                not {'path', 'rows', 'nutrients'} <= set(shard):
+            raise ValueError(f'{path}: the shard {key!r} should be named like venue:B and have a path, rows and '
+                             f'nutrients')
+
+    return manifest
+
+
+def write_manifest(path: str, manifest: dict):
+    """
+    Writes the manifest of the venues under a temporary name first, so that a reader never sees half of it
+
+    :param path: path of the manifest
+    :param manifest: the manifest
+    """
+
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w') as fh:
+        json.dump(manifest, fh, indent=1)
+        fh.write('\n')
+
+    os.replace(tmp_path, path)
+
+
+def split_catalog(path: str, venue: str, directory: str = 'venues') -> dict:
+    """
+    Splits the csv file of the dishes of a venue into one csv file per meal section (the first letter of the food
+    labels) and adds them to the manifest of the directory, replacing the shards the venue had before
+
+    :param path: path of the csv file of the dishes of the venue
+    :param venue: name of the venue, made of lowercase letters, digits and underscores
+    :param directory: directory of the shards and of the manifest
+    :return: the number of dishes of each new shard
+    """
+
+    if not VENUE_NAME.match(venue):
+        raise ValueError(f'the name of the venue {venue!r} should only contain lowercase letters, digits and '
+                         f'underscores')
+
+    # the whole file is checked before anything is written
+    header = read_csv(path, 'food')[0]
+    nutrients = nutrient_keys(header[2:], path)
+
+    # the lines of the dishes of each section, in the order of the file
+    sections = dict()
+    with open(path, 'r') as fh:
+        header_line = fh.readline()
+        for line in fh:
+            if line.strip():
+                sections.setdefault(line.lstrip()[:1].upper(), []).append(line if line.endswith('\n') else line + '\n')
+
+    os.makedirs(os.path.join(directory, venue), exist_ok=True)
+    manifest_path = os.path.join(directory, MANIFEST)
+    try:
+        manifest = read_manifest(manifest_path)
+    except FileNotFoundError:
+        manifest = {'version': MANIFEST_VERSION, 'shards': dict()}
+
+    shards = {key: shard for key, shard in manifest['shards'].items() if key.partition(SEPARATOR)[0] != venue}
+    rows = dict()
+
+    for letter, lines in sections.items():
+        shard_path = os.path.join(venue, f'{letter}.csv')
+        tmp_path = os.path.join(directory, f'{shard_path}.{os.getpid()}.tmp')
+        with open(tmp_path, 'w') as fh:
+            fh.write(header_line)
+            fh.writelines(lines)
+        os.replace(tmp_path, os.path.join(directory, shard_path))
+
+        key = f'{venue}{SEPARATOR}{letter}'
+        shards[key] = {'path': shard_path, 'rows': len(lines), 'nutrients': list(nutrients)}
+        rows[key] = len(lines)
+
+    manifest['shards'] = shards
+    write_manifest(manifest_path, manifest)
+
+    return rows
+
+
+def main(argv: list = None) -> int:
+    """
+    Command line entry point that splits the csv file of a venue into shards
+
+    :param argv: command line arguments, sys.argv is used when not given
+    :return: exit status
+    """
+
+    parser = argparse.ArgumentParser(prog='haverfit venues', description='Splits the dishes of a venue into one csv '
+                                                                         'file per meal section and adds them to the '
+                                                                         'manifest of the venues.')
+    parser.add_argument('csv', help='csv file of the dishes of the venue')
+    parser.add_argument('--venue', required=True, help='name of the venue (Example: dc)')
+    parser.add_argument('-d', '--directory', default='venues', help='directory of the shards and of the manifest '
+                                                                    '(default: venues)')
+    args = parser.parse_args(argv)
+
+    try:
+        rows = split_catalog(args.csv, args.venue, args.directory)
+    except FileNotFoundError:
+        print(f'The file {args.csv} does not exist', file=sys.stderr)
+        return 1
+    except ValueError as error:
+        print(error, file=sys.stderr)
+        return 1
+
+    for key, count in rows.items():
+        print(f'{key}: {count} dishes')
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())